@@ -0,0 +1,155 @@
+"""
+Circuit breakers for upstream LLM calls (one per model + endpoint)
+"""
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, Tuple
+
+from openai import APIConnectionError, APIStatusError
+
+from .latency import DeadlineExceeded
+from .ratelimit import RateLimitQueueTimeout
+from .logs import get_logger
+
+log = get_logger("breaker")
+
+# -------- Config --------
+BREAKER_ENABLED = os.getenv("HEAL_BREAKER", "1") != "0"
+# Trip when at least BREAKER_MIN_CALLS of the last BREAKER_WINDOW calls were
+# recorded and BREAKER_FAILURE_RATE of them failed or were slow
+BREAKER_WINDOW = int(os.getenv("HEAL_BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("HEAL_BREAKER_MIN_CALLS", "5"))
+BREAKER_FAILURE_RATE = float(os.getenv("HEAL_BREAKER_FAILURE_RATE", "0.5"))
+# A successful call slower than this still counts against the circuit
+BREAKER_SLOW_CALL_S = float(os.getenv("HEAL_BREAKER_SLOW_CALL", "15"))
+# How long an open circuit fails fast before letting a probe through
+BREAKER_OPEN_S = float(os.getenv("HEAL_BREAKER_OPEN", "30"))
+BREAKER_HALF_OPEN_PROBES = int(os.getenv("HEAL_BREAKER_PROBES", "1"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class CircuitOpen(Exception):
+    """The upstream circuit for this model + endpoint is open; the call was not attempted"""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} circuit open, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def is_upstream_failure(e: BaseException) -> bool:
+    """Errors that say the provider is unhealthy (not that our request was bad)"""
+    if isinstance(e, (APIConnectionError, RateLimitQueueTimeout)):
+        return True
+    if isinstance(e, APIStatusError):
+        return e.status_code == 429 or e.status_code >= 500
+    return False
+
+
+class CircuitBreaker:
+    """
+    closed → open when the recent failure (or slow-call) rate trips;
+    open → half_open after BREAKER_OPEN_S, admitting a few probe calls;
+    half_open → closed on a healthy probe, back to open on a failed one.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        self._outcomes: Deque[bool] = deque(maxlen=BREAKER_WINDOW)
+        self._opened_at = 0.0
+        self._probes = 0
+        self.rejected = 0
+        self.trips = 0
+
+    def _transition(self, state: str) -> None:
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+            self.trips += 1
+        if state != self.state:
+            log.warning("circuit state change", extra={"circuit": self.name, "from_state": self.state, "to_state": state})
+        self.state = state
+        self._outcomes.clear()
+        self._probes = 0
+
+    def allow(self) -> bool:
+        """Admit a call (counts it as a probe when half-open)"""
+        if self.state == OPEN:
+            if time.monotonic() - self._opened_at < BREAKER_OPEN_S:
+                return False
+            self._transition(HALF_OPEN)
+        if self.state == HALF_OPEN:
+            if self._probes >= BREAKER_HALF_OPEN_PROBES:
+                return False
+            self._probes += 1
+        return True
+
+    def retry_after(self) -> float:
+        return max(1.0, BREAKER_OPEN_S - (time.monotonic() - self._opened_at))
+
+    def record(self, healthy: bool) -> None:
+        if self.state == HALF_OPEN:
+            self._transition(CLOSED if healthy else OPEN)
+            return
+        self._outcomes.append(healthy)
+        failures = self._outcomes.count(False)
+        if (
+            self.state == CLOSED
+            and len(self._outcomes) >= BREAKER_MIN_CALLS
+            and failures / len(self._outcomes) >= BREAKER_FAILURE_RATE
+        ):
+            self._transition(OPEN)
+
+    def release_probe(self) -> None:
+        """A probe ended without a verdict (cancelled, or the caller's own deadline)"""
+        if self.state == HALF_OPEN and self._probes > 0:
+            self._probes -= 1
+
+    @asynccontextmanager
+    async def guard(self) -> AsyncIterator[None]:
+        """Wrap one logical upstream call (including its retries)"""
+        if not BREAKER_ENABLED:
+            yield
+            return
+        if not self.allow():
+            self.rejected += 1
+            raise CircuitOpen(self.name, self.retry_after())
+        started = time.monotonic()
+        try:
+            yield
+        except BaseException as e:
+            if is_upstream_failure(e):
+                self.record(False)
+            elif isinstance(e, DeadlineExceeded) and time.monotonic() - started >= BREAKER_SLOW_CALL_S:
+                self.record(False)
+            else:
+                # Client errors, short client deadlines and cancellations say
+                # nothing about provider health
+                self.release_probe()
+            raise
+        self.record(time.monotonic() - started < BREAKER_SLOW_CALL_S)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "recent_calls": len(self._outcomes),
+            "recent_failures": self._outcomes.count(False),
+            "trips": self.trips,
+            "rejected": self.rejected,
+        }
+
+
+_breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+
+
+def breaker_for(model: str, endpoint: str) -> CircuitBreaker:
+    breaker = _breakers.get((model, endpoint))
+    if breaker is None:
+        breaker = _breakers[(model, endpoint)] = CircuitBreaker(f"{model}/{endpoint}")
+    return breaker
+
+
+def breaker_stats() -> Dict[str, Any]:
+    return {breaker.name: breaker.stats() for breaker in _breakers.values()}
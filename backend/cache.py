@@ -0,0 +1,278 @@
+"""
+In-process caches for LLM results (LRU + TTL, perceptual-hash lookup,
+nearest-neighbour lookup over quantized feature vectors, single-flight
+coalescing of identical in-flight calls)
+"""
+import copy
+import json
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Sequence, Tuple, TypeVar
+
+import numpy as np
+
+T = TypeVar("T")
+# Sentinel for "not cached", so a cached falsy value still counts as a hit
+_MISSING = object()
+
+
+def canonical_key(**parts: Any) -> str:
+    """
+    Stable hash of JSON-serializable parts: keys are sorted at every level
+    and whitespace is fixed, so dict ordering never splits cache entries.
+    """
+    blob = json.dumps(parts, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class TTLCache:
+    """
+    Size-bounded LRU cache whose entries also expire after `ttl` seconds.
+    Not thread-safe; it is only touched from the event loop.
+    """
+
+    def __init__(self, maxsize: int = 512, ttl: float = 3600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self._removed(key)
+            self.expirations += 1
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return copy.deepcopy(value)
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        if self.maxsize <= 0:
+            return
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires_at, copy.deepcopy(value))
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            evicted, _ = self._data.popitem(last=False)
+            self._removed(evicted)
+            self.evictions += 1
+
+    def _removed(self, key: Hashable) -> None:
+        """Called when an entry is evicted or expires; for subclasses that index keys elsewhere"""
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl_s": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class PerceptualCache(TTLCache):
+    """
+    TTLCache keyed by 64-bit perceptual image hashes. A lookup that misses the
+    exact hash falls back to the closest stored hash within `max_distance`
+    differing bits, so re-shot or re-uploaded photos of the same plate hit.
+    """
+
+    def __init__(self, maxsize: int = 512, ttl: float = 86400.0, max_distance: int = 4):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.max_distance = max_distance
+        self.near_hits = 0
+
+    def get(self, key: int, default: Any = None) -> Any:
+        near = False
+        entry = self._data.get(key)
+        if (entry is None or entry[0] < time.monotonic()) and self.max_distance > 0:
+            nearest = self._nearest(key)
+            if nearest is not None:
+                near = nearest != key
+                key = nearest
+        value = super().get(key, _MISSING)
+        if value is _MISSING:
+            return default
+        if near:
+            self.near_hits += 1
+        return value
+
+    def _nearest(self, key: int) -> Optional[int]:
+        # A linear popcount scan over a few hundred ints takes microseconds;
+        # expired entries are skipped so they can't shadow a live neighbour
+        now = time.monotonic()
+        best, best_distance = None, self.max_distance + 1
+        for stored, (expires_at, _) in self._data.items():
+            if expires_at < now:
+                continue
+            distance = (stored ^ key).bit_count()
+            if distance < best_distance:
+                best, best_distance = stored, distance
+        return best
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats["near_hits"] = self.near_hits
+        stats["max_distance"] = self.max_distance
+        return stats
+
+
+class SimilarityCache(TTLCache):
+    """
+    TTLCache keyed by (group, quantized vector). Inputs quantize to integer
+    buckets; a lookup that misses the exact bucket falls back to the nearest
+    stored vector of the same group within `tolerance` buckets on every axis
+    (Chebyshev distance), so inputs a few grams apart share one result.
+    """
+
+    def __init__(self, maxsize: int = 512, ttl: float = 3600.0, tolerance: int = 1):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.tolerance = tolerance
+        # group -> stored vectors, in insertion order (kept in step with _data by _removed)
+        self._groups: Dict[Hashable, Dict[Tuple[int, ...], None]] = {}
+        self.near_hits = 0
+        self.rejected = 0
+        self._distance_total = 0
+
+    @staticmethod
+    def quantize(values: Sequence[float], buckets: Sequence[float]) -> Tuple[int, ...]:
+        """Bucket index per value (rounded, so a bucket is centred on its multiples)"""
+        return tuple(np.rint(np.asarray(values, dtype=np.float64) / np.asarray(buckets, dtype=np.float64)).astype(int).tolist())
+
+    def nearest(self, group: Hashable, vector: Tuple[int, ...]) -> Optional[Tuple[Tuple[int, ...], int]]:
+        """Closest stored vector of `group` within tolerance, with its distance"""
+        stored = self._groups.get(group)
+        if not stored:
+            return None
+        # Expired entries stay until touched; they must not shadow a live neighbour
+        now = time.monotonic()
+        candidates = [v for v in stored if self._data[(group, v)][0] >= now]
+        if not candidates:
+            return None
+        if vector in stored and self._data[(group, vector)][0] >= now:
+            return vector, 0
+        # A group holds a handful of vectors; one array pass over all of them
+        distances = np.abs(np.array(candidates) - np.array(vector)).max(axis=1)
+        best = int(distances.argmin())
+        if distances[best] > self.tolerance:
+            return None
+        return candidates[best], int(distances[best])
+
+    def lookup(self, group: Hashable, vector: Tuple[int, ...]) -> Tuple[Any, int]:
+        """(value, distance in buckets) of the nearest entry, or (None, -1) on a miss"""
+        match = self.nearest(group, vector)
+        if match is None:
+            self.misses += 1
+            return None, -1
+        key, distance = match
+        value = super().get((group, key))
+        if value is None:
+            return None, -1
+        if distance:
+            self.near_hits += 1
+        self._distance_total += distance
+        return value, distance
+
+    def store(self, group: Hashable, vector: Tuple[int, ...], value: Any, ttl: Optional[float] = None) -> None:
+        if self.maxsize <= 0:
+            return
+        # Index first: set() may evict this very entry's neighbours through _removed
+        self._groups.setdefault(group, {})[vector] = None
+        self.set((group, vector), value, ttl=ttl)
+
+    def _removed(self, key: Hashable) -> None:
+        group, vector = key
+        stored = self._groups.get(group)
+        if stored is not None:
+            stored.pop(vector, None)
+            if not stored:
+                del self._groups[group]
+
+    def reject(self, distance: int) -> None:
+        """The caller found a hit (at `distance`) unusable after all, e.g. it drifted; count it as a miss"""
+        self.hits -= 1
+        self.misses += 1
+        self.rejected += 1
+        if distance:
+            self.near_hits -= 1
+
+    def clear(self) -> None:
+        super().clear()
+        self._groups.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats["reuse_rate"] = stats.pop("hit_rate")
+        stats["near_hits"] = self.near_hits
+        stats["rejected"] = self.rejected
+        stats["tolerance"] = self.tolerance
+        stats["groups"] = len(self._groups)
+        # Over every match found, rejected ones included
+        matches = self.hits + self.rejected
+        stats["mean_distance"] = round(self._distance_total / matches, 3) if matches else 0.0
+        return stats
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key: the first caller starts the
+    upstream call, later callers await the same result (or exception).
+    The call runs as its own task, so one caller disconnecting does not
+    cancel it for the others.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, "asyncio.Future[Any]"] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            # Followers get their own copy so callers can't mutate each other's result
+            return copy.deepcopy(await asyncio.shield(task))
+
+        task = asyncio.ensure_future(fn())
+        self._inflight[key] = task
+        self.calls += 1
+
+        def _done(t: "asyncio.Future[Any]") -> None:
+            self._inflight.pop(key, None)
+            if not t.cancelled():
+                t.exception()  # mark retrieved when nobody is left waiting
+
+        task.add_done_callback(_done)
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._inflight),
+            "upstream_calls": self.calls,
+            "upstream_calls_saved": self.coalesced,
+        }
@@ -0,0 +1,81 @@
+"""
+Confidence-driven model cascade for photo estimates: a fast pass (smaller
+model, low detail) answers on its own unless its result crosses one of the
+escalation thresholds, in which case the full high-detail call runs
+"""
+import os
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from .metrics import estimate_tier_seconds, estimate_escalations
+
+# -------- Config --------
+CASCADE_ENABLED = os.getenv("HEAL_ESTIMATE_CASCADE", "0") != "0"
+# Image detail for the fast pass; the full pass keeps the preprocessed image's detail
+CASCADE_FAST_DETAIL = os.getenv("HEAL_CASCADE_FAST_DETAIL", "low")
+# Escalate when any item is less confident than this...
+CASCADE_MIN_CONFIDENCE = float(os.getenv("HEAL_CASCADE_MIN_CONFIDENCE", "0.7"))
+# ...when the plate has more items than this (busy plates need the detail)...
+CASCADE_MAX_ITEMS = int(os.getenv("HEAL_CASCADE_MAX_ITEMS", "3"))
+# ...or when the model raised more warnings than this
+CASCADE_MAX_WARNINGS = int(os.getenv("HEAL_CASCADE_MAX_WARNINGS", "0"))
+
+FAST, FULL = "fast", "full"
+
+
+def escalation_reasons(result: Optional[Dict[str, Any]]) -> List[str]:
+    """Why a fast-pass estimate isn't good enough to serve (empty = accept it)"""
+    if not result:
+        return ["no_result"]
+    items = result.get("items") or []
+    reasons = []
+    if not items:
+        reasons.append("no_items")
+    if any(float(item.get("confidence") or 0) < CASCADE_MIN_CONFIDENCE for item in items):
+        reasons.append("low_confidence")
+    if len(items) > CASCADE_MAX_ITEMS:
+        reasons.append("too_many_items")
+    if len(result.get("warnings") or []) > CASCADE_MAX_WARNINGS:
+        reasons.append("warnings")
+    return reasons
+
+
+class CascadeStats:
+    """Which tier answered, why estimates escalated, and what each path cost in time"""
+
+    def __init__(self):
+        self.answered = {FAST: 0, FULL: 0}
+        self.seconds = {FAST: 0.0, FULL: 0.0}
+        self.reasons: Dict[str, int] = {}
+
+    def record(self, tier: str, started: float, reasons: Sequence[str] = ()) -> None:
+        elapsed = time.perf_counter() - started
+        self.answered[tier] += 1
+        self.seconds[tier] += elapsed
+        estimate_tier_seconds.observe(elapsed, tier=tier)
+        for reason in reasons:
+            self.reasons[reason] = self.reasons.get(reason, 0) + 1
+            estimate_escalations.inc(reason=reason)
+
+    def stats(self) -> Dict[str, Any]:
+        total = sum(self.answered.values())
+        return {
+            "enabled": CASCADE_ENABLED,
+            "thresholds": {
+                "min_confidence": CASCADE_MIN_CONFIDENCE,
+                "max_items": CASCADE_MAX_ITEMS,
+                "max_warnings": CASCADE_MAX_WARNINGS,
+                "fast_detail": CASCADE_FAST_DETAIL,
+            },
+            "answered": dict(self.answered),
+            "escalation_rate": round(self.answered[FULL] / total, 4) if total else 0.0,
+            "escalation_reasons": dict(self.reasons),
+            # Escalated requests include the fast pass they waited for
+            "mean_ms": {
+                tier: round(self.seconds[tier] / n * 1000, 1) if n else 0.0
+                for tier, n in self.answered.items()
+            },
+        }
+
+
+cascade_stats = CascadeStats()
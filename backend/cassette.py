@@ -0,0 +1,230 @@
+"""
+Record/replay of LLM traffic ("cassettes"). Record mode saves every
+successful upstream response, keyed by a canonical hash of the request;
+replay mode serves them back without network, so benchmarks of the
+server-side path don't depend on upstream variance.
+"""
+import os
+import json
+import gzip
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional
+
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from .cache import canonical_key
+from .providers import Provider, _FakeRawResponse, _FakeStream
+from .logs import get_logger
+
+log = get_logger("cassette")
+
+# -------- Config --------
+CASSETTE_MODE = os.getenv("HEAL_CASSETTE_MODE", "off")  # off | record | replay
+CASSETTE_PATH = os.getenv("HEAL_CASSETTE_PATH", "bench/cassettes/llm.jsonl.gz")
+# `recorded` replays each response after its recorded latency; a number is a fixed latency (0 = instant)
+CASSETTE_LATENCY = os.getenv("HEAL_CASSETTE_LATENCY", "recorded")
+# What replay does for an unrecorded request: `error` or `upstream` (call the real provider)
+CASSETTE_ON_MISS = os.getenv("HEAL_CASSETTE_ON_MISS", "error")
+
+# Request fields that don't change the answer
+_UNKEYED = ("timeout",)
+# Response headers worth keeping (they drive the rate limiter)
+_KEPT_HEADERS = ("x-ratelimit-", "retry-after")
+
+
+class CassetteMiss(LookupError):
+    """Replay mode found no recorded response for a request"""
+
+
+def _without_images(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    blanked = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            content = [
+                {"type": "image_url", "image_url": {"detail": part["image_url"].get("detail")}}
+                if part.get("type") == "image_url" else part
+                for part in content
+            ]
+        blanked.append({**message, "content": content})
+    return blanked
+
+
+def request_keys(model: str, kwargs: Mapping[str, Any]) -> Dict[str, str]:
+    """
+    `exact` hashes the whole request; `loose` leaves out image bytes, which
+    differ with the JPEG encoder build, so a cassette replays across machines
+    """
+    parts = {k: v for k, v in kwargs.items() if k not in _UNKEYED}
+    exact = canonical_key(model=model, **parts)
+    if "messages" in parts:
+        parts["messages"] = _without_images(parts["messages"])
+    return {"exact": exact, "loose": canonical_key(model=model, **parts)}
+
+
+class CassetteStore:
+    """Recorded responses in a gzip'd JSON-lines file, appended to as they arrive"""
+
+    def __init__(self, path: str = CASSETTE_PATH):
+        self.path = path
+        self._exact: Dict[str, Dict[str, Any]] = {}
+        self._loose: Dict[str, Dict[str, Any]] = {}
+        self.hits = 0
+        self.loose_hits = 0
+        self.misses = 0
+        self.recorded = 0
+        # Appends run in worker threads; one at a time keeps gzip members whole
+        self._write_lock = asyncio.Lock()
+        if os.path.exists(path):
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self._index(json.loads(line))
+        log.info("cassette loaded", extra={"path": path, "entries": len(self._exact)})
+
+    def _index(self, entry: Dict[str, Any]) -> None:
+        # Later recordings of the same request win
+        self._exact[entry["key"]] = entry
+        self._loose[entry["loose_key"]] = entry
+
+    def get(self, keys: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        entry = self._exact.get(keys["exact"])
+        if entry is not None:
+            self.hits += 1
+            return entry
+        entry = self._loose.get(keys["loose"])
+        if entry is not None:
+            self.loose_hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    async def add(self, entry: Dict[str, Any]) -> None:
+        """Index `entry` now; append it to the file off the event loop"""
+        self._index(entry)
+        self.recorded += 1
+        async with self._write_lock:
+            await asyncio.to_thread(self._append, entry)
+
+    def _append(self, entry: Dict[str, Any]) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # One gzip member per entry; readers see the members as one stream
+        with gzip.open(self.path, "at", encoding="utf-8") as f:
+            f.write(json.dumps(entry, separators=(",", ":"), ensure_ascii=False) + "\n")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "entries": len(self._exact),
+            "hits": self.hits,
+            "loose_hits": self.loose_hits,
+            "misses": self.misses,
+            "recorded": self.recorded,
+        }
+
+
+class _RecordingStream:
+    """Pass chunks through; once the stream is fully read, hand them to `on_complete`"""
+
+    def __init__(self, stream: Any, on_complete: Callable[[List[Dict[str, Any]], float], Awaitable[None]]):
+        self._stream = stream
+        self._on_complete = on_complete
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        started = time.perf_counter()
+        chunks = []
+        async for chunk in self._stream:
+            chunks.append(chunk.model_dump(mode="json", exclude_unset=True))
+            yield chunk
+        await self._on_complete(chunks, time.perf_counter() - started)
+
+    async def close(self) -> None:
+        await self._stream.close()
+
+
+class CassetteProvider(Provider):
+    """Wraps a provider to record its responses, or to replay them in its place"""
+
+    def __init__(self, inner: Provider, store: CassetteStore, mode: str):
+        self.inner = inner
+        self.store = store
+        self.mode = mode
+        self.name = inner.name
+        # Replayed calls never reach a metered upstream
+        self.rate_limited = inner.rate_limited and mode == "record"
+
+    def _latency(self, recorded: float) -> float:
+        return recorded if CASSETTE_LATENCY == "recorded" else float(CASSETTE_LATENCY)
+
+    async def create(self, model: str, **kwargs: Any) -> Any:
+        keys = request_keys(model, kwargs)
+        if self.mode == "replay":
+            entry = self.store.get(keys)
+            if entry is not None:
+                return await self._replay(entry)
+            if CASSETTE_ON_MISS != "upstream":
+                raise CassetteMiss(f"No recorded response for this {model} request in {self.store.path} (key {keys['exact'][:12]})")
+            return await self.inner.create(model, **kwargs)
+        return await self._record(model, keys, kwargs)
+
+    async def _replay(self, entry: Dict[str, Any]) -> Any:
+        await asyncio.sleep(self._latency(entry["latency_s"]))
+        if entry["stream"]:
+            chunks = [ChatCompletionChunk.model_validate(c) for c in entry["chunks"]]
+            delay = entry["stream_s"] / max(1, len(chunks)) if CASSETTE_LATENCY == "recorded" else 0.0
+            return _FakeRawResponse(_FakeStream(chunks, delay), entry["headers"])
+        return _FakeRawResponse(ChatCompletion.model_validate(entry["response"]), entry["headers"])
+
+    async def _record(self, model: str, keys: Dict[str, str], kwargs: Mapping[str, Any]) -> Any:
+        started = time.perf_counter()
+        raw = await self.inner.create(model, **kwargs)
+        entry: Dict[str, Any] = {
+            "key": keys["exact"],
+            "loose_key": keys["loose"],
+            "model": model,
+            "schema": (kwargs.get("response_format") or {}).get("json_schema", {}).get("name"),
+            "recorded_at": round(time.time(), 3),
+            "latency_s": round(time.perf_counter() - started, 4),
+            "headers": {k: v for k, v in raw.headers.items() if k.lower().startswith(_KEPT_HEADERS)},
+            "stream": bool(kwargs.get("stream")),
+        }
+        parsed = raw.parse()
+        if not entry["stream"]:
+            entry["response"] = parsed.model_dump(mode="json", exclude_unset=True)
+            await self.store.add(entry)
+            return raw
+
+        async def save(chunks: List[Dict[str, Any]], stream_s: float) -> None:
+            await self.store.add({**entry, "chunks": chunks, "stream_s": round(stream_s, 4)})
+
+        return _FakeRawResponse(_RecordingStream(parsed, save), raw.headers)
+
+    async def warm_up(self) -> int:
+        return await self.inner.warm_up() if self.mode == "record" else 0
+
+    def pool_stats(self) -> Dict[str, Any]:
+        return {**self.inner.pool_stats(), "cassette": {"mode": self.mode, **self.store.stats()}}
+
+    async def close(self) -> None:
+        await self.inner.close()
+
+
+_store: Optional[CassetteStore] = None
+
+
+def with_cassette(provider: Provider) -> Provider:
+    """`provider` unchanged, or wrapped for record/replay per HEAL_CASSETTE_MODE"""
+    global _store
+    if CASSETTE_MODE == "off":
+        return provider
+    if CASSETTE_MODE not in ("record", "replay"):
+        raise ValueError(f"Unknown HEAL_CASSETTE_MODE {CASSETTE_MODE!r} (expected off, record or replay)")
+    if _store is None:
+        _store = CassetteStore()
+    return CassetteProvider(provider, _store, CASSETTE_MODE)
@@ -0,0 +1,232 @@
+"""
+Reminder copy bank - pre-generated notification templates filled locally
+"""
+import os
+import re
+import time
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .logs import get_logger
+
+log = get_logger("copybank")
+
+# -------- Config --------
+COPY_BANK_REFRESH_S = float(os.getenv("HEAL_COPY_BANK_REFRESH", "21600"))
+COPY_BANK_MODEL_INFO = "heal-copy-bank-v1"
+# Locales the bank generates templates for; anything else is served as its
+# language (zh-CN -> zh) if listed, else as "en". Every key is regenerated by
+# the refresh loop, so free-form client strings must never become keys.
+COPY_LOCALES = tuple(
+    l.strip().lower() for l in os.getenv("HEAL_COPY_LOCALES", "en,zh,zh-tw,es,fr,de,ja,ko,pt,it").split(",") if l.strip()
+)
+# Hard cap on (type, locale, tone) keys; past it, new keys fall back to "en"
+COPY_BANK_MAX_KEYS = int(os.getenv("HEAL_COPY_BANK_MAX_KEYS", "128"))
+# After a failed generation, a key waits this long before the next attempt
+COPY_BANK_RETRY_S = float(os.getenv("HEAL_COPY_BANK_RETRY", "300"))
+
+# Placeholders a template may use; anything else is dropped at refresh time
+PLACEHOLDERS = (
+    "meal_name",
+    "user_name",
+    "meals_per_day",
+    "protein_excess_g",
+    "carb_excess_g",
+    "fat_excess_g",
+    "kcal_excess",
+)
+PLACEHOLDER_DEFAULTS = {"meal_name": "your meal", "user_name": "there"}
+_PLACEHOLDER_RE = re.compile(r"\{(\w+)\}")
+
+# Built-in English variants so the bank can serve before (or without) any LLM call
+SEED_LINES = {
+    "photo_reminder": [
+        "Time for {meal_name}! Snap a quick photo before you dig in.",
+        "Hi {user_name}, don't forget to photograph your {meal_name}.",
+        "A photo of your {meal_name} keeps today's targets on track.",
+        "Quick snap of {meal_name}? It takes two seconds.",
+        "Log your {meal_name} with a photo to see how it fits today.",
+    ],
+    "over_limit": [
+        "Heads up: {meal_name} is {carb_excess_g} g over your carb target.",
+        "{meal_name} ran {protein_excess_g} g over on protein. Go lighter next meal.",
+        "{meal_name} is {fat_excess_g} g over your fat target.",
+        "Today's {meal_name} went {kcal_excess} kcal over. A walk helps!",
+        "{meal_name} went over a target. Balance it out at your next meal.",
+    ],
+}
+TONES = ("friendly", "coach", "neutral", "playful")
+
+BankKey = Tuple[str, str, str]
+
+
+def normalize_locale(locale: Optional[str]) -> str:
+    """Client locale onto COPY_LOCALES: exact tag, else its language, else en"""
+    tag = (locale or "").strip().lower().replace("_", "-")
+    if tag in COPY_LOCALES:
+        return tag
+    language = tag.split("-", 1)[0]
+    return language if language in COPY_LOCALES else "en"
+
+
+def template_placeholders(line: str) -> List[str]:
+    return _PLACEHOLDER_RE.findall(line)
+
+
+def placeholder_values(request: Dict[str, Any]) -> Dict[str, str]:
+    """Map a CopyRequest payload onto template placeholder values"""
+    values = dict(PLACEHOLDER_DEFAULTS)
+    for field in ("meal_name", "user_name", "meals_per_day"):
+        if request.get(field) not in (None, ""):
+            values[field] = str(request[field])
+    for macro, amount in (request.get("over_limit") or {}).items():
+        name = "kcal_excess" if macro == "kcal" else f"{macro.removesuffix('_g')}_excess_g"
+        values[name] = f"{amount:.0f}" if isinstance(amount, (int, float)) else str(amount)
+    return values
+
+
+def fill(line: str, values: Dict[str, str]) -> Optional[str]:
+    """Substitute placeholders; None if the line needs a value we don't have"""
+    missing = False
+
+    def substitute(match: "re.Match[str]") -> str:
+        nonlocal missing
+        value = values.get(match.group(1))
+        if value is None:
+            missing = True
+            return match.group(0)
+        return value
+
+    filled = _PLACEHOLDER_RE.sub(substitute, line)
+    return None if missing else filled
+
+
+def valid_template(line: str) -> bool:
+    return 0 < len(line) <= 120 and all(p in PLACEHOLDERS for p in template_placeholders(line))
+
+
+class CopyBank:
+    """
+    Variants per (type, locale, tone). Lookups and placeholder filling are
+    local; the LLM is only asked for fresh templates once per key per refresh.
+    """
+
+    def __init__(self):
+        self._variants: Dict[BankKey, List[str]] = {}
+        self._generated_at: Dict[BankKey, float] = {}
+        self._rotation: Dict[BankKey, int] = {}
+        self._inflight: Dict[BankKey, "asyncio.Future[None]"] = {}
+        self._failed_at: Dict[BankKey, float] = {}
+        self.generator: Optional[Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]] = None
+        self.served = 0
+        self.generations = 0
+        self.generation_errors = 0
+        self.locale_fallbacks = 0
+        for copy_type, lines in SEED_LINES.items():
+            for tone in TONES:
+                self._variants[(copy_type, "en", tone)] = list(lines)
+
+    def keys(self) -> List[BankKey]:
+        return list(self._variants)
+
+    async def generate(self, key: BankKey) -> None:
+        """Ask the LLM for a fresh set of templates for one key"""
+        if self.generator is None:
+            return
+        copy_type, locale, tone = key
+        payload = {
+            "type": copy_type,
+            "locale": locale,
+            "tone": tone,
+            "template_mode": True,
+            "allowed_placeholders": list(PLACEHOLDERS),
+            "instructions": (
+                "Write reusable templates, not personalized lines: use the allowed "
+                "placeholders in curly braces instead of concrete names or numbers."
+            ),
+        }
+        try:
+            result = await self.generator(payload)
+        except Exception as e:
+            self.generation_errors += 1
+            self._failed_at[key] = time.monotonic()
+            log.warning("copy bank refresh failed", extra={"bank_key": list(key), "error": f"{type(e).__name__}: {e}"})
+            return
+        lines = [line for line in result.get("lines", []) if valid_template(line)]
+        if lines:
+            self._variants[key] = lines
+            self._generated_at[key] = time.time()
+            self._failed_at.pop(key, None)
+            self.generations += 1
+
+    async def _ensure(self, key: BankKey) -> None:
+        if key in self._variants:
+            return
+        failed_at = self._failed_at.get(key)
+        if failed_at is not None and time.monotonic() - failed_at < COPY_BANK_RETRY_S:
+            return
+        # Concurrent first requests for a new key share one generation call
+        pending = self._inflight.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(self.generate(key))
+            self._inflight[key] = pending
+            pending.add_done_callback(lambda _: self._inflight.pop(key, None))
+        await asyncio.shield(pending)
+
+    async def render(self, request: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """reminder_copy-shaped response for a CopyRequest payload, or None if the bank has no lines"""
+        key = (request["type"], normalize_locale(request.get("locale")), request.get("tone") or "friendly")
+        if key not in self._variants and len(self._variants) >= COPY_BANK_MAX_KEYS:
+            self.locale_fallbacks += 1
+            key = (key[0], "en", key[2])
+        await self._ensure(key)
+        templates = self._variants.get(key)
+        if not templates:
+            return None
+
+        values = placeholder_values(request)
+        usable = [(t, fill(t, values)) for t in templates]
+        usable = [(t, line) for t, line in usable if line is not None]
+        if not usable:
+            return None
+        # Rotate so consecutive notifications lead with a different variant
+        offset = self._rotation.get(key, 0) % len(usable)
+        self._rotation[key] = offset + 1
+        usable = usable[offset:] + usable[:offset]
+        self.served += 1
+        return {
+            "type": request["type"],
+            "placeholders": sorted({p for t, _ in usable for p in template_placeholders(t)}),
+            "lines": [line for _, line in usable][:7],
+            "model_info": COPY_BANK_MODEL_INFO,
+        }
+
+    async def refresh_all(self) -> None:
+        for key in self.keys():
+            await self.generate(key)
+
+    async def refresh_loop(self) -> None:
+        """
+        Background task: regenerate every known key each COPY_BANK_REFRESH_S.
+        Sleeps first: the seed lines cover a fresh worker, and a restart should
+        not cost one generation call per key per worker.
+        """
+        while True:
+            await asyncio.sleep(COPY_BANK_REFRESH_S)
+            await self.refresh_all()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "keys": len(self._variants),
+            "generated_keys": len(self._generated_at),
+            "served": self.served,
+            "generations": self.generations,
+            "generation_errors": self.generation_errors,
+            "failed_keys": len(self._failed_at),
+            "locale_fallbacks": self.locale_fallbacks,
+            "max_keys": COPY_BANK_MAX_KEYS,
+            "refresh_s": COPY_BANK_REFRESH_S,
+        }
+
+
+copy_bank = CopyBank()
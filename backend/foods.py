@@ -0,0 +1,239 @@
+"""
+Local food composition table - USDA-style nutrition densities per 100 g
+(as eaten), held in one contiguous array so a whole plate is looked up and
+computed in a single vectorized pass (see nutrition.estimate_from_items),
+plus a trigram index over names and aliases for fuzzy matching and search
+"""
+import os
+import re
+import csv
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .logs import get_logger
+
+log = get_logger("foods")
+
+# -------- Config --------
+FOODS_PATH = os.getenv("HEAL_FOODS_PATH", os.path.join(os.path.dirname(__file__), "data", "foods.csv"))
+# Trigram similarity (Dice, 0-1) a free-text name needs to resolve to a table food
+FOOD_MATCH_MIN_SCORE = float(os.getenv("HEAL_FOOD_MATCH_MIN_SCORE", "0.5"))
+# Short names share most of their few trigrams with unrelated foods ("pig" vs
+# "apple pie"), so each character below SHORT_KEY_LEN raises the bar this much
+SHORT_KEY_LEN = 6
+SHORT_KEY_STEP = 0.1
+# Search ranking boosts for a query that starts the name, or starts one of its words
+PREFIX_BONUS = 0.3
+WORD_PREFIX_BONUS = 0.15
+# Ranked score below which search results are noise
+SEARCH_MIN_SCORE = 0.2
+
+# Column order of FoodTable.densities
+NUTRIENTS = ("kcal", "protein_g", "fat_g", "carb_g")
+CATEGORIES = ("grain", "protein", "vegetable", "fruit", "dairy", "fat", "sauce", "beverage", "dessert", "mixed")
+# Cooking oil a method adds, in g fat per 100 g of food. Table rows record the
+# method their densities already include, so only the difference is added.
+COOKING_OIL_G = {
+    "none": 0.0,
+    "raw": 0.0,
+    "boiled": 0.0,
+    "steamed": 0.0,
+    "baked": 0.0,
+    "roasted": 0.0,
+    "grilled": 0.0,
+    "braised": 2.0,
+    "sauteed": 4.0,
+    "stir_fried": 5.0,
+    "pan_fried": 6.0,
+    "deep_fried": 12.0,
+}
+COOKING_METHODS = tuple(COOKING_OIL_G)
+# Free-text method → canonical key; first match wins
+_METHOD_WORDS = (
+    ("deep", "deep_fried"),
+    ("breaded", "deep_fried"),
+    ("batter", "deep_fried"),
+    ("tempura", "deep_fried"),
+    ("stir", "stir_fried"),
+    ("wok", "stir_fried"),
+    ("saut", "sauteed"),
+    ("fri", "pan_fried"),
+    ("fry", "pan_fried"),
+    ("braise", "braised"),
+    ("stew", "braised"),
+    ("simmer", "braised"),
+    ("roast", "roasted"),
+    ("grill", "grilled"),
+    ("broil", "grilled"),
+    ("bbq", "grilled"),
+    ("bak", "baked"),
+    ("steam", "steamed"),
+    ("boil", "boiled"),
+    ("poach", "boiled"),
+    ("raw", "raw"),
+)
+_NON_WORD_RE = re.compile(r"[^a-z0-9]+")
+
+
+def normalize_name(name: str) -> str:
+    """Lowercase, punctuation to spaces, simple plurals singular"""
+    words = _NON_WORD_RE.sub(" ", (name or "").lower()).split()
+    return " ".join(w[:-1] if len(w) > 3 and w.endswith("s") and not w.endswith("ss") else w for w in words)
+
+
+def trigrams(key: str) -> List[str]:
+    """Distinct character trigrams of a normalized name, padded so prefixes count"""
+    padded = f"  {key} "
+    return list(dict.fromkeys(padded[i:i + 3] for i in range(len(padded) - 2)))
+
+
+def normalize_method(method: Optional[str]) -> str:
+    """Map a cooking method (enum value or free text) onto COOKING_OIL_G keys"""
+    text = (method or "").lower().replace("-", "_").replace(" ", "_")
+    if text in COOKING_OIL_G:
+        return text
+    for word, key in _METHOD_WORDS:
+        if word in text:
+            return key
+    return "none"
+
+
+class FoodTable:
+    """
+    Densities as a float32 (n_foods, 4) array in NUTRIENTS order, with
+    per-row category codes and already-included cooking oil. Names and
+    aliases resolve to row numbers through one dict.
+    """
+
+    def __init__(self, rows: Sequence[Dict[str, Any]]):
+        self.names: List[str] = [r["name"] for r in rows]
+        self.densities = np.array([[float(r[n]) for n in NUTRIENTS] for r in rows], dtype=np.float32).reshape(-1, len(NUTRIENTS))
+        self.category_codes = np.array([CATEGORIES.index(r["category"]) for r in rows], dtype=np.int8)
+        self.method_oil = np.array([COOKING_OIL_G[normalize_method(r.get("method"))] for r in rows], dtype=np.float32)
+        self._index: Dict[str, int] = {}
+        for row, r in enumerate(rows):
+            aliases = [a for a in (r.get("aliases") or "").split(";") if a.strip()]
+            for key in [r["name"], *aliases]:
+                self._index.setdefault(normalize_name(key), row)
+        # Longest phrases first, so "fried chicken" beats "chicken"
+        self._phrases = sorted(self._index, key=len, reverse=True)
+        self._build_trigrams()
+        # Unknown foods get their category's mean density
+        self.category_densities = np.zeros((len(CATEGORIES), len(NUTRIENTS)), dtype=np.float32)
+        for code in range(len(CATEGORIES)):
+            members = self.category_codes == code
+            if members.any():
+                self.category_densities[code] = self.densities[members].mean(axis=0)
+
+    def _build_trigrams(self) -> None:
+        """Inverted index trigram → ids of the names/aliases that contain it"""
+        self._keys = list(self._index)
+        self._key_array = np.array(self._keys)
+        self._spaced_keys = np.char.add(" ", self._key_array)
+        self._key_rows = np.array([self._index[k] for k in self._keys], dtype=np.int32)
+        self._key_categories = self.category_codes[self._key_rows]
+        postings: Dict[str, List[int]] = {}
+        counts = []
+        for key_id, key in enumerate(self._keys):
+            grams = trigrams(key)
+            counts.append(len(grams))
+            for gram in grams:
+                postings.setdefault(gram, []).append(key_id)
+        self._gram_counts = np.array(counts, dtype=np.float32)
+        self._postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+
+    def _similarity(self, key: str) -> np.ndarray:
+        """Dice coefficient of `key` against every name/alias, from shared trigrams"""
+        grams = trigrams(key)
+        hits = [self._postings[g] for g in grams if g in self._postings]
+        if not hits:
+            return np.zeros(len(self._keys), dtype=np.float32)
+        shared = np.bincount(np.concatenate(hits), minlength=len(self._keys))
+        return 2 * shared / (len(grams) + self._gram_counts)
+
+    @classmethod
+    def from_csv(cls, path: str) -> "FoodTable":
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+        table = cls(rows)
+        log.info("food table loaded", extra={"path": path, "foods": len(table), "names": len(table._index)})
+        return table
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def find(self, name: str, category: Optional[str] = None, fuzzy: bool = True) -> int:
+        """
+        Row for a food name: exact name/alias, else the longest one it
+        contains, else (with `fuzzy`) the closest by trigram similarity among
+        foods of `category` ("mixed" or unknown means any); -1 if none is close
+        """
+        key = normalize_name(name)
+        if not key:
+            return -1
+        row = self._index.get(key)
+        if row is not None:
+            return row
+        padded = f" {key} "
+        for phrase in self._phrases:
+            if f" {phrase} " in padded:
+                return self._index[phrase]
+        if not fuzzy:
+            return -1
+        similarity = self._similarity(key)
+        if category in CATEGORIES and category != "mixed":
+            similarity = np.where(self._key_categories == CATEGORIES.index(category), similarity, 0.0)
+        best = int(similarity.argmax())
+        threshold = FOOD_MATCH_MIN_SCORE + SHORT_KEY_STEP * max(0, SHORT_KEY_LEN - len(key))
+        return int(self._key_rows[best]) if similarity[best] >= threshold else -1
+
+    def canonical_name(self, name: str, category: Optional[str] = None, fuzzy: bool = True) -> Optional[str]:
+        row = self.find(name, category, fuzzy)
+        return self.names[row] if row >= 0 else None
+
+    def search(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Autocomplete: foods ranked by trigram similarity plus prefix boosts, one entry per food"""
+        key = normalize_name(query)
+        if not key or limit <= 0:
+            return []
+        similarity = self._similarity(key)
+        candidates = np.flatnonzero(similarity > 0)
+        scores = similarity[candidates] + np.where(
+            np.char.startswith(self._key_array[candidates], key),
+            PREFIX_BONUS,
+            np.where(np.char.find(self._spaced_keys[candidates], f" {key}") >= 0, WORD_PREFIX_BONUS, 0.0),
+        )
+        keep = scores >= SEARCH_MIN_SCORE
+        candidates, scores = candidates[keep], scores[keep]
+        # Best score first; shorter names win ties
+        order = np.lexsort((np.char.str_len(self._key_array[candidates]), -scores))
+
+        results: List[Dict[str, Any]] = []
+        seen = set()
+        for score, key_id in zip(scores[order].tolist(), candidates[order].tolist()):
+            row = int(self._key_rows[key_id])
+            if row in seen:
+                continue
+            seen.add(row)
+            results.append({
+                "name": self.names[row],
+                "matched": self._keys[key_id],
+                "category": CATEGORIES[self.category_codes[row]],
+                "score": round(min(score, 1.0), 3),
+                "nutrition_per_100g": {n: round(float(v), 1) for n, v in zip(NUTRIENTS, self.densities[row])},
+            })
+            if len(results) >= limit:
+                break
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "foods": len(self),
+            "names": len(self._index),
+            "trigrams": len(self._postings),
+            "bytes": int(self.densities.nbytes + self.category_codes.nbytes + self.method_oil.nbytes),
+        }
+
+
+food_table = FoodTable.from_csv(FOODS_PATH)
@@ -0,0 +1,222 @@
+"""
+Image preprocessing for vision calls (orientation, downsampling, detail selection)
+"""
+import os
+import io
+import math
+import base64
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Tuple
+
+from PIL import Image, ImageOps, ImageFilter, ImageStat
+from fastapi import HTTPException
+
+from .metrics import stage_seconds
+
+# -------- Config --------
+# The vision model scales every high-detail image to fit 2048x2048 and then to
+# a 768px short side before tiling it into 512px squares. Anything sent above
+# that is bandwidth and CPU spent on pixels the model never sees.
+TARGET_SHORT_SIDE = int(os.getenv("HEAL_IMAGE_SHORT_SIDE", "768"))
+MAX_LONG_SIDE = int(os.getenv("HEAL_IMAGE_MAX_LONG_SIDE", "2048"))
+JPEG_QUALITY = int(os.getenv("HEAL_IMAGE_JPEG_QUALITY", "85"))
+# "auto" picks per image; "high" / "low" force a detail level
+DETAIL_MODE = os.getenv("HEAL_IMAGE_DETAIL", "auto")
+# Images whose long side fits in one low-detail tile are always sent as low
+LOW_DETAIL_MAX_SIDE = int(os.getenv("HEAL_IMAGE_LOW_DETAIL_MAX_SIDE", "512"))
+# Mean edge strength (0-255) below which a photo is plain enough for low detail
+LOW_DETAIL_EDGE_THRESHOLD = float(os.getenv("HEAL_IMAGE_LOW_DETAIL_EDGE", "6.0"))
+# Upright JPEGs at or below this size are forwarded byte-for-byte
+PASSTHROUGH_MAX_BYTES = int(os.getenv("HEAL_IMAGE_PASSTHROUGH_BYTES", str(300 * 1024)))
+IMAGE_WORKERS = int(os.getenv("HEAL_IMAGE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix="heal-image")
+
+EXIF_ORIENTATION = 0x0112
+LOW_DETAIL_TOKENS = 85
+TILE_TOKENS = 170
+TILE_SIZE = 512
+
+
+@dataclass
+class PreparedImage:
+    """Vision-ready image plus the accounting for what preprocessing saved"""
+    data_uri: str
+    detail: str
+    width: int
+    height: int
+    original_width: int
+    original_height: int
+    original_bytes: int
+    sent_bytes: int
+    passthrough: bool
+    phash: int
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.original_bytes - self.sent_bytes
+
+    @property
+    def tokens_before(self) -> int:
+        # The previous pipeline sent every upload at full size with detail=high
+        return estimate_image_tokens(self.original_width, self.original_height, "high")
+
+    @property
+    def tokens_after(self) -> int:
+        return estimate_image_tokens(self.width, self.height, self.detail)
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+
+def estimate_image_tokens(width: int, height: int, detail: str) -> int:
+    """Estimate vision input tokens using the provider's tiling rules"""
+    if detail == "low":
+        return LOW_DETAIL_TOKENS
+    w, h = float(width), float(height)
+    scale = min(1.0, 2048 / max(w, h))
+    w, h = w * scale, h * scale
+    scale = min(1.0, 768 / min(w, h))
+    w, h = w * scale, h * scale
+    tiles = math.ceil(w / TILE_SIZE) * math.ceil(h / TILE_SIZE)
+    return TILE_TOKENS * tiles + LOW_DETAIL_TOKENS
+
+
+def target_size(width: int, height: int) -> Tuple[int, int]:
+    """Downsampled size: short side to TARGET_SHORT_SIDE, long side capped"""
+    scale = min(1.0, TARGET_SHORT_SIDE / min(width, height), MAX_LONG_SIDE / max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def edge_strength(im: Image.Image) -> float:
+    """Mean edge magnitude of a small grayscale thumbnail (cheap busyness proxy)"""
+    thumb = im.convert("L")
+    thumb.thumbnail((128, 128))
+    return ImageStat.Stat(thumb.filter(ImageFilter.FIND_EDGES)).mean[0]
+
+
+def choose_detail(im: Image.Image) -> str:
+    """Pick low or high detail from image size and content"""
+    if DETAIL_MODE in ("low", "high"):
+        return DETAIL_MODE
+    if max(im.size) <= LOW_DETAIL_MAX_SIDE:
+        return "low"
+    if edge_strength(im) < LOW_DETAIL_EDGE_THRESHOLD:
+        return "low"
+    return "high"
+
+
+def perceptual_hash(im: Image.Image) -> int:
+    """
+    64-bit difference hash of an upright image: robust to re-encoding,
+    rescaling and small exposure changes, so near-duplicate shots collide.
+    """
+    gray = im.convert("L").resize((9, 8), Image.BILINEAR)
+    px = gray.tobytes()
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            i = row * 9 + col
+            bits = (bits << 1) | (px[i] > px[i + 1])
+    return bits
+
+
+def _data_uri(jpeg: bytes) -> str:
+    return "data:image/jpeg;base64," + base64.b64encode(jpeg).decode("ascii")
+
+
+def preprocess_image(raw: bytes) -> PreparedImage:
+    """
+    Normalize an uploaded photo for the vision model.
+    Blocking (PIL decode/encode) - call through prepare_image() from async code.
+    """
+    if not raw:
+        raise HTTPException(status_code=400, detail="Empty image file.")
+    try:
+        # Image.open only parses the header; pixels are decoded on load()
+        im = Image.open(io.BytesIO(raw))
+        original_size = im.size
+        orientation = im.getexif().get(EXIF_ORIENTATION, 1)
+    except Exception as e:
+        raise HTTPException(status_code=415, detail=f"Unsupported image file: {str(e)}")
+
+    if orientation in (5, 6, 7, 8):
+        original_size = original_size[::-1]
+    width, height = original_size
+
+    # Already small, upright JPEGs go out untouched: no decode, no re-encode
+    if (
+        im.format == "JPEG"
+        and orientation == 1
+        and len(raw) <= PASSTHROUGH_MAX_BYTES
+        and target_size(width, height) == (width, height)
+    ):
+        if DETAIL_MODE in ("low", "high"):
+            detail = DETAIL_MODE
+        else:
+            detail = "low" if max(width, height) <= LOW_DETAIL_MAX_SIDE else "high"
+        try:
+            # A 1/8-scale draft decode is all the hash needs
+            with stage_seconds.time(stage="image_hash"):
+                im.draft("L", (64, 64))
+                phash = perceptual_hash(im)
+        except Exception as e:
+            raise HTTPException(status_code=415, detail=f"Unsupported image file: {str(e)}")
+        with stage_seconds.time(stage="base64"):
+            data_uri = _data_uri(raw)
+        return PreparedImage(
+            data_uri=data_uri,
+            detail=detail,
+            width=width,
+            height=height,
+            original_width=width,
+            original_height=height,
+            original_bytes=len(raw),
+            sent_bytes=len(raw),
+            passthrough=True,
+            phash=phash,
+        )
+
+    try:
+        # Pixels are decoded lazily by convert(), so this stage covers decode + resize
+        with stage_seconds.time(stage="image_decode"):
+            size = target_size(width, height)
+            # Let the JPEG decoder do DCT-domain downscaling instead of decoding
+            # every pixel of a 12MP photo only to throw most of them away
+            im.draft("RGB", (size[0], size[1]) if orientation in (1, 2, 3, 4) else (size[1], size[0]))
+            im = ImageOps.exif_transpose(im).convert("RGB")
+            if im.size != size:
+                im = im.resize(size, Image.LANCZOS, reducing_gap=3.0)
+    except Exception as e:
+        raise HTTPException(status_code=415, detail=f"Unsupported image file: {str(e)}")
+
+    detail = choose_detail(im)
+    with stage_seconds.time(stage="image_encode"):
+        buf = io.BytesIO()
+        im.save(buf, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+        jpeg = buf.getvalue()
+    with stage_seconds.time(stage="base64"):
+        data_uri = _data_uri(jpeg)
+    with stage_seconds.time(stage="image_hash"):
+        phash = perceptual_hash(im)
+    return PreparedImage(
+        data_uri=data_uri,
+        detail=detail,
+        width=im.width,
+        height=im.height,
+        original_width=width,
+        original_height=height,
+        original_bytes=len(raw),
+        sent_bytes=len(jpeg),
+        passthrough=False,
+        phash=phash,
+    )
+
+
+async def prepare_image(raw: bytes) -> PreparedImage:
+    """Run preprocess_image on the image thread pool, off the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, preprocess_image, raw)
@@ -0,0 +1,200 @@
+"""
+Latency control for upstream LLM calls (per-request deadlines propagated
+from the client, per-endpoint budgets, hedged text requests)
+"""
+import os
+import re
+import time
+import asyncio
+import contextvars
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+from .ratelimit import parse_reset
+
+T = TypeVar("T")
+
+# -------- Config --------
+# Whole-request budgets in seconds; a client X-Request-Deadline can only shorten them
+ENDPOINT_BUDGETS_S = {
+    "estimate": float(os.getenv("HEAL_BUDGET_ESTIMATE", "45")),
+    "estimate_stream": float(os.getenv("HEAL_BUDGET_ESTIMATE_STREAM", "60")),
+    "analyze": float(os.getenv("HEAL_BUDGET_ANALYZE", "60")),
+    "compare": float(os.getenv("HEAL_BUDGET_COMPARE", "15")),
+    "suggestions": float(os.getenv("HEAL_BUDGET_SUGGESTIONS", "20")),
+    "copy": float(os.getenv("HEAL_BUDGET_COPY", "10")),
+    "daily_summary": float(os.getenv("HEAL_BUDGET_DAILY_SUMMARY", "20")),
+}
+DEFAULT_BUDGET_S = 30.0
+# Per-attempt caps for calls made outside any request (e.g. copy bank refresh)
+VISION_TIMEOUT_S = float(os.getenv("HEAL_VISION_TIMEOUT", "45"))
+TEXT_TIMEOUT_S = float(os.getenv("HEAL_TEXT_TIMEOUT", "20"))
+# Not worth starting an upstream attempt with less time than this left
+MIN_ATTEMPT_S = float(os.getenv("HEAL_MIN_ATTEMPT_TIME", "0.5"))
+
+# Hedging: when a text call outlives its endpoint's recent p95, fire a
+# duplicate and take whichever answers first
+HEDGE_ENABLED = os.getenv("HEAL_HEDGE", "0") != "0"
+HEDGE_QUANTILE = float(os.getenv("HEAL_HEDGE_QUANTILE", "0.95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEAL_HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MIN_DELAY_S = float(os.getenv("HEAL_HEDGE_MIN_DELAY", "0.25"))
+LATENCY_WINDOW = 256
+
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+
+# Absolute time.monotonic() deadline of the request being served, if any
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("heal_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """The request's latency budget ran out before the upstream answered"""
+
+
+def parse_deadline_header(value: Optional[str]) -> Optional[float]:
+    """
+    Seconds left according to an X-Request-Deadline header: either an
+    absolute Unix timestamp in seconds, or a relative budget like '8s' / '2500ms'
+    """
+    if not value or not value.strip():
+        return None
+    value = value.strip()
+    if _NUMBER_RE.fullmatch(value):
+        return float(value) - time.time()
+    seconds = parse_reset(value)
+    if seconds is None:
+        raise ValueError(f"Unreadable X-Request-Deadline: {value!r}")
+    return seconds
+
+
+def start_deadline(endpoint: str, header: Optional[str] = None) -> float:
+    """Set the current request's deadline; returns its budget in seconds"""
+    budget = ENDPOINT_BUDGETS_S.get(endpoint, DEFAULT_BUDGET_S)
+    requested = parse_deadline_header(header)
+    if requested is not None:
+        budget = min(budget, requested)
+    _deadline.set(time.monotonic() + budget)
+    return budget
+
+
+def remaining() -> Optional[float]:
+    """Seconds left for the current request (None outside a request)"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def attempt_timeout(cap: float) -> float:
+    """Timeout for one upstream attempt: `cap`, clipped to what the request has left"""
+    left = remaining()
+    if left is None:
+        return cap
+    if left < MIN_ATTEMPT_S:
+        raise DeadlineExceeded(f"{max(left, 0.0):.2f}s left, not starting another upstream attempt")
+    return min(cap, left)
+
+
+def check_deadline() -> None:
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded("request deadline passed")
+
+
+async def within_deadline(aw: Awaitable[T]) -> T:
+    """Await `aw`, giving up with DeadlineExceeded when the request runs out of time"""
+    left = remaining()
+    if left is None:
+        return await aw
+    try:
+        return await asyncio.wait_for(aw, timeout=max(left, 0.0))
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded("request deadline passed while waiting") from None
+
+
+class LatencyTracker:
+    """Recent upstream latencies per endpoint and the hedging they drive"""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self.hedges: Dict[str, Dict[str, int]] = {}
+
+    def observe(self, key: str, seconds: float) -> None:
+        samples = self._samples.get(key)
+        if samples is None:
+            samples = self._samples[key] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def quantile(self, key: str, q: float) -> Optional[float]:
+        samples = self._samples.get(key)
+        if not samples or len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def _counters(self, key: str) -> Dict[str, int]:
+        counters = self.hedges.get(key)
+        if counters is None:
+            counters = self.hedges[key] = {"calls": 0, "fired": 0, "won": 0}
+        return counters
+
+    async def _timed(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        started = time.monotonic()
+        result = await fn()
+        self.observe(key, time.monotonic() - started)
+        return result
+
+    async def hedged(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run `fn`; if it is still pending after the key's p95 (and hedging is on),
+        start a second `fn` and return whichever succeeds first. The loser is cancelled.
+        """
+        counters = self._counters(key)
+        counters["calls"] += 1
+        delay = self.quantile(key, HEDGE_QUANTILE) if HEDGE_ENABLED else None
+        primary = asyncio.ensure_future(self._timed(key, fn))
+        tasks = [primary]
+        try:
+            if delay is None:
+                return await primary
+
+            delay = max(delay, HEDGE_MIN_DELAY_S)
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            left = remaining()
+            if done or (left is not None and left < MIN_ATTEMPT_S):
+                return await primary
+
+            counters["fired"] += 1
+            backup = asyncio.ensure_future(self._timed(key, fn))
+            tasks.append(backup)
+            pending = {primary, backup}
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is backup:
+                            counters["won"] += 1
+                        return task.result()
+                    error = error or task.exception()
+            assert error is not None
+            raise error
+        finally:
+            # Whatever ends the wait (a winner, an error, our own cancellation),
+            # no attempt is left running behind the caller
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {"hedging_enabled": HEDGE_ENABLED, "endpoints": {}}
+        for key, samples in self._samples.items():
+            ordered = sorted(samples)
+            stats["endpoints"][key] = {
+                "samples": len(ordered),
+                "p50_ms": round(ordered[len(ordered) // 2] * 1000, 1),
+                "p95_ms": round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))] * 1000, 1),
+                **self._counters(key),
+            }
+        return stats
+
+
+latency = LatencyTracker()
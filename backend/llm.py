@@ -1,49 +1,371 @@
 """
-LLM service layer - all OpenAI calls
+LLM service layer - all model calls (through backend/providers.py)
 """
 import os
 import json
-import io
-import base64
-from typing import Dict, Any
-from PIL import Image
-from openai import OpenAI
-from fastapi import UploadFile, HTTPException
+import time
+import asyncio
+from typing import Dict, Any, List, Optional, AsyncIterator, Sequence, Tuple
+from openai import APIStatusError, APIConnectionError, APITimeoutError, RateLimitError
+from fastapi import UploadFile
 
 from .schemas import (
     food_estimate_schema,
+    food_items_schema,
     meal_compare_schema,
+    compare_notes_schema,
     suggestions_schema,
+    suggestion_wording_schema,
     reminder_copy_schema,
     daily_summary_schema,
 )
+from .images import preprocess_image
+from .cache import PerceptualCache, SimilarityCache, TTLCache, SingleFlight, canonical_key
+from .nutrition import (
+    compare_meal,
+    estimate_from_items,
+    clean_estimate,
+    optimize_portions,
+    suggest_meal,
+    fallback_suggestions,
+    fallback_daily_summary,
+    FOODS_MODEL_INFO,
+    OPT_MACROS,
+    SUGGESTIONS_MODEL_INFO,
+    FALLBACK_SUGGESTIONS_MODEL_INFO,
+)
+from .streaming import ItemStreamParser
+from .foods import food_table, normalize_name
+from .copybank import copy_bank, normalize_locale
+from .providers import LLMTarget, target, active_providers
+from .ratelimit import (
+    RATE_LIMIT_ENABLED,
+    MAX_RETRIES,
+    limiter_for,
+    estimate_request_tokens,
+    backoff_delay,
+    parse_reset,
+)
+from .latency import (
+    VISION_TIMEOUT_S,
+    TEXT_TIMEOUT_S,
+    MIN_ATTEMPT_S,
+    attempt_timeout,
+    check_deadline,
+    remaining,
+    within_deadline,
+    latency,
+    DeadlineExceeded,
+)
+from .breaker import CircuitOpen, breaker_for
+from .cascade import CASCADE_ENABLED, CASCADE_FAST_DETAIL, FAST, FULL, escalation_reasons, cascade_stats
+from .metrics import stage_seconds, upstream_seconds, upstream_tokens, suggestion_cache_lookups
+from .logs import get_logger
+
+log = get_logger("llm")
 
 # -------- Config --------
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise RuntimeError("Set OPENAI_API_KEY env var.")
+# Photo analysis and text generation each go to a configurable provider +
+# model (HEAL_LLM_PROVIDER, HEAL_VISION_*/HEAL_TEXT_*; see providers.py).
+# Calls are async so a slow vision request never blocks the event loop.
+VISION = target("vision")
+VISION_FAST = target("vision_fast")
+TEXT = target("text")
+
+# Photo estimates keyed by perceptual hash, so re-shot plates, retries and
+# the same packaged food day after day skip the vision call entirely
+ESTIMATE_CACHE_ENABLED = os.getenv("HEAL_ESTIMATE_CACHE", "1") != "0"
+estimate_cache = PerceptualCache(
+    maxsize=int(os.getenv("HEAL_ESTIMATE_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("HEAL_ESTIMATE_CACHE_TTL", "86400")),
+    max_distance=int(os.getenv("HEAL_ESTIMATE_CACHE_MAX_DISTANCE", "4")),
+)
+
+# Text endpoint responses keyed by a canonical hash of model, prompt, schema,
+# temperature and sorted payload. TTLs are per endpoint: reminder copy can
+# be reused for a day, suggestions only briefly.
+response_cache = TTLCache(maxsize=int(os.getenv("HEAL_RESPONSE_CACHE_SIZE", "2048")))
+RESPONSE_CACHE_TTLS = {
+    "compare": float(os.getenv("HEAL_CACHE_TTL_COMPARE", "3600")),
+    "suggestions": float(os.getenv("HEAL_CACHE_TTL_SUGGESTIONS", "900")),
+    "copy": float(os.getenv("HEAL_CACHE_TTL_COPY", "86400")),
+    "daily_summary": float(os.getenv("HEAL_CACHE_TTL_DAILY_SUMMARY", "3600")),
+}
+response_cache_counters: Dict[str, Dict[str, int]] = {
+    endpoint: {"hits": 0, "misses": 0, "bypassed": 0} for endpoint in RESPONSE_CACHE_TTLS
+}
+
+# Identical concurrent calls (client retries, double taps) share one upstream request
+SINGLEFLIGHT_ENABLED = os.getenv("HEAL_SINGLEFLIGHT", "1") != "0"
+singleflight = SingleFlight()
+
+# /estimate: "llm" = the model recalls densities and does all the arithmetic;
+# "lookup" = the model only names foods, methods and grams, and macros come
+# from the local food table (backend/foods.py) via nutrition.estimate_from_items
+ESTIMATE_MODE = os.getenv("HEAL_ESTIMATE_MODE", "llm")
+# Cascade (HEAL_ESTIMATE_CASCADE, see cascade.py): per-attempt timeout of the
+# fast pass, kept short so an escalation still fits the request budget
+CASCADE_FAST_TIMEOUT_S = float(os.getenv("HEAL_CASCADE_FAST_TIMEOUT", "10"))
+# Map each estimated item's free-text `name` onto the food table's canonical
+# name (fuzzy, no extra LLM call); the model's wording stays in display_name
+NORMALIZE_FOOD_NAMES = os.getenv("HEAL_NORMALIZE_FOOD_NAMES", "1") != "0"
+
+# /llm/copy: "bank" = fill pre-generated templates locally; "llm" = one call per request
+COPY_MODE = os.getenv("HEAL_COPY_MODE", "bank")
+
+# /llm/compare: "local" = arithmetic only, no LLM call; "hybrid" = local
+# numbers + LLM-written notes; "llm" = the model does everything (legacy)
+COMPARE_MODE = os.getenv("HEAL_COMPARE_MODE", "hybrid")
+
+# /llm/suggestions: "local" = portion changes from nutrition.optimize_portions,
+# no LLM call; "hybrid" = local numbers + LLM-written wording; "llm" = the
+# model does everything (legacy)
+SUGGESTIONS_MODE = os.getenv("HEAL_SUGGESTIONS_MODE", "local")
+# Similarity cache for the model-backed suggestion modes. Exact keys rarely
+# repeat (macros differ by a few grams), so per-meal targets, meal macros and
+# remaining budget are quantized into buckets and a request reuses the result
+# of the nearest stored one with the same foods, meal and diabetes type
+SUGGESTION_CACHE_ENABLED = os.getenv("HEAL_SUGGESTION_CACHE", "1") != "0"
+suggestion_cache = SimilarityCache(
+    maxsize=int(os.getenv("HEAL_SUGGESTION_CACHE_SIZE", "2048")),
+    ttl=RESPONSE_CACHE_TTLS["suggestions"],
+    tolerance=int(os.getenv("HEAL_SUGGESTION_CACHE_TOLERANCE", "1")),
+)
+SUGGESTION_BUCKET_KCAL = float(os.getenv("HEAL_SUGGESTION_CACHE_BUCKET_KCAL", "50"))
+SUGGESTION_BUCKET_G = float(os.getenv("HEAL_SUGGESTION_CACHE_BUCKET_G", "5"))
+# Drift check: a neighbour's result is only reused while the local portion
+# optimizer's change for every item differs by at most this many grams
+SUGGESTION_CACHE_MAX_DRIFT_G = float(os.getenv("HEAL_SUGGESTION_CACHE_MAX_DRIFT_G", "15"))
+suggestion_drift: Dict[str, float] = {"checks": 0, "drifted": 0, "total_g": 0.0, "max_g": 0.0}
+
+# Responses served locally because an endpoint's circuit was open
+degraded_counters: Dict[str, int] = {"compare": 0, "suggestions": 0, "copy": 0, "daily_summary": 0}
+
+
+# -------- Upstream transport --------
+async def warm_up_upstream() -> int:
+    """Pre-open pooled connections to every configured provider (called at startup)"""
+    return sum(await asyncio.gather(*[p.warm_up() for p in active_providers()]))
+
+
+def upstream_pool_stats() -> Dict[str, Any]:
+    return {p.name: p.pool_stats() for p in active_providers()}
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+
+async def close_upstream() -> None:
+    for p in active_providers():
+        await p.close()
 
 
 # -------- Image Processing --------
 def img_to_data_uri(upload: UploadFile) -> str:
-    """Convert uploaded image to JPEG data URI"""
+    """Convert uploaded image to a vision-ready JPEG data URI"""
     upload.file.seek(0)  # Reset file pointer
-    raw = upload.file.read()
-    if not raw:
-        raise HTTPException(status_code=400, detail="Empty image file.")
-    try:
-        im = Image.open(io.BytesIO(raw)).convert("RGB")
-    except Exception as e:
-        raise HTTPException(status_code=415, detail=f"Unsupported image file: {str(e)}")
-    buf = io.BytesIO()
-    im.save(buf, format="JPEG", quality=92)
-    b64 = base64.b64encode(buf.getvalue()).decode("utf-8")
-    return f"data:image/jpeg;base64,{b64}"
+    return preprocess_image(upload.file.read()).data_uri
 
 
 # -------- LLM Calls --------
+async def _create_completion(
+    endpoint: str,
+    llm: LLMTarget,
+    messages: List[Dict[str, Any]],
+    timeout: float,
+    **kwargs: Any,
+) -> Any:
+    """
+    chat.completions.create on `llm`'s provider, behind the model + endpoint
+    circuit breaker and (for metered providers) the per-model rate limiter,
+    retrying 429/5xx/connection errors with jittered backoff. `timeout`
+    (seconds) caps each attempt and is clipped to the request's remaining
+    deadline. Returns the parsed completion (or stream when stream=True).
+    Raises CircuitOpen without calling out while the circuit is open.
+    """
+    async with breaker_for(llm.model, endpoint).guard():
+        return await _create_completion_with_retries(endpoint, llm, messages, timeout, **kwargs)
+
+
+def _attempt_outcome(e: BaseException) -> str:
+    if isinstance(e, (APITimeoutError, DeadlineExceeded)):
+        return "timeout"
+    if isinstance(e, APIConnectionError):
+        return "connection_error"
+    if isinstance(e, APIStatusError):
+        return "rate_limited" if e.status_code == 429 else f"{e.status_code // 100}xx"
+    if isinstance(e, asyncio.CancelledError):
+        return "cancelled"
+    return "error"
+
+
+def _record_usage(model: str, endpoint: str, usage: Any) -> None:
+    if usage is None:
+        return
+    upstream_tokens.inc(usage.prompt_tokens, model=model, endpoint=endpoint, type="prompt")
+    upstream_tokens.inc(usage.completion_tokens, model=model, endpoint=endpoint, type="completion")
+
+
+async def _attempt(llm: LLMTarget, endpoint: str, **kwargs: Any) -> Any:
+    """One raw upstream call, timed into heal_upstream_seconds (time to headers when streaming)"""
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        # httpx timeouts are per phase (connect/read/...), so the deadline is
+        # also enforced on the whole attempt
+        return await within_deadline(llm.provider.create(llm.model, **kwargs))
+    except BaseException as e:
+        outcome = _attempt_outcome(e)
+        raise
+    finally:
+        upstream_seconds.observe(time.perf_counter() - started, model=llm.model, endpoint=endpoint, outcome=outcome)
+
+
+async def _create_completion_with_retries(
+    endpoint: str,
+    llm: LLMTarget,
+    messages: List[Dict[str, Any]],
+    timeout: float,
+    **kwargs: Any,
+) -> Any:
+    model = llm.model
+    limiter = limiter_for(model) if RATE_LIMIT_ENABLED and llm.provider.rate_limited else None
+    estimated = estimate_request_tokens(messages)
+    for attempt in range(MAX_RETRIES + 1):
+        if limiter is not None:
+            await within_deadline(limiter.acquire(estimated))
+        try:
+            raw = await _attempt(
+                llm, endpoint, messages=messages, timeout=attempt_timeout(timeout), **kwargs
+            )
+        except (APIStatusError, APIConnectionError) as e:
+            retryable = isinstance(e, APIConnectionError) or e.status_code == 429 or e.status_code >= 500
+            if not retryable or attempt == MAX_RETRIES:
+                raise
+            response = getattr(e, "response", None)
+            retry_after = parse_reset(response.headers.get("retry-after")) if response is not None else None
+            if isinstance(e, RateLimitError) and limiter is not None:
+                limiter.on_rate_limited(retry_after)
+            delay = backoff_delay(attempt, retry_after)
+            left = remaining()
+            if left is not None and delay + MIN_ATTEMPT_S > left:
+                # No time for another attempt; surface the upstream error now
+                raise
+            log.warning(
+                "upstream call failed, retrying",
+                extra={
+                    "model": model,
+                    "endpoint": endpoint,
+                    "error": type(e).__name__,
+                    "attempt": attempt + 1,
+                    "max_retries": MAX_RETRIES,
+                    "delay_s": round(delay, 2),
+                },
+            )
+            await asyncio.sleep(delay)
+            continue
+        if limiter is not None:
+            limiter.observe_headers(raw.headers)
+        completion = raw.parse()
+        usage = getattr(completion, "usage", None)
+        _record_usage(model, endpoint, usage)
+        if limiter is not None and usage is not None:
+            limiter.settle(estimated, usage.total_tokens)
+        return completion
+
+
+async def _structured_completion(
+    endpoint: str,
+    llm: LLMTarget,
+    temperature: float,
+    response_format: Dict[str, Any],
+    messages: List[Dict[str, Any]],
+    timeout: float,
+    hedge: bool = False,
+) -> Dict[str, Any]:
+    """
+    Run one structured-output chat completion and parse its JSON body.
+    With `hedge`, slow calls get a hedged duplicate (see latency.py).
+    """
+    async def once() -> Dict[str, Any]:
+        resp = await _create_completion(
+            endpoint,
+            llm,
+            messages,
+            temperature=temperature,
+            response_format=response_format,
+            timeout=timeout,
+        )
+        with stage_seconds.time(stage="json_parse", endpoint=endpoint):
+            return json.loads(resp.choices[0].message.content)
+
+    async def call() -> Dict[str, Any]:
+        if not hedge:
+            return await once()
+        return await latency.hedged(endpoint, once)
+
+    if not SINGLEFLIGHT_ENABLED:
+        return await call()
+    key = canonical_key(
+        model=llm.model,
+        temperature=temperature,
+        schema=response_format["json_schema"]["name"],
+        messages=messages,
+    )
+    # A coalesced caller waits no longer than its own deadline allows
+    return await within_deadline(singleflight.do(key, call))
+
+
+async def _text_completion(
+    endpoint: str,
+    temperature: float,
+    prompt: str,
+    response_format: Dict[str, Any],
+    payload: Dict[str, Any],
+    timeout: float = TEXT_TIMEOUT_S,
+    use_cache: bool = True,
+) -> Dict[str, Any]:
+    """Structured completion over a JSON payload, served from response_cache when possible"""
+    counters = response_cache_counters[endpoint]
+    ttl = RESPONSE_CACHE_TTLS[endpoint]
+    if not use_cache or ttl <= 0:
+        counters["bypassed"] += 1
+        key = None
+    else:
+        key = canonical_key(
+            model=TEXT.model,
+            prompt=prompt,
+            schema=response_format["json_schema"]["name"],
+            temperature=temperature,
+            payload=payload,
+        )
+        cached = response_cache.get(key)
+        if cached is not None:
+            counters["hits"] += 1
+            return cached
+        counters["misses"] += 1
+
+    result = await _structured_completion(
+        endpoint,
+        TEXT,
+        temperature=temperature,
+        response_format=response_format,
+        messages=[
+            {"role": "system", "content": prompt},
+            {"role": "user", "content": json.dumps(payload, ensure_ascii=False)},
+        ],
+        timeout=timeout,
+        hedge=True,
+    )
+    if key is not None:
+        response_cache.set(key, result, ttl=ttl)
+    return result
+
+
+def response_cache_stats() -> Dict[str, Any]:
+    stats = response_cache.stats()
+    stats["ttl_s"] = RESPONSE_CACHE_TTLS
+    stats["endpoints"] = response_cache_counters
+    return stats
+
+
 FOOD_ESTIMATE_PROMPT = (
     "You are a nutrition analyst. Given a single food photo, do EVERYTHING end-to-end: "
     "1) identify all major foods (<=6), across any cuisine; 2) estimate portion size in grams by "
@@ -56,25 +378,208 @@ FOOD_ESTIMATE_PROMPT = (
 )
 
 
-def estimate_food_from_image(image_data_uri: str) -> Dict[str, Any]:
-    """Call GPT-4o to analyze food photo and return nutrition estimate"""
-    resp = client.chat.completions.create(
-        model="gpt-4o",
+FOOD_ITEMS_PROMPT = (
+    "You are a nutrition analyst. Given a single food photo: 1) identify all major foods (<=6), across any cuisine; "
+    "2) estimate each portion in grams as eaten by visually referencing plate scale and typical serving geometry; "
+    "3) infer the cooking method. Use short, generic English food names (e.g. 'white rice', 'chicken thigh', "
+    "'sweetened iced tea'). Do NOT estimate calories or macros: they are computed from a food database. "
+    "If breaded & fried, list the food once with cooking method deep_fried. List sauces and drinks as separate items. "
+    "Output ONLY JSON per the provided schema—no explanations."
+)
+
+
+def _estimate_request(mode: str) -> Tuple[str, Dict[str, Any]]:
+    """System prompt and response_format for an estimate mode"""
+    if mode == "lookup":
+        return FOOD_ITEMS_PROMPT, food_items_schema()
+    return FOOD_ESTIMATE_PROMPT, food_estimate_schema()
+
+
+def _from_items(identified: Dict[str, Any], model: str) -> Dict[str, Any]:
+    """Lookup mode: the model's items and grams → full calorie_estimate"""
+    return estimate_from_items(
+        identified.get("items") or [],
+        assumptions=identified.get("assumptions") or [],
+        warnings=identified.get("warnings") or [],
+        model_info=f"{model}+{FOODS_MODEL_INFO}",
+    )
+
+
+def _canonical_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    # Only exact and contained-phrase matches rename; a fuzzy guess would
+    # relabel the model's own densities with another food's name
+    name = food_table.canonical_name(item.get("name") or "", fuzzy=False)
+    if name is None or name == item.get("name"):
+        return item
+    return {**item, "name": name, "display_name": item.get("display_name") or item.get("name")}
+
+
+def _finish_estimate(result: Dict[str, Any], llm: LLMTarget = VISION) -> Dict[str, Any]:
+    """Parsed model output → the estimate we serve (per ESTIMATE_MODE / NORMALIZE_FOOD_NAMES)"""
+    if ESTIMATE_MODE == "lookup":
+        with stage_seconds.time(stage="food_lookup", endpoint="estimate"):
+            return _from_items(result, llm.model)
+    if NORMALIZE_FOOD_NAMES:
+        with stage_seconds.time(stage="food_names", endpoint="estimate"):
+            # Copy: the parsed result may be shared through singleflight
+            return {**result, "items": [_canonical_item(item) for item in result.get("items") or []]}
+    return result
+
+
+def _finish_item(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Streamed item → served item; lookup mode gets densities and macros on arrival"""
+    if ESTIMATE_MODE == "lookup":
+        return estimate_from_items([item])["items"][0]
+    return _canonical_item(item) if NORMALIZE_FOOD_NAMES else item
+
+
+def _food_estimate_messages(image_data_uri: str, detail: str, prompt: str = FOOD_ESTIMATE_PROMPT) -> List[Dict[str, Any]]:
+    return [
+        {"role": "system", "content": prompt},
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": "Analyze this food photo and return JSON only."},
+                {"type": "image_url", "image_url": {"url": image_data_uri, "detail": detail}}
+            ]
+        }
+    ]
+
+
+async def _fast_pass(image_data_uri: str, prompt: str, response_format: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], List[str]]:
+    """Cascade first tier: the fast model's estimate and why it should escalate (empty = serve it)"""
+    try:
+        result = await _structured_completion(
+            "estimate",
+            VISION_FAST,
+            temperature=0.2,
+            response_format=response_format,
+            messages=_food_estimate_messages(image_data_uri, CASCADE_FAST_DETAIL, prompt),
+            timeout=min(VISION_TIMEOUT_S, CASCADE_FAST_TIMEOUT_S),
+        )
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        # Any fast-tier failure (errors, open circuit, bad JSON) falls through to the full model
+        log.warning("cascade fast pass failed, escalating", extra={"model": VISION_FAST.model, "error": type(e).__name__})
+        return None, ["fast_error"]
+    return result, escalation_reasons(result)
+
+
+def _record_tier(tier: str, started: float, reasons: Sequence[str] = ()) -> None:
+    cascade_stats.record(tier, started, reasons)
+    log.info("estimate tier", extra={"tier": tier, "model": (VISION_FAST if tier == FAST else VISION).model, "reasons": list(reasons)})
+
+
+async def estimate_food_from_image(
+    image_data_uri: str,
+    detail: str = "high",
+    image_hash: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Call GPT-4o to analyze food photo and return nutrition estimate.
+    Pass the image's perceptual hash to serve near-duplicates from cache.
+    With HEAL_ESTIMATE_CASCADE a fast pass answers first unless it escalates.
+    """
+    use_cache = ESTIMATE_CACHE_ENABLED and image_hash is not None
+    if use_cache:
+        cached = estimate_cache.get(image_hash)
+        if cached is not None:
+            return cached
+    prompt, response_format = _estimate_request(ESTIMATE_MODE)
+    started = time.perf_counter()
+    if CASCADE_ENABLED:
+        fast, reasons = await _fast_pass(image_data_uri, prompt, response_format)
+        if not reasons:
+            _record_tier(FAST, started)
+            result = _finish_estimate(fast, VISION_FAST)
+            if use_cache:
+                estimate_cache.set(image_hash, result)
+            return result
+    result = await _structured_completion(
+        "estimate",
+        VISION,
         temperature=0.2,
-        response_format=food_estimate_schema(),
-        messages=[
-            {"role": "system", "content": FOOD_ESTIMATE_PROMPT},
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": "Analyze this food photo and return JSON only."},
-                    {"type": "image_url", "image_url": {"url": image_data_uri, "detail": "high"}}
-                ]
-            }
-        ],
-        timeout=60_000
+        response_format=response_format,
+        messages=_food_estimate_messages(image_data_uri, detail, prompt),
+        timeout=VISION_TIMEOUT_S,
+    )
+    if CASCADE_ENABLED:
+        _record_tier(FULL, started, reasons)
+    result = _finish_estimate(result)
+    if use_cache:
+        estimate_cache.set(image_hash, result)
+    return result
+
+
+async def stream_food_estimate(
+    image_data_uri: str,
+    detail: str = "high",
+    image_hash: Optional[int] = None,
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Streaming variant of estimate_food_from_image.
+    Yields ("item", item) for each food as soon as its JSON is complete,
+    then ("estimate", full_result).
+    """
+    use_cache = ESTIMATE_CACHE_ENABLED and image_hash is not None
+    if use_cache:
+        cached = estimate_cache.get(image_hash)
+        if cached is not None:
+            for item in cached.get("items", []):
+                yield "item", item
+            yield "estimate", cached
+            return
+
+    prompt, response_format = _estimate_request(ESTIMATE_MODE)
+    started = time.perf_counter()
+    if CASCADE_ENABLED:
+        # The fast pass isn't streamed: its items are only final once it's accepted
+        fast, reasons = await _fast_pass(image_data_uri, prompt, response_format)
+        if not reasons:
+            _record_tier(FAST, started)
+            result = _finish_estimate(fast, VISION_FAST)
+            for item in result.get("items", []):
+                yield "item", item
+            if use_cache:
+                estimate_cache.set(image_hash, result)
+            yield "estimate", result
+            return
+
+    stream = await _create_completion(
+        "estimate",
+        VISION,
+        _food_estimate_messages(image_data_uri, detail, prompt),
+        temperature=0.2,
+        response_format=response_format,
+        timeout=VISION_TIMEOUT_S,
+        stream=True,
+        # Final chunk carries resp.usage for the token metrics
+        stream_options={"include_usage": True},
     )
-    return json.loads(resp.choices[0].message.content)
+    parser = ItemStreamParser()
+    try:
+        async for chunk in stream:
+            # The per-read timeout doesn't bound a slowly trickling stream
+            check_deadline()
+            if chunk.usage is not None:
+                _record_usage(VISION.model, "estimate", chunk.usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                for item in parser.feed(delta):
+                    yield "item", _finish_item(item)
+    finally:
+        await stream.close()
+    with stage_seconds.time(stage="json_parse", endpoint="estimate"):
+        result = parser.result()
+    if CASCADE_ENABLED:
+        _record_tier(FULL, started, reasons)
+    result = _finish_estimate(result)
+    if use_cache:
+        estimate_cache.set(image_hash, result)
+    yield "estimate", result
 
 
 COMPARE_PROMPT = (
@@ -84,19 +589,66 @@ COMPARE_PROMPT = (
 )
 
 
-def compare_meal_to_targets(payload: Dict[str, Any]) -> Dict[str, Any]:
-    """Compare current meal against per-meal and daily targets"""
-    resp = client.chat.completions.create(
-        model="gpt-4o-mini",
-        temperature=0,
-        response_format=meal_compare_schema(),
-        messages=[
-            {"role": "system", "content": COMPARE_PROMPT},
-            {"role": "user", "content": json.dumps(payload, ensure_ascii=False)},
-        ],
-        timeout=45_000,
+COMPARE_NOTES_PROMPT = (
+    "You are a diabetes nutrition coach. The comparison numbers below are already computed and exact;"
+    " do not recalculate or contradict them. Write 1-4 short, plain-language notes for the user about"
+    " this meal versus their per-meal and daily targets. Return ONLY JSON per the schema."
+)
+
+
+async def compare_meal_to_targets(
+    payload: Dict[str, Any],
+    mode: Optional[str] = None,
+    use_cache: bool = True,
+) -> Dict[str, Any]:
+    """
+    Compare current meal against per-meal and daily targets.
+    Numbers come from nutrition.compare_meal; the LLM only writes notes (hybrid).
+    """
+    mode = mode or COMPARE_MODE
+    if mode == "llm":
+        try:
+            return await _text_completion(
+                "compare",
+                temperature=0,
+                prompt=COMPARE_PROMPT,
+                response_format=meal_compare_schema(),
+                payload=payload,
+                use_cache=use_cache,
+            )
+        except CircuitOpen:
+            # Same schema from exact arithmetic
+            degraded_counters["compare"] += 1
+            mode = "local"
+
+    result = compare_meal(
+        payload["per_meal_targets"],
+        payload["daily_targets"],
+        payload["daily_consumed_so_far"],
+        payload["current_meal"],
     )
-    return json.loads(resp.choices[0].message.content)
+    if mode != "hybrid":
+        return result
+
+    context = {k: v for k, v in payload.items() if k in ("meal_index", "meals_per_day", "meal_name", "diabetes_type")}
+    comparison = {k: v for k, v in result.items() if k not in ("notes", "model_info")}
+    try:
+        wording = await _text_completion(
+            "compare",
+            temperature=0.2,
+            prompt=COMPARE_NOTES_PROMPT,
+            response_format=compare_notes_schema(),
+            payload={"context": context, "comparison": comparison},
+            use_cache=use_cache,
+        )
+    except Exception as e:
+        # The numbers are complete without the wording pass; keep templated notes
+        log.warning("compare notes unavailable, using local notes", extra={"error": f"{type(e).__name__}: {e}"})
+        return result
+    if wording.get("notes"):
+        result["notes"] = wording["notes"]
+    result["model_info"] = f"{result['model_info']}+{TEXT.model}-notes"
+    return result
 
 
 SUGGESTIONS_PROMPT = (
@@ -107,26 +659,162 @@ SUGGESTIONS_PROMPT = (
 )
 
 
-def generate_meal_suggestions(payload: Dict[str, Any]) -> Dict[str, Any]:
-    """Generate actionable suggestions for the current meal"""
+SUGGESTION_WORDING_PROMPT = (
+    "You are a diabetes-friendly nutrition coach. The portion changes and macro numbers below are already"
+    " computed and exact; keep every quantity as given and do not add new ones. Rewrite the actions as short,"
+    " friendly, specific sentences the user can act on NOW, keeping their order; you may add at most two tips"
+    " without quantities (swaps, eating order, timing). Give 1-4 rationale lines. Return ONLY JSON per the schema."
+)
+
+
+_SUGGESTION_BUCKETS = tuple(
+    SUGGESTION_BUCKET_KCAL if macro == "kcal" else SUGGESTION_BUCKET_G for macro in OPT_MACROS
+) * 3
+
+
+def _suggestion_features(payload: Dict[str, Any], mode: str) -> Tuple[str, Tuple[int, ...]]:
+    """Similarity cache group (foods, meal, diabetes type) and quantized (targets, meal, remaining) vector"""
+    estimate = clean_estimate(payload.get("estimate"))
+    foods = sorted(normalize_name(i.get("name") or "") for i in estimate.get("items") or [])
+    group = canonical_key(
+        mode=mode,
+        model=TEXT.model,
+        foods=foods,
+        meal_name=(payload.get("meal_name") or "").lower(),
+        diabetes_type=payload.get("diabetes_type"),
+    )
+    values = [
+        float((part or {}).get(macro) or 0)
+        for part in (payload.get("per_meal_targets"), estimate.get("totals"), payload.get("daily_remaining"))
+        for macro in OPT_MACROS
+    ]
+    return group, SimilarityCache.quantize(values, _SUGGESTION_BUCKETS)
+
+
+def _portion_plan(payload: Dict[str, Any]) -> List[Tuple[str, float]]:
+    """(food, gram change) per item from the local optimizer, in the group's food order"""
+    estimate = clean_estimate(payload.get("estimate"))
+    plan = optimize_portions(estimate, payload.get("per_meal_targets") or {}, payload.get("daily_remaining") or {})
+    names = [normalize_name(i.get("name") or "") for i in estimate.get("items") or []]
+    return sorted(zip(names, plan["deltas"].tolist()))
+
+
+def _plan_drift(plan: List[Tuple[str, float]], cached: List[Tuple[str, float]]) -> float:
+    """Largest per-item difference (g) between two portion plans over the same foods"""
+    return max((abs(a[1] - b[1]) for a, b in zip(plan, cached)), default=0.0)
+
+
+def suggestion_cache_stats() -> Dict[str, Any]:
+    stats = suggestion_cache.stats()
+    checks = suggestion_drift["checks"]
+    stats["buckets"] = {"kcal": SUGGESTION_BUCKET_KCAL, "g": SUGGESTION_BUCKET_G}
+    stats["drift"] = {
+        "checks": int(checks),
+        "drifted": int(suggestion_drift["drifted"]),
+        "drift_rate": round(suggestion_drift["drifted"] / checks, 4) if checks else 0.0,
+        "mean_g": round(suggestion_drift["total_g"] / checks, 2) if checks else 0.0,
+        "max_g": round(suggestion_drift["max_g"], 2),
+        "max_allowed_g": SUGGESTION_CACHE_MAX_DRIFT_G,
+    }
+    return stats
+
+
+async def generate_meal_suggestions(
+    payload: Dict[str, Any],
+    mode: Optional[str] = None,
+    use_cache: bool = True,
+) -> Dict[str, Any]:
+    """
+    Generate actionable suggestions for the current meal.
+    Quantities come from nutrition.suggest_meal; the LLM only words them (hybrid).
+    Model-backed modes reuse a near-identical request's result (suggestion_cache).
+    """
+    mode = mode or SUGGESTIONS_MODE
+    # HEAL_CACHE_TTL_SUGGESTIONS=0 turns this off along with the exact cache
+    if mode == "local" or not (use_cache and SUGGESTION_CACHE_ENABLED and suggestion_cache.ttl > 0):
+        return await _model_suggestions(payload, mode, use_cache)
+
+    group, vector = _suggestion_features(payload, mode)
+    plan = _portion_plan(payload)
+    cached, distance = suggestion_cache.lookup(group, vector)
+    if cached is not None:
+        # Drift check: the neighbour's advice must still fit this input
+        drift = _plan_drift(plan, cached["plan"])
+        suggestion_drift["checks"] += 1
+        suggestion_drift["total_g"] += drift
+        suggestion_drift["max_g"] = max(suggestion_drift["max_g"], drift)
+        if drift <= SUGGESTION_CACHE_MAX_DRIFT_G:
+            suggestion_cache_lookups.inc(outcome="hit" if distance == 0 else "near_hit")
+            return cached["result"]
+        suggestion_drift["drifted"] += 1
+        suggestion_cache.reject(distance)
+        suggestion_cache_lookups.inc(outcome="drifted")
+    else:
+        suggestion_cache_lookups.inc(outcome="miss")
+
+    result = await _model_suggestions(payload, mode, use_cache)
+    # Local stand-ins (circuit open, wording failed) aren't worth keeping
+    if result.get("model_info") not in (SUGGESTIONS_MODEL_INFO, FALLBACK_SUGGESTIONS_MODEL_INFO):
+        suggestion_cache.store(group, vector, {"result": result, "plan": plan})
+    return result
+
+
+async def _model_suggestions(payload: Dict[str, Any], mode: str, use_cache: bool) -> Dict[str, Any]:
+    """One mode's answer: the legacy LLM call, or suggest_meal plus the optional wording pass"""
+    if mode == "llm":
+        try:
+            result = await _text_completion(
+                "suggestions",
+                temperature=0.2,
+                prompt=SUGGESTIONS_PROMPT,
+                response_format=suggestions_schema(),
+                payload=payload,
+                use_cache=use_cache,
+            )
+            log.debug("suggestions generated", extra={"actions": len(result.get("actions", []))})
+            return result
+        except CircuitOpen as e:
+            log.warning("serving templated suggestions", extra={"error": str(e)})
+            degraded_counters["suggestions"] += 1
+            return fallback_suggestions(
+                payload.get("estimate") or {},
+                payload.get("per_meal_targets") or {},
+                payload.get("daily_remaining") or {},
+            )
+
+    with stage_seconds.time(stage="portion_optimize", endpoint="suggestions"):
+        result = suggest_meal(
+            payload.get("estimate") or {},
+            payload.get("per_meal_targets") or {},
+            payload.get("daily_remaining") or {},
+        )
+    if mode != "hybrid":
+        return result
+
+    context = {k: v for k, v in payload.items() if k in ("meal_name", "diabetes_type")}
+    items = [
+        {"name": i.get("display_name") or i.get("name"), "grams": i.get("grams")}
+        for i in clean_estimate(payload.get("estimate"))["items"]
+    ]
     try:
-        print(f"🤖 Calling GPT-4o-mini for suggestions...")
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",
+        wording = await _text_completion(
+            "suggestions",
             temperature=0.2,
-            response_format=suggestions_schema(),
-            messages=[
-                {"role": "system", "content": SUGGESTIONS_PROMPT},
-                {"role": "user", "content": json.dumps(payload, ensure_ascii=False)},
-            ],
-            timeout=60_000,
+            prompt=SUGGESTION_WORDING_PROMPT,
+            response_format=suggestion_wording_schema(),
+            payload={"context": context, "items": items, "suggestions": {k: v for k, v in result.items() if k != "model_info"}},
+            use_cache=use_cache,
         )
-        result = json.loads(resp.choices[0].message.content)
-        print(f"✅ Suggestions generated: {len(result.get('actions', []))} actions")
-        return result
     except Exception as e:
-        print(f"❌ Error generating suggestions: {type(e).__name__}: {str(e)}")
-        raise
+        # The actions are complete without the wording pass; keep the templated text
+        log.warning("suggestion wording unavailable, using local text", extra={"error": f"{type(e).__name__}: {e}"})
+        return result
+    if wording.get("actions"):
+        result["actions"] = wording["actions"][:8]
+    if wording.get("rationale"):
+        result["rationale"] = wording["rationale"]
+    result["model_info"] = f"{result['model_info']}+{TEXT.model}-wording"
+    return result
 
 
 REMINDER_PROMPT = (
@@ -137,19 +825,42 @@ REMINDER_PROMPT = (
 )
 
 
-def generate_reminder_copy(payload: Dict[str, Any]) -> Dict[str, Any]:
-    """Generate short notification copy for reminders"""
-    resp = client.chat.completions.create(
-        model="gpt-4o-mini",
+async def _llm_reminder_copy(payload: Dict[str, Any], use_cache: bool = True) -> Dict[str, Any]:
+    return await _text_completion(
+        "copy",
         temperature=0.5,
+        prompt=REMINDER_PROMPT,
         response_format=reminder_copy_schema(),
-        messages=[
-            {"role": "system", "content": REMINDER_PROMPT},
-            {"role": "user", "content": json.dumps(payload, ensure_ascii=False)},
-        ],
-        timeout=45_000,
+        payload=payload,
+        use_cache=use_cache,
     )
-    return json.loads(resp.choices[0].message.content)
+
+
+async def generate_reminder_copy(payload: Dict[str, Any], use_cache: bool = True) -> Dict[str, Any]:
+    """
+    Generate short notification copy for reminders.
+    In bank mode, templates are filled and rotated locally; the LLM only
+    refreshes the bank in the background.
+    """
+    # Unknown locales never reach the bank or the model as-is
+    payload = {**payload, "locale": normalize_locale(payload.get("locale"))}
+    if COPY_MODE == "bank":
+        result = await copy_bank.render(payload)
+        if result is not None:
+            return result
+    try:
+        return await _llm_reminder_copy(payload, use_cache=use_cache)
+    except CircuitOpen:
+        # The bank's seed lines still cover every copy type
+        result = await copy_bank.render(payload)
+        if result is None:
+            raise
+        degraded_counters["copy"] += 1
+        return result
+
+
+# Template refreshes must reach the model, not the response cache
+copy_bank.generator = lambda payload: _llm_reminder_copy(payload, use_cache=False)
 
 
 SUMMARY_PROMPT = (
@@ -160,17 +871,22 @@ SUMMARY_PROMPT = (
 )
 
 
-def generate_daily_summary(payload: Dict[str, Any]) -> Dict[str, Any]:
+async def generate_daily_summary(payload: Dict[str, Any], use_cache: bool = True) -> Dict[str, Any]:
     """Generate end-of-day summary and next-day focus"""
-    resp = client.chat.completions.create(
-        model="gpt-4o-mini",
-        temperature=0.2,
-        response_format=daily_summary_schema(),
-        messages=[
-            {"role": "system", "content": SUMMARY_PROMPT},
-            {"role": "user", "content": json.dumps(payload, ensure_ascii=False)},
-        ],
-        timeout=60_000,
-    )
-    return json.loads(resp.choices[0].message.content)
+    try:
+        return await _text_completion(
+            "daily_summary",
+            temperature=0.2,
+            prompt=SUMMARY_PROMPT,
+            response_format=daily_summary_schema(),
+            payload=payload,
+            use_cache=use_cache,
+        )
+    except CircuitOpen:
+        degraded_counters["daily_summary"] += 1
+        return fallback_daily_summary(
+            payload.get("daily_targets") or {},
+            payload.get("total_consumed") or {},
+            payload.get("meals") or [],
+        )
 
@@ -0,0 +1,179 @@
+"""
+Structured logging: JSON lines written by a background thread, request IDs,
+sampling of success-path records
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import queue
+import random
+import logging
+import contextvars
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, MutableMapping, Optional, Tuple
+
+# -------- Config --------
+LOG_LEVEL = os.getenv("HEAL_LOG_LEVEL", "INFO").upper()
+# Share of requests whose below-WARNING records are kept; warnings and errors always are
+SUCCESS_SAMPLE_RATE = float(os.getenv("HEAL_LOG_SAMPLE_RATE", "1.0"))
+REQUEST_ID_HEADER = "x-request-id"
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("heal_request_id", default=None)
+_sampled_var: contextvars.ContextVar[bool] = contextvars.ContextVar("heal_log_sampled", default=True)
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+_listener: Optional[QueueListener] = None
+_handler: Optional[QueueHandler] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; `extra=` fields become top-level keys"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": round(record.created, 3),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _ContextFilter(logging.Filter):
+    """Stamp the request ID and drop success-path records of unsampled requests"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING and not _sampled_var.get():
+            return False
+        record.request_id = request_id_var.get()
+        return True
+
+
+class _BackgroundQueueHandler(QueueHandler):
+    """
+    Enqueue without formatting: the listener thread does the JSON encoding
+    and the stdout write. Only tracebacks are rendered here, while the
+    frames still exist.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def configure_logging() -> None:
+    """Route the `heal` logger tree through a queue to a JSON-lines stdout writer"""
+    global _listener, _handler
+    if _listener is not None:
+        return
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter())
+    _listener = QueueListener(log_queue, stream, respect_handler_level=False)
+    _listener.start()
+
+    _handler = _BackgroundQueueHandler(log_queue)
+    _handler.addFilter(_ContextFilter())
+    root = logging.getLogger("heal")
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(_handler)
+    root.propagate = False
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and detach the queue (called at app shutdown)"""
+    global _listener, _handler
+    if _listener is not None:
+        logging.getLogger("heal").removeHandler(_handler)
+        _listener.stop()
+        _listener = _handler = None
+
+
+class SafeExtraAdapter(logging.LoggerAdapter):
+    """
+    Logger whose `extra=` keys can't collide with LogRecord attributes:
+    reserved ones (filename, name, args, ...) are logged as `extra_<key>`
+    instead of raising KeyError inside the caller's request
+    """
+
+    def process(self, msg: Any, kwargs: MutableMapping[str, Any]) -> Tuple[Any, MutableMapping[str, Any]]:
+        extra = kwargs.get("extra")
+        if extra:
+            kwargs["extra"] = {f"extra_{k}" if k in _RECORD_ATTRS else k: v for k, v in extra.items()}
+        return msg, kwargs
+
+
+def get_logger(name: str) -> SafeExtraAdapter:
+    # Modules log at import time (e.g. transport config warnings), so the
+    # first logger configures the pipeline
+    configure_logging()
+    return SafeExtraAdapter(logging.getLogger(f"heal.{name}"), {})
+
+
+access_log = get_logger("access")
+
+
+class RequestContextMiddleware:
+    """
+    ASGI middleware: adopt or mint a request ID (echoed as X-Request-ID),
+    decide once per request whether its success-path records are sampled,
+    and write one access record per request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = None
+        for key, value in scope["headers"]:
+            if key.decode("latin-1") == REQUEST_ID_HEADER:
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        id_token = request_id_var.set(request_id)
+        sampled_token = _sampled_var.set(SUCCESS_SAMPLE_RATE >= 1.0 or random.random() < SUCCESS_SAMPLE_RATE)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            access_log.log(
+                logging.WARNING if status >= 500 else logging.INFO,
+                "request",
+                extra={
+                    "method": scope["method"],
+                    "route": getattr(route, "path", scope["path"]),
+                    "status": status,
+                    "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+                },
+            )
+            _sampled_var.reset(sampled_token)
+            request_id_var.reset(id_token)
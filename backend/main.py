@@ -1,17 +1,45 @@
 """
 FastAPI application entry point
 """
-from fastapi import FastAPI, UploadFile, File
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional, Literal
+from fastapi import FastAPI, UploadFile, File, Header, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, Response
 
 from .routes import (
     estimate_meal,
+    estimate_stream_endpoint,
+    analyze_meal_endpoint,
     calc_budget_endpoint,
+    batch_budget_endpoint,
+    food_search_endpoint,
     compare_meal_endpoint,
     suggestions_endpoint,
     copy_endpoint,
     daily_summary_endpoint,
 )
+from .llm import (
+    estimate_cache,
+    response_cache_stats,
+    suggestion_cache_stats,
+    singleflight,
+    warm_up_upstream,
+    upstream_pool_stats,
+    close_upstream,
+    COPY_MODE,
+    degraded_counters,
+)
+from .copybank import copy_bank
+from .ratelimit import rate_limit_stats
+from .latency import start_deadline, latency
+from .breaker import breaker_stats
+from .cascade import cascade_stats
+from .metrics import MetricsMiddleware, render_metrics, stage_seconds
+from .logs import RequestContextMiddleware, configure_logging, shutdown_logging, get_logger
+from .profiling import PROFILING_ENABLED, ProfilingMiddleware, profile_store, authorized
+from .runtime import LOOP_LAG_INTERVAL_S, loop_lag, runtime_stats
 from .models import (
     BudgetRequest,
     CompareMealRequest,
@@ -20,7 +48,27 @@ from .models import (
     DailySummaryRequest,
 )
 
-app = FastAPI(title="Heal - Diabetes Nutrition Assistant")
+log = get_logger("main")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    configure_logging()
+    warmed = await warm_up_upstream()
+    log.info("upstream pool warmed", extra={"probes_answered": warmed})
+    background = []
+    if LOOP_LAG_INTERVAL_S > 0:
+        background.append(asyncio.create_task(loop_lag.run()))
+    if COPY_MODE == "bank":
+        background.append(asyncio.create_task(copy_bank.refresh_loop()))
+    yield
+    for task in background:
+        task.cancel()
+    await close_upstream()
+    shutdown_logging()
+
+
+app = FastAPI(title="Heal - Diabetes Nutrition Assistant", lifespan=lifespan)
 
 # CORS for iOS app
 app.add_middleware(
@@ -30,57 +78,158 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+# Only installed when configured, so requests pay nothing when profiling is off
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+# Added last so it runs outermost: the request ID covers everything below
+app.add_middleware(RequestContextMiddleware)
 
 
 # -------- Routes --------
 from fastapi import Request, Form
 
+
+def cache_allowed(cache_control: Optional[str] = Header(None)) -> bool:
+    """Clients opt out of cached LLM responses with `Cache-Control: no-cache`"""
+    if not cache_control:
+        return True
+    directives = cache_control.lower()
+    return "no-cache" not in directives and "no-store" not in directives
+
+
+def request_deadline(endpoint: str):
+    """
+    Dependency that starts the endpoint's latency budget, shortened by the
+    client's `X-Request-Deadline` header; LLM calls below inherit it
+    """
+    async def dependency(x_request_deadline: Optional[str] = Header(None)) -> float:
+        try:
+            return start_deadline(endpoint, x_request_deadline)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return dependency
+
+
 @app.post("/estimate")
-async def estimate(request: Request, image: UploadFile = File(None)):
-    # Debug: print all form fields
+async def estimate(
+    request: Request,
+    _budget: float = Depends(request_deadline("estimate")),
+):
+    # No File() parameter: FastAPI would parse the multipart body before this
+    # runs, and the multipart_parse stage would time a cached no-op
     try:
-        form_data = await request.form()
-        print(f"📋 Form fields received: {list(form_data.keys())}")
+        with stage_seconds.time(stage="multipart_parse", endpoint="estimate"):
+            form_data = await request.form()
+        log.debug("form fields received", extra={"form_fields": list(form_data.keys())})
         
         # Try to get image from different possible field names
         img = form_data.get("image") or form_data.get("file") or form_data.get("photo")
         
         if img and hasattr(img, 'read'):
-            print(f"✅ Found image in form_data under key: {[k for k in form_data.keys() if form_data[k] == img][0]}")
             return await estimate_meal(img)
-        elif image:
-            return await estimate_meal(image)
         else:
-            print(f"❌ No image found. Form keys: {list(form_data.keys())}")
             raise HTTPException(status_code=400, detail=f"No image file in form data. Received keys: {list(form_data.keys())}")
     except Exception as e:
-        print(f"❌ Error parsing form: {e}")
+        log.warning("estimate request failed", extra={"error": f"{type(e).__name__}: {e}"})
         raise
 
 
+@app.post("/estimate/stream")
+async def estimate_stream(
+    image: UploadFile = File(...),
+    context: Optional[str] = Form(None),
+    format: Literal["sse", "ndjson"] = "sse",
+    use_cache: bool = Depends(cache_allowed),
+    _budget: float = Depends(request_deadline("estimate_stream")),
+):
+    return await estimate_stream_endpoint(image, context, format, use_cache)
+
+
+@app.post("/meal/analyze")
+async def meal_analyze(
+    image: UploadFile = File(...),
+    context: str = Form(...),
+    use_cache: bool = Depends(cache_allowed),
+    _budget: float = Depends(request_deadline("analyze")),
+):
+    return await analyze_meal_endpoint(image, context, use_cache)
+
+
 @app.post("/budget")
-def budget(req: BudgetRequest):
-    return calc_budget_endpoint(req)
+async def budget(req: BudgetRequest):
+    return await calc_budget_endpoint(req)
+
+
+@app.post("/budget/batch")
+async def budget_batch(request: Request):
+    return await batch_budget_endpoint(request)
+
+
+@app.get("/foods/search")
+async def foods_search(q: str, limit: int = 10):
+    return await food_search_endpoint(q, limit)
 
 
 @app.post("/llm/compare")
-def compare(req: CompareMealRequest):
-    return compare_meal_endpoint(req)
+async def compare(
+    req: CompareMealRequest,
+    use_cache: bool = Depends(cache_allowed),
+    _budget: float = Depends(request_deadline("compare")),
+):
+    return await compare_meal_endpoint(req, use_cache)
 
 
 @app.post("/llm/suggestions")
-def suggestions(req: SuggestionsRequest):
-    return suggestions_endpoint(req)
+async def suggestions(
+    req: SuggestionsRequest,
+    use_cache: bool = Depends(cache_allowed),
+    _budget: float = Depends(request_deadline("suggestions")),
+):
+    return await suggestions_endpoint(req, use_cache)
 
 
 @app.post("/llm/copy")
-def copy(req: CopyRequest):
-    return copy_endpoint(req)
+async def copy(
+    req: CopyRequest,
+    use_cache: bool = Depends(cache_allowed),
+    _budget: float = Depends(request_deadline("copy")),
+):
+    return await copy_endpoint(req, use_cache)
 
 
 @app.post("/llm/daily_summary")
-def daily_summary(req: DailySummaryRequest):
-    return daily_summary_endpoint(req)
+async def daily_summary(
+    req: DailySummaryRequest,
+    use_cache: bool = Depends(cache_allowed),
+    _budget: float = Depends(request_deadline("daily_summary")),
+):
+    return await daily_summary_endpoint(req, use_cache)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus text exposition of request, stage, upstream and token metrics"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/admin/profiles")
+def list_profiles(x_heal_profile: Optional[str] = Header(None)):
+    """Recent request profiles (requires the HEAL_PROFILE_TOKEN header)"""
+    if not authorized(x_heal_profile):
+        raise HTTPException(status_code=404, detail="Not Found")
+    return {"profiles": profile_store.list()}
+
+
+@app.get("/admin/profiles/{profile_id}")
+def get_profile(profile_id: str, x_heal_profile: Optional[str] = Header(None)):
+    if not authorized(x_heal_profile):
+        raise HTTPException(status_code=404, detail="Not Found")
+    entry = profile_store.get(profile_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Unknown profile")
+    media_type = "application/json" if entry["format"] == "speedscope" else "text/html"
+    return Response(entry["body"], media_type=media_type)
 
 
 @app.get("/health")
@@ -88,6 +237,35 @@ def health():
     return {"status": "ok"}
 
 
+@app.get("/cache/stats")
+def cache_stats():
+    return {
+        "estimate": estimate_cache.stats(),
+        "responses": response_cache_stats(),
+        "suggestions": suggestion_cache_stats(),
+        "copy_bank": copy_bank.stats(),
+        "singleflight": singleflight.stats(),
+    }
+
+
+@app.get("/upstream/stats")
+def upstream_stats():
+    return {
+        "pool": upstream_pool_stats(),
+        "rate_limits": rate_limit_stats(),
+        "latency": latency.stats(),
+        "breakers": breaker_stats(),
+        "degraded_responses": degraded_counters,
+        "estimate_cascade": cascade_stats.stats(),
+    }
+
+
+@app.get("/runtime/stats")
+def runtime(window: Optional[float] = None):
+    """This worker's pid, memory and event-loop lag (over the last `window` seconds if given)"""
+    return runtime_stats(window)
+
+
 @app.post("/test-upload")
 async def test_upload(image: UploadFile = File(None)):
     """Test endpoint to debug image upload"""
@@ -0,0 +1,221 @@
+"""
+Prometheus-style counters and histograms for the hot path, rendered in the
+text exposition format on GET /metrics (no client library needed)
+"""
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+# Stage timings are milliseconds-scale locally and seconds-scale upstream
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+LOOP_LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+UPSTREAM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 7.5, 10.0, 15.0, 20.0, 30.0, 45.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        # Observed from the event loop and the image thread pool
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_number(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Point-in-time value, read from `callback` at render time"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, callback: Callable[[], float]):
+        super().__init__(name, help)
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        return super().render() + [f"{self.name} {_format_number(self.callback())}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = STAGE_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: per-bucket (non-cumulative) counts + overflow, sum
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+            counts[index] += 1
+            self._sums[key] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            series = sorted((key, list(counts), self._sums[key]) for key, counts in self._counts.items())
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = _format_labels(self.labels, key, f'le="{_format_number(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            cumulative += counts[-1]
+            inf = _format_labels(self.labels, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{inf} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_number(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+REGISTRY: List[_Metric] = []
+
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# -------- Heal metrics --------
+http_requests = Histogram(
+    "heal_http_request_seconds",
+    "Request latency by route, method and status code",
+    ("route", "method", "status"),
+    buckets=UPSTREAM_BUCKETS,
+)
+stage_seconds = Histogram(
+    "heal_stage_seconds",
+    "Local hot-path stage latency (multipart_parse, image_decode, image_encode, image_hash, base64, json_parse, response_serialize)",
+    ("stage", "endpoint"),
+)
+upstream_seconds = Histogram(
+    "heal_upstream_seconds",
+    "Latency of one upstream LLM attempt by model, endpoint and outcome",
+    ("model", "endpoint", "outcome"),
+    buckets=UPSTREAM_BUCKETS,
+)
+upstream_tokens = Counter(
+    "heal_upstream_tokens_total",
+    "Upstream token usage reported in resp.usage, by model, endpoint and type (prompt, completion)",
+    ("model", "endpoint", "type"),
+)
+
+estimate_tier_seconds = Histogram(
+    "heal_estimate_tier_seconds",
+    "Photo estimate latency in cascade mode by the tier that answered (fast, full)",
+    ("tier",),
+    buckets=UPSTREAM_BUCKETS,
+)
+estimate_escalations = Counter(
+    "heal_estimate_escalations_total",
+    "Cascade fast-pass estimates escalated to the full model, by reason",
+    ("reason",),
+)
+
+suggestion_cache_lookups = Counter(
+    "heal_suggestion_cache_lookups_total",
+    "Suggestion similarity-cache lookups by outcome (hit, near_hit, miss, drifted)",
+    ("outcome",),
+)
+
+loop_lag_seconds = Histogram(
+    "heal_event_loop_lag_seconds",
+    "How late the event loop woke a periodic timer (time it spent blocked)",
+    buckets=LOOP_LAG_BUCKETS,
+)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording heal_http_request_seconds per route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Label by route template, never the raw path, to bound cardinality
+            route = scope.get("route")
+            http_requests.observe(
+                time.perf_counter() - started,
+                route=getattr(route, "path", "unmatched"),
+                method=scope["method"],
+                status=str(status),
+            )
@@ -33,6 +33,17 @@ class CompareMealRequest(BaseModel):
     diabetes_type: Optional[Literal["T1D", "T2D", "unknown"]] = None
 
 
+class AnalyzeMealRequest(BaseModel):
+    """Targets/context sent as the `context` JSON form field of /meal/analyze"""
+    per_meal_targets: Macros
+    daily_targets: Macros
+    daily_consumed_so_far: Macros
+    meal_index: int = Field(..., ge=1)
+    meals_per_day: int = Field(..., ge=1)
+    meal_name: Optional[str] = None
+    diabetes_type: Optional[Literal["T1D", "T2D", "unknown"]] = None
+
+
 class SuggestionsRequest(BaseModel):
     estimate: Dict[str, Any]
     per_meal_targets: Macros
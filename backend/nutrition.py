@@ -1,19 +1,27 @@
 """
-Deterministic nutrition calculations (calorie budget, macro splits)
+Deterministic nutrition calculations (calorie budget, macro splits, meal comparison,
+photo estimates from the local food table, portion suggestions, degraded LLM responses)
 """
-from typing import Dict
+import re
+import math
+from typing import Dict, Any, List, Sequence, Optional
+
+import numpy as np
+
+from .foods import FoodTable, food_table, NUTRIENTS, CATEGORIES, COOKING_OIL_G, normalize_method
+
+ACTIVITY_FACTORS = {
+    "sedentary": 1.2,
+    "light": 1.375,
+    "moderate": 1.55,
+    "active": 1.725,
+    "very_active": 1.9,
+}
 
 
 def activity_factor(level: str) -> float:
     """Convert activity level to TDEE multiplier"""
-    mapping = {
-        "sedentary": 1.2,
-        "light": 1.375,
-        "moderate": 1.55,
-        "active": 1.725,
-        "very_active": 1.9,
-    }
-    return mapping.get(level, 1.2)
+    return ACTIVITY_FACTORS.get(level, 1.2)
 
 
 def macro_split(diabetes_type: str) -> Dict[str, float]:
@@ -71,3 +79,575 @@ def calculate_budget(
         "meals_per_day": meals_per_day,
     }
 
+
+def _round1(values: np.ndarray) -> List[float]:
+    """
+    Vectorized round(x, 1) that agrees bit-for-bit with Python's round().
+    rint(x * 10) / 10 matches except where x * 10 sits on a .5 tie after
+    floating-point scaling; those few values fall back to round().
+    """
+    scaled = values * 10
+    out = np.rint(scaled) / 10
+    near_tie = np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)
+    for i in near_tie:
+        out[i] = round(float(values[i]), 1)
+    return out.tolist()
+
+
+def _lookup(keys: Sequence[str], table: Dict[str, float], default: float) -> np.ndarray:
+    """Map string labels to a float array via the given table"""
+    return np.fromiter((table.get(k, default) for k in keys), dtype=np.float64, count=len(keys))
+
+
+def calculate_budget_batch(
+    height_cm: Sequence[float],
+    weight_kg: Sequence[float],
+    age: Sequence[int],
+    sex: Sequence[str],
+    exercise_level: Sequence[str],
+    diabetes_type: Sequence[str],
+    meals_per_day: Optional[Sequence[int]] = None,
+) -> List[Dict]:
+    """
+    calculate_budget over many profiles in one vectorized pass.
+    Arguments are parallel sequences; results match the scalar function
+    exactly (same operation order, same rounding) and keep input order.
+    """
+    height = np.asarray(height_cm, dtype=np.float64)
+    weight = np.asarray(weight_kg, dtype=np.float64)
+    ages = np.asarray(age, dtype=np.float64)
+    n = height.shape[0]
+    meals = np.full(n, 3, dtype=np.int64) if meals_per_day is None else np.asarray(meals_per_day, dtype=np.int64)
+    sex_offset = np.where(np.asarray(sex, dtype=object) == "male", 5.0, -161.0)
+
+    # Mifflin-St Jeor BMR
+    bmr = 10 * weight + 6.25 * height - 5 * ages + sex_offset
+    tdee = bmr * _lookup(exercise_level, ACTIVITY_FACTORS, 1.2)
+
+    split_tables = {d: macro_split(d) for d in set(diabetes_type)}
+    protein_split = _lookup(diabetes_type, {d: v["protein"] for d, v in split_tables.items()}, 0.0)
+    carb_split = _lookup(diabetes_type, {d: v["carb"] for d, v in split_tables.items()}, 0.0)
+    fat_split = _lookup(diabetes_type, {d: v["fat"] for d, v in split_tables.items()}, 0.0)
+
+    daily_kcal = np.asarray(_round1(tdee))
+    daily_protein = np.asarray(_round1(tdee * protein_split / 4))
+    daily_carb = np.asarray(_round1(tdee * carb_split / 4))
+    daily_fat = np.asarray(_round1(tdee * fat_split / 9))
+
+    columns = zip(
+        daily_kcal.tolist(),
+        daily_protein.tolist(),
+        daily_carb.tolist(),
+        daily_fat.tolist(),
+        _round1(daily_protein / meals),
+        _round1(daily_carb / meals),
+        _round1(daily_fat / meals),
+        _round1(daily_kcal / meals),
+        meals.tolist(),
+        diabetes_type,
+    )
+    return [
+        {
+            "daily_budget": {"kcal": kcal, "protein_g": protein, "carb_g": carb, "fat_g": fat},
+            "per_meal_targets": {"protein_g": m_protein, "carb_g": m_carb, "fat_g": m_fat, "kcal": m_kcal},
+            "macro_split": dict(split_tables[dtype]),
+            "meals_per_day": n_meals,
+        }
+        for kcal, protein, carb, fat, m_protein, m_carb, m_fat, m_kcal, n_meals, dtype in columns
+    ]
+
+
+
+# -------- Meal comparison --------
+COMPARE_MACROS = ("protein_g", "carb_g", "fat_g")
+MACRO_LABELS = {"protein_g": "Protein", "carb_g": "Carbs", "fat_g": "Fat"}
+# A meal within +/-10% of its per-meal target counts as on target
+COMPARE_TOLERANCE = 0.10
+COMPARE_MODEL_INFO = "heal-local-compare-v1"
+
+
+def _percent(value: float, target: float) -> float:
+    return round(value / target * 100, 1) if target > 0 else 0.0
+
+
+def macro_status(actual: float, target: float) -> str:
+    """Classify a per-meal macro as under / on_target / over"""
+    if target <= 0:
+        return "over" if actual > 0 else "on_target"
+    if actual > target * (1 + COMPARE_TOLERANCE):
+        return "over"
+    if actual < target * (1 - COMPARE_TOLERANCE):
+        return "under"
+    return "on_target"
+
+
+def compare_meal(
+    per_meal_targets: Dict[str, float],
+    daily_targets: Dict[str, float],
+    daily_consumed_so_far: Dict[str, float],
+    current_meal: Dict[str, float],
+) -> Dict[str, Any]:
+    """
+    Compare a meal against per-meal and daily targets.
+    Fills every field of meal_compare_schema with exact arithmetic;
+    `notes` gets plain templated sentences that an LLM pass may replace.
+    """
+    per_meal: Dict[str, Any] = {}
+    daily: Dict[str, Any] = {}
+    over_per_meal: List[str] = []
+    over_daily: List[str] = []
+    notes: List[str] = []
+
+    for macro in COMPARE_MACROS:
+        target = float(per_meal_targets.get(macro) or 0)
+        actual = float(current_meal.get(macro) or 0)
+        status = macro_status(actual, target)
+        per_meal[macro] = {
+            "target": round(target, 1),
+            "actual": round(actual, 1),
+            "difference": round(actual - target, 1),
+            "status": status,
+            "percent_of_target": _percent(actual, target),
+        }
+        if status == "over":
+            over_per_meal.append(macro)
+            notes.append(
+                f"{MACRO_LABELS[macro]}: {actual - target:.1f} g over the per-meal target of {target:.1f} g."
+            )
+
+        target_daily = float(daily_targets.get(macro) or 0)
+        consumed = float(daily_consumed_so_far.get(macro) or 0)
+        after = consumed + actual
+        exceed = max(0.0, after - target_daily)
+        daily[macro] = {
+            "target_daily": round(target_daily, 1),
+            "consumed_so_far": round(consumed, 1),
+            "after_meal": round(after, 1),
+            "remaining": round(max(0.0, target_daily - after), 1),
+            "will_exceed_by": round(exceed, 1),
+            "percent_of_daily_target_after_meal": _percent(after, target_daily),
+        }
+        if exceed > 0:
+            over_daily.append(macro)
+            notes.append(
+                f"{MACRO_LABELS[macro]}: the daily target will be exceeded by {exceed:.1f} g after this meal."
+            )
+
+    if not notes:
+        notes.append("This meal fits within your per-meal and daily targets.")
+
+    return {
+        "per_meal_evaluation": per_meal,
+        "daily_evaluation_post_meal": daily,
+        "flags": {
+            "per_meal_exceeded_any": bool(over_per_meal),
+            "daily_exceeded_any": bool(over_daily),
+            "over_per_meal": over_per_meal,
+            "over_daily": over_daily,
+        },
+        "progress_bars": {
+            "per_meal_percent": {m: per_meal[m]["percent_of_target"] for m in COMPARE_MACROS},
+            "daily_percent_after_meal": {
+                m: daily[m]["percent_of_daily_target_after_meal"] for m in COMPARE_MACROS
+            },
+        },
+        "notes": notes,
+        "model_info": COMPARE_MODEL_INFO,
+    }
+
+
+# -------- Estimate input --------
+# Estimates reach us from the model and, on /llm/suggestions, straight from
+# the client: items may not be objects and numbers may be strings ("150g")
+_NUMBER_RE = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)")
+_ITEM_TEXT = ("name", "display_name", "category", "cooking_method")
+
+
+def _number(value: Any) -> float:
+    """Finite, non-negative float: numbers as is, strings by their leading number, anything else 0"""
+    if isinstance(value, bool):
+        return 0.0
+    if isinstance(value, str):
+        match = _NUMBER_RE.search(value)
+        value = match.group() if match else 0.0
+    try:
+        number = float(value) if value is not None else 0.0
+    except (TypeError, ValueError):
+        return 0.0
+    return number if math.isfinite(number) and number > 0 else 0.0
+
+
+def clean_items(items: Any) -> List[Dict[str, Any]]:
+    """Estimate items that are objects, with text fields as str and numbers coerced by _number"""
+    if not isinstance(items, (list, tuple)):
+        return []
+    cleaned = []
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        item = dict(item)
+        for field in _ITEM_TEXT:
+            if field in item and not isinstance(item[field], str):
+                item[field] = "" if item[field] is None else str(item[field])
+        item["grams"] = _number(item.get("grams"))
+        if "confidence" in item:
+            item["confidence"] = _number(item["confidence"])
+        per_100g = item.get("nutrition_per_100g")
+        item["nutrition_per_100g"] = (
+            {m: _number(v) for m, v in per_100g.items()} if isinstance(per_100g, dict) else {}
+        )
+        cleaned.append(item)
+    return cleaned
+
+
+def clean_estimate(estimate: Any) -> Dict[str, Any]:
+    """calorie_estimate with clean_items and numeric totals, whatever shape it arrived in"""
+    estimate = estimate if isinstance(estimate, dict) else {}
+    totals = estimate.get("totals")
+    totals = totals if isinstance(totals, dict) else {}
+    return {**estimate, "items": clean_items(estimate.get("items")), "totals": {m: _number(totals.get(m)) for m in NUTRIENTS}}
+
+
+# -------- Photo estimates from the food table --------
+# HEAL_ESTIMATE_MODE=lookup: the vision model names foods and grams only;
+# densities come from backend/data/foods.csv and all arithmetic happens here
+FOODS_MODEL_INFO = "heal-foods-v1"
+# Relative kcal uncertainty of an item: a floor, plus this much more as its
+# confidence drops to 0; foods missing from the table get a flat, wider band
+RANGE_BASE = 0.10
+RANGE_PER_DOUBT = 0.30
+RANGE_UNMATCHED = 0.50
+_KCAL, _FAT = NUTRIENTS.index("kcal"), NUTRIENTS.index("fat_g")
+_KCAL_PER_G_FAT = 9.0
+
+
+def _find_item(table: FoodTable, item: Dict[str, Any]) -> int:
+    category = item.get("category")
+    row = table.find(item.get("name") or "", category)
+    return row if row >= 0 else table.find(item.get("display_name") or "", category)
+
+
+def estimate_from_items(
+    items: Sequence[Dict[str, Any]],
+    assumptions: Sequence[str] = (),
+    warnings: Sequence[str] = (),
+    model_info: str = FOODS_MODEL_INFO,
+    table: FoodTable = food_table,
+) -> Dict[str, Any]:
+    """
+    Build a full calorie_estimate from identified items (name, category,
+    cooking_method, grams, confidence): per-item densities and macros,
+    totals and calories_range, for the whole plate in one array pass.
+    """
+    items = clean_items(items)
+    n = len(items)
+    rows = np.fromiter((_find_item(table, i) for i in items), dtype=np.int64, count=n)
+    matched = rows >= 0
+    safe_rows = np.where(matched, rows, 0)
+    guessed = np.fromiter(
+        (CATEGORIES.index(i.get("category")) if i.get("category") in CATEGORIES else CATEGORIES.index("mixed") for i in items),
+        dtype=np.int64, count=n,
+    )
+    categories = np.where(matched, table.category_codes[safe_rows], guessed)
+    density = np.where(
+        matched[:, None], table.densities[safe_rows], table.category_densities[categories]
+    ).astype(np.float64)
+
+    # Oil the cooking method adds beyond what the table row already includes
+    methods = [normalize_method(i.get("cooking_method")) for i in items]
+    oil = np.fromiter((COOKING_OIL_G[m] for m in methods), dtype=np.float64, count=n)
+    oil = np.maximum(oil - np.where(matched, table.method_oil[safe_rows], 0.0), 0.0)
+    density[:, _FAT] += oil
+    density[:, _KCAL] += oil * _KCAL_PER_G_FAT
+
+    grams = np.fromiter((i["grams"] for i in items), dtype=np.float64, count=n)
+    confidence = np.clip(np.fromiter((i.get("confidence", 0.0) for i in items), dtype=np.float64, count=n), 0.0, 1.0)
+    macros = density * grams[:, None] / 100
+    totals = macros.sum(axis=0)
+    band = np.where(matched, RANGE_BASE + RANGE_PER_DOUBT * (1 - confidence), RANGE_UNMATCHED)
+    spread = float((macros[:, _KCAL] * band).sum())
+
+    density_cols = [_round1(density[:, j]) for j in range(len(NUTRIENTS))]
+    item_kcal = _round1(macros[:, _KCAL])
+    out_items = []
+    unmatched = []
+    for k, item in enumerate(items):
+        category = CATEGORIES[int(categories[k])]
+        if matched[k]:
+            notes = [f"Density: {table.names[rows[k]]} (local food table)"]
+        else:
+            notes = [f"Not in the local food table; average {category} density used"]
+            unmatched.append(item.get("display_name") or item.get("name") or "item")
+        if oil[k] > 0:
+            notes.append(f"+{oil[k]:g} g oil per 100 g for {methods[k].replace('_', '-')}")
+        out_items.append({
+            "name": table.names[rows[k]] if matched[k] else item.get("name") or "",
+            "display_name": item.get("display_name") or item.get("name") or "",
+            "category": category,
+            "cooking_method": item.get("cooking_method") or "",
+            "grams": round(float(grams[k]), 1),
+            "kcal": item_kcal[k],
+            "nutrition_per_100g": {m: density_cols[j][k] for j, m in enumerate(NUTRIENTS)},
+            "confidence": round(float(confidence[k]), 2),
+            "notes": notes,
+        })
+
+    total_values = _round1(totals)
+    out_warnings = list(warnings)
+    if unmatched:
+        out_warnings.append(f"Estimated from category averages (not in the local food table): {', '.join(unmatched)}")
+    return {
+        "items": out_items,
+        "totals": {m: total_values[j] for j, m in enumerate(NUTRIENTS)},
+        "calories_range": {
+            "low": round(max(0.0, float(totals[_KCAL]) - spread), 1),
+            "high": round(float(totals[_KCAL]) + spread, 1),
+        },
+        "assumptions": list(assumptions),
+        "warnings": out_warnings,
+        "model_info": model_info,
+    }
+
+
+# -------- Portion optimizer --------
+# /llm/suggestions: gram changes per item that bring the meal toward its
+# targets, solved as a small box-constrained least-squares problem
+SUGGESTIONS_MODEL_INFO = "heal-local-suggestions-v1"
+OPT_MACROS = ("kcal", "protein_g", "fat_g", "carb_g")
+OPT_LABELS = {"kcal": "Energy", **MACRO_LABELS}
+OPT_UNITS = {"kcal": "kcal", "protein_g": "g", "fat_g": "g", "carb_g": "g"}
+# Weight of each macro's relative miss; carbs drive glucose, so they count most
+OPT_WEIGHTS = np.array([1.0, 0.8, 1.0, 1.5])
+# Cost of changing a portion by 100% of its size, relative to missing a target by 100%
+OPT_CHANGE_PENALTY = 0.05
+# Never suggest cutting more than this share of one item, or adding more than this share
+MAX_PORTION_CUT = 0.5
+MAX_PORTION_ADD = 0.5
+# Vegetables (by category, or few kcal with a real share from protein) are never cut
+VEG_MAX_KCAL_DENSITY = 60.0
+VEG_MIN_PROTEIN_SHARE = 0.15
+# Only vegetables and lean protein may grow
+LEAN_MIN_PROTEIN_SHARE = 0.35
+LEAN_MAX_FAT_SHARE = 0.35
+# Smaller changes aren't worth telling anyone about
+MIN_ACTION_G = 10.0
+
+
+def _bounded_lstsq(m: np.ndarray, b: np.ndarray, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+    """
+    argmin ||m x - b||^2 subject to lo <= x <= hi, by an active-set loop:
+    solve over the free variables, pin the ones that leave their box, and
+    release pinned ones whose gradient points back inside. A plate has at
+    most a handful of items, so this settles in a few iterations.
+    """
+    n = m.shape[1]
+    x = np.zeros(n)
+    pinned = np.zeros(n, dtype=bool)
+    for _ in range(2 * n + 2):
+        free = ~pinned
+        if free.any():
+            x[free] = np.linalg.lstsq(m[:, free], b - m[:, pinned] @ x[pinned], rcond=None)[0]
+        outside = free & ((x < lo) | (x > hi))
+        if outside.any():
+            x = np.clip(x, lo, hi)
+            pinned |= outside
+            continue
+        grad = m.T @ (m @ x - b)
+        release = pinned & (((x <= lo) & (grad < 0)) | ((x >= hi) & (grad > 0)))
+        if not release.any():
+            break
+        pinned &= ~release
+    return np.clip(x, lo, hi)
+
+
+def _meal_targets(per_meal_targets: Dict[str, Any], daily_remaining: Dict[str, Any]) -> np.ndarray:
+    """Per-meal targets in OPT_MACROS order; budget left for the day can only tighten them"""
+    targets = []
+    for macro in OPT_MACROS:
+        target = float(per_meal_targets.get(macro) or 0)
+        if daily_remaining.get(macro) is not None:
+            target = min(target, float(daily_remaining[macro]))
+        targets.append(target)
+    return np.array(targets)
+
+
+def optimize_portions(
+    estimate: Dict[str, Any],
+    per_meal_targets: Dict[str, Any],
+    daily_remaining: Dict[str, Any],
+) -> Dict[str, Any]:
+    """
+    Gram change per estimate item that moves the meal toward its targets.
+    Only kcal, fat and carbs above their on-target band pull (down), and
+    protein below it (up); protein is also a floor that cuts may not push
+    it under. Returns deltas (grams, item order), their kcal effect, and
+    the macros (OPT_MACROS order) before, after and targeted.
+    """
+    estimate = clean_estimate(estimate)
+    items = estimate["items"]
+    n = len(items)
+    totals = estimate["totals"]
+    before = np.array([totals[m] for m in OPT_MACROS])
+    targets = _meal_targets(per_meal_targets, daily_remaining)
+    statuses = [macro_status(before[j], targets[j]) for j in range(len(OPT_MACROS))]
+    pulling = np.array([
+        status == ("under" if macro == "protein_g" else "over")
+        for macro, status in zip(OPT_MACROS, statuses)
+    ]) & (targets > 0)
+    deltas = np.zeros(n)
+    if n == 0 or not pulling.any():
+        return {"deltas": deltas, "kcal_change": deltas, "before": before, "after": before.copy(), "targets": targets}
+
+    grams = np.fromiter((i["grams"] for i in items), dtype=np.float64, count=n)
+    # (n, macro) per gram of each item
+    per_gram = np.array([
+        [i["nutrition_per_100g"].get(m, 0.0) / 100 for m in OPT_MACROS] for i in items
+    ]).reshape(n, len(OPT_MACROS))
+    kcal = per_gram[:, 0]
+    protein_share = np.divide(per_gram[:, 1] * 4, kcal, out=np.zeros(n), where=kcal > 0)
+    fat_share = np.divide(per_gram[:, 2] * 9, kcal, out=np.zeros(n), where=kcal > 0)
+    # The reported category wins (stir-fry oil dilutes greens' protein share); the densities decide otherwise
+    vegetable = np.fromiter((i.get("category") == "vegetable" for i in items), dtype=bool, count=n) | (
+        (kcal * 100 <= VEG_MAX_KCAL_DENSITY) & (protein_share >= VEG_MIN_PROTEIN_SHARE)
+    )
+    lean = vegetable | ((protein_share >= LEAN_MIN_PROTEIN_SHARE) & (fat_share <= LEAN_MAX_FAT_SHARE))
+    lo = np.where(vegetable, 0.0, -MAX_PORTION_CUT * grams)
+    hi = np.where(lean, MAX_PORTION_ADD * grams, 0.0)
+
+    protein = OPT_MACROS.index("protein_g")
+    penalty = np.diag(np.sqrt(OPT_CHANGE_PENALTY) / np.maximum(grams, 1.0))
+
+    def solve(active: np.ndarray) -> np.ndarray:
+        # Residual rows: weighted relative miss per active macro, then the change penalty per item
+        scale = np.where(active, OPT_WEIGHTS / np.where(targets > 0, targets, 1.0), 0.0)
+        rows = scale[:, None] * per_gram.T
+        rhs = scale * (targets - before)
+        # While protein pulls, lean items are what we'd add, never what we cut
+        item_lo = np.where(lean, 0.0, lo) if active[protein] else lo
+        return _bounded_lstsq(np.vstack([rows, penalty]), np.concatenate([rhs, np.zeros(n)]), item_lo, hi)
+
+    deltas = solve(pulling)
+    # One-sided protein floor: if the cuts would leave protein under target, re-solve with it pulling
+    if not pulling[protein] and targets[protein] > 0 and before[protein] + per_gram[:, protein] @ deltas < targets[protein]:
+        pulling = pulling.copy()
+        pulling[protein] = True
+        deltas = solve(pulling)
+    # Drop changes too small to act on; the macros below reflect only what's suggested
+    deltas = np.where(np.abs(deltas) >= MIN_ACTION_G, deltas, 0.0)
+    after = np.maximum(before + per_gram.T @ deltas, 0.0)
+    return {"deltas": deltas, "kcal_change": deltas * per_gram[:, 0], "before": before, "after": after, "targets": targets}
+
+
+def suggest_meal(
+    estimate: Dict[str, Any],
+    per_meal_targets: Dict[str, Any],
+    daily_remaining: Dict[str, Any],
+    model_info: str = SUGGESTIONS_MODEL_INFO,
+) -> Dict[str, Any]:
+    """suggestions_schema response with every quantity from optimize_portions"""
+    estimate = clean_estimate(estimate)
+    items = estimate["items"]
+    plan = optimize_portions(estimate, per_meal_targets, daily_remaining)
+    deltas, before, after, targets = plan["deltas"], plan["before"], plan["after"], plan["targets"]
+
+    actions: List[Dict[str, str]] = []
+    # Biggest energy effect first
+    for k in np.argsort(-np.abs(plan["kcal_change"]), kind="stable").tolist():
+        delta = float(deltas[k])
+        if delta == 0:
+            continue
+        name = items[k].get("display_name") or items[k].get("name") or "this item"
+        # Drinks are estimated in grams, which is millilitres near enough
+        verb, unit = ("Drink", "ml") if items[k].get("category") == "beverage" else ("Eat", "g")
+        if delta < 0:
+            actions.append({"kind": "portion", "text": f"{verb} about {-delta:.0f} {unit} less {name}."})
+        else:
+            actions.append({"kind": "add", "text": f"Add about {delta:.0f} {unit} more {name}."})
+
+    rationale = [
+        f"{OPT_LABELS[m]}: {before[j]:.1f} → {after[j]:.1f} {OPT_UNITS[m]} (target {targets[j]:.1f} {OPT_UNITS[m]})."
+        for j, m in enumerate(OPT_MACROS)
+        if abs(after[j] - before[j]) >= 0.05
+    ]
+
+    if before[OPT_MACROS.index("carb_g")] > 0:
+        actions.append({"kind": "order", "text": "Eat the protein and vegetables first and the starchy foods last."})
+    protein = OPT_MACROS.index("protein_g")
+    if macro_status(after[protein], targets[protein]) == "under":
+        short = targets[protein] - after[protein]
+        actions.append({"kind": "add", "text": f"Add a lean protein side for about {short:.0f} g more protein."})
+    actions.append({"kind": "other", "text": "Drink a glass of water with this meal."})
+    if not rationale:
+        # No portion change to explain: report what is off target, if anything
+        rationale = [
+            f"{OPT_LABELS[m]}: {before[j]:.1f} {OPT_UNITS[m]}, {status} the {targets[j]:.1f} {OPT_UNITS[m]} target."
+            for j, m in enumerate(OPT_MACROS)
+            for status in [{"over": "over", "under": "under"}.get(macro_status(before[j], targets[j]))]
+            if status and targets[j] > 0
+        ][:4] or ["This meal is close to your per-meal targets."]
+
+    return {
+        "actions": actions[:8],
+        "adjusted_macros_after_actions": {m: round(float(after[j]), 1) for j, m in enumerate(OPT_MACROS)},
+        "rationale": rationale,
+        "model_info": model_info,
+    }
+
+
+# -------- Degraded responses --------
+# Used when the LLM circuit is open: plain arithmetic in the same schemas
+FALLBACK_SUGGESTIONS_MODEL_INFO = "heal-fallback-suggestions-v1"
+FALLBACK_SUMMARY_MODEL_INFO = "heal-fallback-summary-v1"
+
+
+def fallback_suggestions(
+    estimate: Dict[str, Any],
+    per_meal_targets: Dict[str, float],
+    daily_remaining: Dict[str, float],
+) -> Dict[str, Any]:
+    """The local optimizer's suggestions, labelled as a degraded response"""
+    return suggest_meal(estimate, per_meal_targets, daily_remaining, model_info=FALLBACK_SUGGESTIONS_MODEL_INFO)
+
+
+def fallback_daily_summary(
+    daily_targets: Dict[str, float],
+    total_consumed: Dict[str, float],
+    meals: List[Dict[str, Any]],
+) -> Dict[str, Any]:
+    """Templated daily_summary_schema response from the day's totals"""
+    overview: Dict[str, str] = {}
+    points = [f"You logged {len(meals)} meal{'s' if len(meals) != 1 else ''} today."]
+    focus: List[str] = []
+    alerts: List[str] = []
+    for macro in ("carb_g", "protein_g", "fat_g"):
+        target = float(daily_targets.get(macro) or 0)
+        consumed = float(total_consumed.get(macro) or 0)
+        label = MACRO_LABELS[macro]
+        overview[macro] = f"{consumed:.0f} g of {target:.0f} g ({_percent(consumed, target):.0f}%)"
+        status = macro_status(consumed, target)
+        if status == "over":
+            points.append(f"{label} ended {consumed - target:.0f} g above your daily target.")
+            focus.append(f"Keep {label.lower()} closer to {target:.0f} g tomorrow.")
+            alerts.append(f"{label} over daily target by {consumed - target:.0f} g.")
+        elif status == "under":
+            points.append(f"{label} ended {target - consumed:.0f} g below your daily target.")
+            focus.append(f"Add a little more {label.lower()} to reach {target:.0f} g.")
+        else:
+            points.append(f"{label} was on target.")
+
+    for generic in (
+        "Spread carbs evenly across your meals.",
+        "Fill half the plate with vegetables.",
+        "Photograph every meal so the day's totals stay accurate.",
+    ):
+        if len(focus) >= 3:
+            break
+        focus.append(generic)
+
+    return {
+        "summary_points": points[:4],
+        "next_day_focus": focus[:4],
+        "macro_overview": overview,
+        "alerts": alerts,
+        "model_info": FALLBACK_SUMMARY_MODEL_INFO,
+    }
@@ -0,0 +1,147 @@
+"""
+Opt-in request profiling (pyinstrument sampling profiler, wall-clock and
+async await time). Off unless configured; when off the middleware is not
+even installed.
+"""
+import os
+import re
+import hmac
+import time
+import uuid
+import random
+import asyncio
+import importlib.util
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from .logs import get_logger
+
+log = get_logger("profiling")
+
+# -------- Config --------
+# Requests carrying `X-Heal-Profile: <token>` are profiled; the same header
+# unlocks the /admin/profiles endpoints
+PROFILE_TOKEN = os.getenv("HEAL_PROFILE_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("HEAL_PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv("HEAL_PROFILE_DIR", "")
+PROFILE_FORMAT = os.getenv("HEAL_PROFILE_FORMAT", "html")  # html | speedscope
+PROFILE_INTERVAL_S = float(os.getenv("HEAL_PROFILE_INTERVAL", "0.001"))
+# Most recent profiles kept in memory for /admin/profiles
+PROFILE_KEEP = int(os.getenv("HEAL_PROFILE_KEEP", "20"))
+PROFILE_HEADER = "x-heal-profile"
+
+PROFILING_REQUESTED = bool(PROFILE_TOKEN) or PROFILE_SAMPLE_RATE > 0
+PROFILING_AVAILABLE = importlib.util.find_spec("pyinstrument") is not None
+PROFILING_ENABLED = PROFILING_REQUESTED and PROFILING_AVAILABLE
+if PROFILING_REQUESTED and not PROFILING_AVAILABLE:
+    log.warning("request profiling configured but the `pyinstrument` package is not installed; profiling is off")
+
+_SLUG_RE = re.compile(r"[^a-zA-Z0-9]+")
+
+
+class ProfileStore:
+    """Recent rendered profiles by ID, optionally mirrored to PROFILE_DIR"""
+
+    def __init__(self, keep: int = PROFILE_KEEP):
+        self.keep = keep
+        self._profiles: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def add(self, profile_id: str, meta: Dict[str, Any], body: str) -> None:
+        self._profiles[profile_id] = {**meta, "body": body}
+        while len(self._profiles) > self.keep:
+            self._profiles.popitem(last=False)
+
+    def get(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        return self._profiles.get(profile_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        return [
+            {k: v for k, v in entry.items() if k != "body"}
+            for entry in reversed(self._profiles.values())
+        ]
+
+
+profile_store = ProfileStore()
+
+
+def authorized(token: Optional[str]) -> bool:
+    # Constant-time, so response timing doesn't leak how much of the token matched
+    return bool(PROFILE_TOKEN) and hmac.compare_digest((token or "").encode(), PROFILE_TOKEN.encode())
+
+
+def _render(profiler: Any) -> str:
+    if PROFILE_FORMAT == "speedscope":
+        from pyinstrument.renderers import SpeedscopeRenderer
+        return profiler.output(renderer=SpeedscopeRenderer())
+    return profiler.output_html()
+
+
+def _write(path: str, body: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(body)
+
+
+class ProfilingMiddleware:
+    """
+    Profile a request when it carries the privileged header or falls in the
+    sampled fraction. The profile ID is returned as X-Profile-Id; rendering
+    and writing happen after the response has been sent, off the event loop.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def _wanted(self, scope) -> bool:
+        if PROFILE_TOKEN:
+            for key, value in scope["headers"]:
+                if key == PROFILE_HEADER.encode() and authorized(value.decode("latin-1")):
+                    return True
+        return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith("/admin/profiles") or not self._wanted(scope):
+            await self.app(scope, receive, send)
+            return
+
+        from pyinstrument import Profiler
+
+        profile_id = uuid.uuid4().hex[:16]
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        # async_mode="enabled" attributes time spent awaiting to the awaiting
+        # coroutine, and keeps concurrent requests' samples apart
+        profiler = Profiler(interval=PROFILE_INTERVAL_S, async_mode="enabled")
+        started = time.time()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.stop()
+            route = getattr(scope.get("route"), "path", scope["path"])
+            meta = {
+                "id": profile_id,
+                "method": scope["method"],
+                "route": route,
+                "status": status,
+                "started_at": round(started, 3),
+                "duration_ms": round((time.time() - started) * 1000, 1),
+                "format": PROFILE_FORMAT,
+            }
+            try:
+                body = await asyncio.to_thread(_render, profiler)
+                profile_store.add(profile_id, meta, body)
+                if PROFILE_DIR:
+                    ext = "speedscope.json" if PROFILE_FORMAT == "speedscope" else "html"
+                    name = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime(started))}-{_SLUG_RE.sub('_', route).strip('_')}-{profile_id}.{ext}"
+                    await asyncio.to_thread(_write, os.path.join(PROFILE_DIR, name), body)
+                log.info("request profiled", extra=meta)
+            except Exception:
+                log.exception("rendering request profile failed")
@@ -0,0 +1,277 @@
+"""
+LLM providers behind one interface: OpenAI, any OpenAI-compatible server
+(vLLM, llama.cpp, ...) and an in-process fake for offline runs and load tests
+"""
+import os
+import json
+import time
+import random
+import asyncio
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Mapping, Optional
+
+from openai import AsyncOpenAI
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from .transport import build_http_client, warm_up, pool_stats
+from .logs import get_logger
+
+log = get_logger("providers")
+
+# -------- Config --------
+# openai | compatible | fake; the vision and text roles can differ
+LLM_PROVIDER = os.getenv("HEAL_LLM_PROVIDER", "openai")
+ROLES = {
+    "vision": (os.getenv("HEAL_VISION_PROVIDER", LLM_PROVIDER), os.getenv("HEAL_VISION_MODEL", "gpt-4o")),
+    "text": (os.getenv("HEAL_TEXT_PROVIDER", LLM_PROVIDER), os.getenv("HEAL_TEXT_MODEL", "gpt-4o-mini")),
+    # First pass of the /estimate cascade (HEAL_ESTIMATE_CASCADE)
+    "vision_fast": (
+        os.getenv("HEAL_VISION_FAST_PROVIDER", os.getenv("HEAL_VISION_PROVIDER", LLM_PROVIDER)),
+        os.getenv("HEAL_VISION_FAST_MODEL", "gpt-4o-mini"),
+    ),
+}
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+# On-prem OpenAI-compatible server, e.g. vLLM or llama.cpp's llama-server.
+# No default: the usual one (localhost:8000) is where this app itself listens
+COMPATIBLE_BASE_URL = os.getenv("HEAL_COMPATIBLE_BASE_URL")
+COMPATIBLE_API_KEY = os.getenv("HEAL_COMPATIBLE_API_KEY", "not-needed")
+# Fake provider: latency per call (seconds) plus uniform jitter
+FAKE_LATENCY_S = float(os.getenv("HEAL_FAKE_LATENCY", "0.5"))
+FAKE_LATENCY_JITTER_S = float(os.getenv("HEAL_FAKE_LATENCY_JITTER", "0.1"))
+FAKE_STREAM_CHUNK_CHARS = 24
+
+
+class ProviderNotConfigured(Exception):
+    """The selected provider is missing required configuration (e.g. an API key)"""
+
+
+class Provider:
+    """One upstream that speaks the chat.completions API"""
+
+    name = "base"
+    # Client-side RPM/TPM limiting only makes sense for metered upstreams
+    rate_limited = False
+
+    async def create(self, model: str, **kwargs: Any) -> Any:
+        """chat.completions.create; returns a raw response (`.headers`, `.parse()`)"""
+        raise NotImplementedError
+
+    async def warm_up(self) -> int:
+        return 0
+
+    def pool_stats(self) -> Dict[str, Any]:
+        return {}
+
+    async def close(self) -> None:
+        return None
+
+
+class OpenAIProvider(Provider):
+    """OpenAI, or any server exposing the OpenAI chat.completions API"""
+
+    def __init__(self, name: str, api_key: Optional[str], base_url: Optional[str] = None, rate_limited: bool = True):
+        self.name = name
+        self.api_key = api_key
+        self.rate_limited = rate_limited
+        # One tuned connection pool per provider (backend/transport.py)
+        self.http_client = build_http_client()
+        # Retries are ours (see llm._create_completion), paced by the rate limiter
+        self.client = AsyncOpenAI(
+            api_key=api_key or "unset",
+            base_url=base_url,
+            http_client=self.http_client,
+            max_retries=0,
+        )
+
+    async def create(self, model: str, **kwargs: Any) -> Any:
+        if not self.api_key:
+            raise ProviderNotConfigured("Set OPENAI_API_KEY env var.")
+        return await self.client.chat.completions.with_raw_response.create(model=model, **kwargs)
+
+    async def warm_up(self) -> int:
+        if not self.api_key:
+            return 0
+        return await warm_up(self.http_client, str(self.client.base_url), {"Authorization": f"Bearer {self.api_key}"})
+
+    def pool_stats(self) -> Dict[str, Any]:
+        return pool_stats(self.http_client)
+
+    async def close(self) -> None:
+        await self.client.close()
+
+
+# -------- Fake provider --------
+# Plausible values for well-known numeric fields; anything else gets 1
+_FAKE_NUMBERS = {
+    "grams": 150.0,
+    "kcal": 240.0,
+    "protein_g": 18.0,
+    "carb_g": 30.0,
+    "fat_g": 8.0,
+    "confidence": 0.8,
+    "low": 200.0,
+    "high": 280.0,
+}
+
+
+def fake_instance(schema: Dict[str, Any], key: str = "", model: str = "fake") -> Any:
+    """Smallest plausible instance that validates against a strict JSON schema"""
+    for combinator in ("anyOf", "oneOf"):
+        if combinator in schema:
+            return fake_instance(schema[combinator][0], key, model)
+    kind = schema.get("type", "object")
+    if isinstance(kind, list):
+        kind = next((k for k in kind if k != "null"), "null")
+    if "enum" in schema:
+        return schema["enum"][0]
+    if kind == "object":
+        return {name: fake_instance(sub, name, model) for name, sub in schema.get("properties", {}).items()}
+    if kind == "array":
+        count = max(schema.get("minItems", 0), min(2, schema.get("maxItems", 2)))
+        return [fake_instance(schema.get("items", {}), key, model) for _ in range(count)]
+    if kind in ("number", "integer"):
+        value = _FAKE_NUMBERS.get(key, 1.0)
+        value = max(value, schema.get("minimum", value))
+        value = min(value, schema.get("maximum", value))
+        return int(value) if kind == "integer" else value
+    if kind == "boolean":
+        return False
+    if kind == "null":
+        return None
+    return f"fake-{model}" if key == "model_info" else f"sample {key or 'text'}"
+
+
+class _FakeRawResponse:
+    """Stands in for openai's LegacyAPIResponse: headers + parse()"""
+
+    def __init__(self, parsed: Any, headers: Optional[Mapping[str, str]] = None):
+        self.headers: Mapping[str, str] = headers or {}
+        self._parsed = parsed
+
+    def parse(self) -> Any:
+        return self._parsed
+
+
+class _FakeStream:
+    """Async iterator of ChatCompletionChunks with openai's AsyncStream.close()"""
+
+    def __init__(self, chunks: List[ChatCompletionChunk], delay: float):
+        self._chunks = chunks
+        self._delay = delay
+
+    def __aiter__(self) -> AsyncIterator[ChatCompletionChunk]:
+        return self._iterate()
+
+    async def _iterate(self) -> AsyncIterator[ChatCompletionChunk]:
+        for chunk in self._chunks:
+            await asyncio.sleep(self._delay)
+            yield chunk
+
+    async def close(self) -> None:
+        return None
+
+
+class FakeProvider(Provider):
+    """
+    In-process provider: no network, schema-valid JSON for whatever
+    response_format is requested, after a configurable delay
+    """
+
+    name = "fake"
+
+    def __init__(self, latency_s: float = FAKE_LATENCY_S, jitter_s: float = FAKE_LATENCY_JITTER_S):
+        self.latency_s = latency_s
+        self.jitter_s = jitter_s
+        self.calls = 0
+
+    def _latency(self) -> float:
+        return max(0.0, self.latency_s + random.uniform(-self.jitter_s, self.jitter_s))
+
+    async def create(self, model: str, **kwargs: Any) -> Any:
+        self.calls += 1
+        schema = (kwargs.get("response_format") or {}).get("json_schema", {}).get("schema", {"type": "object"})
+        content = json.dumps(fake_instance(schema, model=model))
+        prompt_chars = sum(len(json.dumps(m.get("content"))) for m in kwargs.get("messages", []))
+        usage = {
+            "prompt_tokens": prompt_chars // 4,
+            "completion_tokens": len(content) // 4,
+            "total_tokens": prompt_chars // 4 + len(content) // 4,
+        }
+        base = {"id": f"fake-{self.calls}", "created": int(time.time()), "model": model}
+        latency = self._latency()
+
+        if kwargs.get("stream"):
+            pieces = [content[i:i + FAKE_STREAM_CHUNK_CHARS] for i in range(0, len(content), FAKE_STREAM_CHUNK_CHARS)]
+            chunks = [
+                ChatCompletionChunk.model_validate({
+                    **base,
+                    "object": "chat.completion.chunk",
+                    "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+                })
+                for piece in pieces
+            ]
+            chunks.append(ChatCompletionChunk.model_validate({
+                **base, "object": "chat.completion.chunk", "choices": [], "usage": usage,
+            }))
+            # Time to first byte, then the rest of the latency spread across chunks
+            await asyncio.sleep(latency * 0.3)
+            return _FakeRawResponse(_FakeStream(chunks, latency * 0.7 / len(chunks)))
+
+        await asyncio.sleep(latency)
+        return _FakeRawResponse(ChatCompletion.model_validate({
+            **base,
+            "object": "chat.completion",
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": usage,
+        }))
+
+    def pool_stats(self) -> Dict[str, Any]:
+        return {"calls": self.calls, "latency_s": self.latency_s, "jitter_s": self.jitter_s}
+
+
+def build_provider(name: str) -> Provider:
+    if name == "openai":
+        if not OPENAI_API_KEY:
+            log.warning("OPENAI_API_KEY is not set; calls through the openai provider will fail")
+        return OpenAIProvider("openai", OPENAI_API_KEY)
+    if name == "compatible":
+        if not COMPATIBLE_BASE_URL:
+            raise ProviderNotConfigured("Set HEAL_COMPATIBLE_BASE_URL to use the compatible provider.")
+        return OpenAIProvider("compatible", COMPATIBLE_API_KEY, base_url=COMPATIBLE_BASE_URL, rate_limited=False)
+    if name == "fake":
+        return FakeProvider()
+    raise ValueError(f"Unknown LLM provider {name!r} (expected openai, compatible or fake)")
+
+
+@dataclass(frozen=True)
+class LLMTarget:
+    """Which provider and model serve a role ("vision", "vision_fast" or "text")"""
+
+    role: str
+    provider: Provider
+    model: str
+
+
+_providers: Dict[str, Provider] = {}
+
+
+def provider(name: str) -> Provider:
+    """Shared instance per provider name (both roles on openai share one pool)"""
+    if name not in _providers:
+        # cassette.py builds on the classes above
+        from .cassette import with_cassette
+        _providers[name] = with_cassette(build_provider(name))
+    return _providers[name]
+
+
+def target(role: str) -> LLMTarget:
+    provider_name, model = ROLES[role]
+    return LLMTarget(role=role, provider=provider(provider_name), model=model)
+
+
+def active_providers() -> List[Provider]:
+    return list(_providers.values())
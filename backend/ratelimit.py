@@ -0,0 +1,206 @@
+"""
+Client-side rate control for upstream LLM calls (RPM/TPM token buckets,
+fair queued admission, adaptive limits, jittered retry backoff)
+"""
+import os
+import re
+import json
+import time
+import random
+import asyncio
+from typing import Any, Dict, List, Mapping, Optional
+
+# -------- Config --------
+# Per-model budgets; override with HEAL_RATE_LIMITS='{"gpt-4o": {"rpm": 500, "tpm": 30000}}'
+DEFAULT_RATE_LIMITS = {
+    "gpt-4o": {"rpm": 500, "tpm": 30_000},
+    "gpt-4o-mini": {"rpm": 500, "tpm": 200_000},
+}
+RATE_LIMITS = {**DEFAULT_RATE_LIMITS, **json.loads(os.getenv("HEAL_RATE_LIMITS", "{}"))}
+FALLBACK_LIMIT = {"rpm": 500, "tpm": 200_000}
+RATE_LIMIT_ENABLED = os.getenv("HEAL_RATE_LIMIT", "1") != "0"
+# Callers queued longer than this give up with RateLimitQueueTimeout
+QUEUE_TIMEOUT_S = float(os.getenv("HEAL_RATE_QUEUE_TIMEOUT", "30"))
+MAX_RETRIES = int(os.getenv("HEAL_LLM_MAX_RETRIES", "3"))
+BACKOFF_BASE_S = float(os.getenv("HEAL_LLM_BACKOFF_BASE", "0.5"))
+BACKOFF_CAP_S = float(os.getenv("HEAL_LLM_BACKOFF_CAP", "20"))
+# Output tokens count against TPM too; structured outputs here are short
+EXPECTED_COMPLETION_TOKENS = 600
+
+# Vision token costs (see images.estimate_image_tokens): low detail is flat,
+# high detail at a 768px short side is usually 2x2 tiles
+IMAGE_TOKENS = {"low": 85, "high": 765}
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+class RateLimitQueueTimeout(Exception):
+    """Admission queue wait exceeded HEAL_RATE_QUEUE_TIMEOUT"""
+
+
+def estimate_request_tokens(messages: List[Dict[str, Any]], completion_tokens: int = EXPECTED_COMPLETION_TOKENS) -> int:
+    """Rough prompt + image + completion token count (about 4 chars per text token)"""
+    chars, image_tokens = 0, 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            chars += len(content)
+            continue
+        for part in content or []:
+            if part.get("type") == "text":
+                chars += len(part.get("text", ""))
+            elif part.get("type") == "image_url":
+                image_tokens += IMAGE_TOKENS.get(part["image_url"].get("detail", "high"), IMAGE_TOKENS["high"])
+    return chars // 4 + image_tokens + completion_tokens
+
+
+def parse_reset(value: Optional[str]) -> Optional[float]:
+    """Parse provider reset durations like '1s', '6m0s', '250ms' into seconds"""
+    if not value:
+        return None
+    parts = _DURATION_RE.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(n) * _DURATION_UNITS[unit] for n, unit in parts)
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Full-jitter exponential backoff; never earlier than the server's Retry-After"""
+    delay = random.uniform(0, min(BACKOFF_CAP_S, BACKOFF_BASE_S * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, retry_after) + random.uniform(0, BACKOFF_BASE_S)
+    return delay
+
+
+class _Bucket:
+    """Continuously refilling token bucket; level may go negative (debt)"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self.rate = per_minute / 60.0
+        self._updated = time.monotonic()
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        self.refill()
+        if self.level >= amount:
+            return 0.0
+        return (min(amount, self.capacity) - self.level) / self.rate
+
+    def set_limit(self, per_minute: float) -> None:
+        self.refill()
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = min(self.level, self.capacity)
+
+
+class RateLimiter:
+    """
+    RPM + TPM budget for one model. Admission is FIFO (asyncio.Lock wakes
+    waiters in order), so a burst of small text calls can't starve a
+    queued vision call and vice versa.
+    """
+
+    def __init__(self, model: str, rpm: float, tpm: float):
+        self.model = model
+        self.requests = _Bucket(rpm)
+        self.tokens = _Bucket(tpm)
+        self._lock = asyncio.Lock()
+        self.waiting = 0
+        self.admitted = 0
+        self.throttled = 0
+        self.queue_timeouts = 0
+        self.total_wait_s = 0.0
+        self.rate_limited = 0
+
+    async def acquire(self, tokens: int) -> None:
+        started = time.monotonic()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._admit(tokens), timeout=QUEUE_TIMEOUT_S)
+        except asyncio.TimeoutError:
+            self.queue_timeouts += 1
+            raise RateLimitQueueTimeout(f"{self.model}: waited {QUEUE_TIMEOUT_S:.0f}s for rate-limit budget")
+        finally:
+            self.waiting -= 1
+        waited = time.monotonic() - started
+        self.total_wait_s += waited
+        self.admitted += 1
+
+    async def _admit(self, tokens: int) -> None:
+        async with self._lock:
+            while True:
+                delay = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+                if delay <= 0:
+                    self.requests.level -= 1
+                    self.tokens.level -= tokens
+                    return
+                self.throttled += 1
+                await asyncio.sleep(delay)
+
+    def settle(self, estimated: int, actual: Optional[int]) -> None:
+        """Correct the TPM bucket once the real usage is known"""
+        if actual is not None:
+            self.tokens.level -= actual - estimated
+
+    def observe_headers(self, headers: Mapping[str, str]) -> None:
+        """Adopt the provider's view of our limits and remaining budget"""
+        for bucket, kind in ((self.requests, "requests"), (self.tokens, "tokens")):
+            limit = headers.get(f"x-ratelimit-limit-{kind}")
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            try:
+                if limit is not None and float(limit) != bucket.capacity:
+                    bucket.set_limit(float(limit))
+                if remaining is not None:
+                    bucket.refill()
+                    bucket.level = min(bucket.level, float(remaining))
+            except ValueError:
+                continue
+
+    def on_rate_limited(self, retry_after: Optional[float]) -> None:
+        """A 429 means our estimate was optimistic: drain so the queue backs off together"""
+        self.rate_limited += 1
+        for bucket in (self.requests, self.tokens):
+            bucket.refill()
+            pause = retry_after if retry_after is not None else 1.0
+            bucket.level = min(bucket.level, -bucket.rate * pause)
+
+    def stats(self) -> Dict[str, Any]:
+        self.requests.refill()
+        self.tokens.refill()
+        return {
+            "rpm_limit": self.requests.capacity,
+            "tpm_limit": self.tokens.capacity,
+            "requests_available": round(self.requests.level, 1),
+            "tokens_available": round(self.tokens.level),
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "throttled": self.throttled,
+            "queue_timeouts": self.queue_timeouts,
+            "rate_limited_responses": self.rate_limited,
+            "avg_wait_ms": round(self.total_wait_s / self.admitted * 1000, 1) if self.admitted else 0.0,
+        }
+
+
+_limiters: Dict[str, RateLimiter] = {}
+
+
+def limiter_for(model: str) -> RateLimiter:
+    limiter = _limiters.get(model)
+    if limiter is None:
+        limits = RATE_LIMITS.get(model, FALLBACK_LIMIT)
+        limiter = _limiters[model] = RateLimiter(model, limits["rpm"], limits["tpm"])
+    return limiter
+
+
+def rate_limit_stats() -> Dict[str, Any]:
+    return {model: limiter.stats() for model, limiter in _limiters.items()}
@@ -1,20 +1,38 @@
 """
 API route handlers
 """
-from fastapi import File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
+import csv
+import json
+import math
+import time
+import asyncio
+from typing import Dict, Any, List, Optional, Tuple, AsyncIterator
+from fastapi import File, UploadFile, HTTPException, Request
+from pydantic import ValidationError
+from openai import RateLimitError, APITimeoutError
+from fastapi.responses import JSONResponse, StreamingResponse
 
 from .models import (
+    AnalyzeMealRequest,
     BudgetRequest,
     CompareMealRequest,
     SuggestionsRequest,
     CopyRequest,
     DailySummaryRequest,
 )
-from .nutrition import calculate_budget
+from .nutrition import calculate_budget, calculate_budget_batch
+from .foods import food_table
+from .images import PreparedImage, prepare_image
+from .ratelimit import RateLimitQueueTimeout
+from .latency import DeadlineExceeded
+from .breaker import CircuitOpen
+from .metrics import stage_seconds
+from .logs import get_logger
+from .streaming import sse_event, ndjson_event
 from .llm import (
     img_to_data_uri,
     estimate_food_from_image,
+    stream_food_estimate,
     compare_meal_to_targets,
     generate_meal_suggestions,
     generate_reminder_copy,
@@ -22,6 +40,53 @@ from .llm import (
 )
 
 
+log = get_logger("routes")
+
+# Retry-After hint sent with 503s when the upstream budget is exhausted
+RETRY_AFTER_S = 5
+
+
+def upstream_error(e: Exception, detail: str) -> HTTPException:
+    """
+    Map a failed upstream call to an HTTP error: rate limiting (after our
+    own retries) and an open circuit are 503 + Retry-After so clients back
+    off, a spent latency budget is 504; anything else 500.
+    """
+    if isinstance(e, CircuitOpen):
+        return HTTPException(
+            status_code=503,
+            detail=f"Upstream unavailable, failing fast ({detail})",
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
+        )
+    if isinstance(e, (DeadlineExceeded, APITimeoutError)):
+        return HTTPException(status_code=504, detail=f"Upstream did not answer within the request deadline ({detail})")
+    if isinstance(e, (RateLimitError, RateLimitQueueTimeout)):
+        return HTTPException(
+            status_code=503,
+            detail=f"Upstream rate limited, retry shortly ({detail})",
+            headers={"Retry-After": str(RETRY_AFTER_S)},
+        )
+    return HTTPException(status_code=500, detail=detail)
+
+
+def json_response(endpoint: str, content: Any, headers: Optional[Dict[str, str]] = None) -> JSONResponse:
+    """JSONResponse with its serialization timed into heal_stage_seconds"""
+    with stage_seconds.time(stage="response_serialize", endpoint=endpoint):
+        return JSONResponse(content, headers=headers)
+
+
+def image_savings_headers(prepared: PreparedImage) -> Dict[str, str]:
+    """Per-request report of what image preprocessing saved"""
+    return {
+        "X-Image-Detail": prepared.detail,
+        "X-Image-Bytes-Original": str(prepared.original_bytes),
+        "X-Image-Bytes-Sent": str(prepared.sent_bytes),
+        "X-Image-Bytes-Saved": str(prepared.bytes_saved),
+        "X-Image-Tokens-Estimated": str(prepared.tokens_after),
+        "X-Image-Tokens-Saved": str(prepared.tokens_saved),
+    }
+
+
 async def estimate_meal(image: UploadFile = File(None)):
     """
     POST /estimate
@@ -31,49 +96,212 @@ async def estimate_meal(image: UploadFile = File(None)):
     try:
         # Try standard UploadFile first
         if image is not None and image.filename:
-            print(f"📸 Received via UploadFile: {image.filename}")
+            log.debug("upload received", extra={"upload_filename": image.filename})
             contents = await image.read()
         else:
             # Fallback: parse multipart manually
-            print("⚠️  UploadFile is None, trying manual multipart parsing...")
             raise HTTPException(status_code=400, detail="Image parameter missing - check multipart format")
         
-        print(f"📦 Image size: {len(contents)} bytes")
-        
         if len(contents) == 0:
             raise HTTPException(status_code=400, detail="Empty image file")
         
-        # Convert to data URI
-        from io import BytesIO
-        from PIL import Image as PILImage
-        import base64
-        
-        try:
-            im = PILImage.open(BytesIO(contents)).convert("RGB")
-        except Exception as e:
-            raise HTTPException(status_code=415, detail=f"Invalid image: {str(e)}")
-        
-        buf = BytesIO()
-        im.save(buf, format="JPEG", quality=92)
-        b64 = base64.b64encode(buf.getvalue()).decode("utf-8")
-        data_uri = f"data:image/jpeg;base64,{b64}"
-        
-        print(f"✅ Image converted to data URI, length: {len(data_uri)}")
-        
-        payload = estimate_food_from_image(data_uri)
-        print(f"✅ GPT-4o analysis complete")
+        # Orient, downsample and re-encode off the event loop
+        prepared = await prepare_image(contents)
+        log.debug(
+            "image prepared",
+            extra={
+                "image_bytes": len(contents),
+                "width": prepared.width,
+                "height": prepared.height,
+                "detail": prepared.detail,
+                "passthrough": prepared.passthrough,
+                "bytes_saved": prepared.bytes_saved,
+                "tokens_saved": prepared.tokens_saved,
+            },
+        )
         
-        return JSONResponse(payload)
+        payload = await estimate_food_from_image(
+            prepared.data_uri, detail=prepared.detail, image_hash=prepared.phash
+        )
+        log.info("estimate complete", extra={"items": len(payload.get("items", []))})
+
+        return json_response("estimate", payload, headers=image_savings_headers(prepared))
+    except HTTPException:
+        raise
+    except Exception as e:
+        log.exception("estimate failed")
+        raise upstream_error(e, f"{type(e).__name__}: {str(e)}")
+
+
+def _elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000, 1)
+
+
+def daily_remaining(daily_targets: Dict[str, Any], consumed: Dict[str, Any]) -> Dict[str, float]:
+    """Budget left for the day, floored at zero (mirrors the iOS client)"""
+    return {
+        k: max(0.0, float(daily_targets.get(k) or 0) - float(consumed.get(k) or 0))
+        for k in ("protein_g", "fat_g", "carb_g", "kcal")
+    }
+
+
+async def _timed(coro, timings: Dict[str, float], stage: str):
+    start = time.perf_counter()
+    try:
+        return await coro
+    finally:
+        timings[stage] = _elapsed_ms(start)
+
+
+def downstream_payloads(req: AnalyzeMealRequest, estimate: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Build the compare and suggestions payloads that follow an estimate"""
+    per_meal_targets = req.per_meal_targets.model_dump()
+    daily_targets = req.daily_targets.model_dump()
+    consumed = req.daily_consumed_so_far.model_dump()
+    compare_payload = {
+        "per_meal_targets": per_meal_targets,
+        "daily_targets": daily_targets,
+        "daily_consumed_so_far": consumed,
+        "current_meal": estimate["totals"],
+        "meal_index": req.meal_index,
+        "meals_per_day": req.meals_per_day,
+        "meal_name": req.meal_name,
+        "diabetes_type": req.diabetes_type,
+    }
+    suggestions_payload = {
+        "estimate": estimate,
+        "per_meal_targets": per_meal_targets,
+        "daily_remaining": daily_remaining(daily_targets, consumed),
+        "meal_name": req.meal_name,
+        "diabetes_type": req.diabetes_type,
+    }
+    return compare_payload, suggestions_payload
+
+
+def parse_analyze_context(context: str) -> AnalyzeMealRequest:
+    try:
+        return AnalyzeMealRequest.model_validate_json(context)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+
+
+async def analyze_meal_endpoint(image: UploadFile, context: str, use_cache: bool = True):
+    """
+    POST /meal/analyze
+    Photo + targets → estimate, comparison and suggestions in one round trip
+    """
+    started = time.perf_counter()
+    timings: Dict[str, float] = {}
+    try:
+        req = parse_analyze_context(context)
+
+        contents = await image.read() if image is not None else b""
+        if len(contents) == 0:
+            raise HTTPException(status_code=400, detail="Empty image file")
+
+        prepared = await _timed(prepare_image(contents), timings, "preprocess")
+        estimate = await _timed(
+            estimate_food_from_image(prepared.data_uri, detail=prepared.detail, image_hash=prepared.phash),
+            timings,
+            "estimate",
+        )
+
+        # Comparison and suggestions both depend only on the estimate
+        compare_payload, suggestions_payload = downstream_payloads(req, estimate)
+        comparison, suggestions = await asyncio.gather(
+            _timed(compare_meal_to_targets(compare_payload, use_cache=use_cache), timings, "compare"),
+            _timed(generate_meal_suggestions(suggestions_payload, use_cache=use_cache), timings, "suggestions"),
+        )
+        timings["total"] = _elapsed_ms(started)
+        log.info("meal analysis complete", extra={"timings_ms": timings})
+
+        return json_response(
+            "analyze",
+            {
+                "estimate": estimate,
+                "comparison": comparison,
+                "suggestions": suggestions,
+                "timings_ms": timings,
+            },
+            headers=image_savings_headers(prepared),
+        )
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ Error: {type(e).__name__}: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"{type(e).__name__}: {str(e)}")
+        log.exception("meal analysis failed")
+        raise upstream_error(e, f"{type(e).__name__}: {str(e)}")
+
+
+async def estimate_stream_endpoint(
+    image: UploadFile,
+    context: Optional[str] = None,
+    fmt: str = "sse",
+    use_cache: bool = True,
+):
+    """
+    POST /estimate/stream
+    Progressive /estimate: each food item as soon as the model finishes it,
+    then totals, then (when `context` targets are sent) comparison and suggestions
+    """
+    started = time.perf_counter()
+    timings: Dict[str, float] = {}
+    req = parse_analyze_context(context) if context else None
+    contents = await image.read() if image is not None else b""
+    if len(contents) == 0:
+        raise HTTPException(status_code=400, detail="Empty image file")
+    # Decode errors surface as a plain HTTP error before the stream opens
+    prepared = await _timed(prepare_image(contents), timings, "preprocess")
+    frame = ndjson_event if fmt == "ndjson" else sse_event
+
+    async def events():
+        try:
+            estimate: Dict[str, Any] = {}
+            async for kind, data in stream_food_estimate(
+                prepared.data_uri, detail=prepared.detail, image_hash=prepared.phash
+            ):
+                if kind == "item":
+                    if "first_item" not in timings:
+                        timings["first_item"] = _elapsed_ms(started)
+                    yield frame("item", data)
+                else:
+                    estimate = data
+            timings["estimate"] = _elapsed_ms(started)
+            yield frame("totals", {
+                "totals": estimate.get("totals"),
+                "calories_range": estimate.get("calories_range"),
+                "assumptions": estimate.get("assumptions", []),
+                "warnings": estimate.get("warnings", []),
+                "model_info": estimate.get("model_info", ""),
+            })
+
+            if req is not None:
+                compare_payload, suggestions_payload = downstream_payloads(req, estimate)
+
+                async def stage(name: str, coro):
+                    return name, await _timed(coro, timings, name)
 
+                pending = [
+                    stage("comparison", compare_meal_to_targets(compare_payload, use_cache=use_cache)),
+                    stage("suggestions", generate_meal_suggestions(suggestions_payload, use_cache=use_cache)),
+                ]
+                # Whichever downstream stage finishes first is sent first
+                for next_done in asyncio.as_completed(pending):
+                    name, result = await next_done
+                    yield frame(name, result)
 
-def calc_budget_endpoint(req: BudgetRequest):
+            timings["total"] = _elapsed_ms(started)
+            yield frame("done", {"timings_ms": timings})
+        except Exception as e:
+            log.exception("estimate stream failed")
+            yield frame("error", {"detail": f"{type(e).__name__}: {str(e)}"})
+
+    headers = image_savings_headers(prepared)
+    headers.update({"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    media_type = "application/x-ndjson" if fmt == "ndjson" else "text/event-stream"
+    return StreamingResponse(events(), media_type=media_type, headers=headers)
+
+
+async def calc_budget_endpoint(req: BudgetRequest):
     """
     POST /budget
     Calculate daily calorie and macro budget + per-meal targets
@@ -88,12 +316,94 @@ def calc_budget_endpoint(req: BudgetRequest):
             diabetes_type=req.diabetes_type,
             meals_per_day=req.meals_per_day,
         )
-        return JSONResponse(result)
+        return json_response("budget", result)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-def compare_meal_endpoint(req: CompareMealRequest):
+async def food_search_endpoint(q: str, limit: int = 10):
+    """
+    GET /foods/search
+    Autocomplete over the local food table (names and aliases, typo tolerant)
+    """
+    with stage_seconds.time(stage="food_search", endpoint="foods_search"):
+        results = food_table.search(q, limit=max(1, min(limit, 50)))
+    return json_response("foods_search", {"query": q, "results": results})
+
+
+BUDGET_FIELDS = tuple(BudgetRequest.model_fields)
+
+
+async def _request_lines(request: Request) -> AsyncIterator[str]:
+    """Yield non-empty lines of a request body as it streams in"""
+    pending = b""
+    async for chunk in request.stream():
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            line = line.strip()
+            if line:
+                yield line.decode("utf-8")
+    if pending.strip():
+        yield pending.strip().decode("utf-8")
+
+
+async def _budget_rows(request: Request) -> AsyncIterator[Dict[str, Any]]:
+    """Profiles from a JSON, NDJSON or CSV body (NDJSON/CSV parsed incrementally)"""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in ("application/x-ndjson", "application/jsonl", "application/ndjson"):
+        async for line in _request_lines(request):
+            yield json.loads(line)
+    elif content_type in ("text/csv", "application/csv"):
+        header: Optional[List[str]] = None
+        async for line in _request_lines(request):
+            cells = next(csv.reader([line]))
+            if header is None:
+                header = [c.strip() for c in cells]
+                continue
+            # Blank optional cells fall back to model defaults
+            yield {k: v.strip() for k, v in zip(header, cells) if v.strip()}
+    else:
+        body = await request.json()
+        for row in body["profiles"] if isinstance(body, dict) else body:
+            yield row
+
+
+async def batch_budget_endpoint(request: Request):
+    """
+    POST /budget/batch
+    Budgets for many profiles at once (JSON list/{"profiles": [...]}, NDJSON or CSV).
+    Rows that fail validation get a null result and an entry in `errors`.
+    """
+    columns: Dict[str, List[Any]] = {field: [] for field in BUDGET_FIELDS}
+    positions: List[int] = []
+    errors: List[Dict[str, Any]] = []
+    rows = 0
+    try:
+        async for row in _budget_rows(request):
+            try:
+                req = BudgetRequest.model_validate(row)
+            except ValidationError as e:
+                errors.append({"row": rows, "detail": e.errors(include_url=False, include_input=False)})
+            else:
+                for field in BUDGET_FIELDS:
+                    columns[field].append(getattr(req, field))
+                positions.append(rows)
+            rows += 1
+    except (ValueError, KeyError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Unreadable batch body: {type(e).__name__}: {str(e)}")
+
+    try:
+        budgets = await asyncio.to_thread(calculate_budget_batch, **columns) if positions else []
+        results: List[Optional[Dict[str, Any]]] = [None] * rows
+        for position, budget in zip(positions, budgets):
+            results[position] = budget
+        return json_response("budget_batch", {"count": len(positions), "results": results, "errors": errors})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def compare_meal_endpoint(req: CompareMealRequest, use_cache: bool = True):
     """
     POST /llm/compare
     Compare current meal against per-meal and daily targets
@@ -109,19 +419,18 @@ def compare_meal_endpoint(req: CompareMealRequest):
             "meal_name": req.meal_name,
             "diabetes_type": req.diabetes_type,
         }
-        result = compare_meal_to_targets(payload)
-        return JSONResponse(result)
+        result = await compare_meal_to_targets(payload, use_cache=use_cache)
+        return json_response("compare", result)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise upstream_error(e, str(e))
 
 
-def suggestions_endpoint(req: SuggestionsRequest):
+async def suggestions_endpoint(req: SuggestionsRequest, use_cache: bool = True):
     """
     POST /llm/suggestions
     Generate actionable meal suggestions
     """
     try:
-        print(f"📝 Generating suggestions for meal: {req.meal_name}")
         payload = {
             "estimate": req.estimate,
             "per_meal_targets": req.per_meal_targets.model_dump(),
@@ -129,39 +438,35 @@ def suggestions_endpoint(req: SuggestionsRequest):
             "meal_name": req.meal_name,
             "diabetes_type": req.diabetes_type,
         }
-        print(f"   Payload keys: {list(payload.keys())}")
-        result = generate_meal_suggestions(payload)
-        print(f"✅ Suggestions endpoint complete")
-        return JSONResponse(result)
+        result = await generate_meal_suggestions(payload, use_cache=use_cache)
+        return json_response("suggestions", result)
     except Exception as e:
-        print(f"❌ Error in suggestions_endpoint: {type(e).__name__}: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"{type(e).__name__}: {str(e)}")
+        log.exception("suggestions failed")
+        raise upstream_error(e, f"{type(e).__name__}: {str(e)}")
 
 
-def copy_endpoint(req: CopyRequest):
+async def copy_endpoint(req: CopyRequest, use_cache: bool = True):
     """
     POST /llm/copy
     Generate short notification copy
     """
     try:
         payload = req.model_dump()
-        result = generate_reminder_copy(payload)
-        return JSONResponse(result)
+        result = await generate_reminder_copy(payload, use_cache=use_cache)
+        return json_response("copy", result)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise upstream_error(e, str(e))
 
 
-def daily_summary_endpoint(req: DailySummaryRequest):
+async def daily_summary_endpoint(req: DailySummaryRequest, use_cache: bool = True):
     """
     POST /llm/daily_summary
     Generate end-of-day summary
     """
     try:
         payload = req.model_dump()
-        result = generate_daily_summary(payload)
-        return JSONResponse(result)
+        result = await generate_daily_summary(payload, use_cache=use_cache)
+        return json_response("daily_summary", result)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise upstream_error(e, str(e))
 
@@ -0,0 +1,96 @@
+"""
+Process health: event-loop lag and memory, for /runtime/stats, /metrics and
+the load-test suite (bench/)
+"""
+import os
+import sys
+import time
+import asyncio
+import resource
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from .metrics import Gauge, loop_lag_seconds
+
+# -------- Config --------
+# How often the loop-lag probe wakes; 0 disables it
+LOOP_LAG_INTERVAL_S = float(os.getenv("HEAL_LOOP_LAG_INTERVAL", "0.1"))
+# Recent probes kept for /runtime/stats percentiles (100 x 0.1s = last 10s)
+LOOP_LAG_WINDOW = int(os.getenv("HEAL_LOOP_LAG_WINDOW", "100"))
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_bytes() -> int:
+    """Current resident set size (falls back to the peak where /proc is missing)"""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return max_rss_bytes()
+
+
+def max_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class LoopLagMonitor:
+    """
+    Sleep for a fixed interval and measure how much later than asked the
+    loop woke us: anything beyond the interval is time the loop spent
+    running something else without yielding (CPU work, blocking calls).
+    """
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL_S, window: int = LOOP_LAG_WINDOW):
+        self.interval = interval
+        self._recent: Deque[Tuple[float, float]] = deque(maxlen=window)
+        self.samples = 0
+        self.max_lag = 0.0
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - started - self.interval)
+            self._recent.append((time.monotonic(), lag))
+            self.samples += 1
+            self.max_lag = max(self.max_lag, lag)
+            loop_lag_seconds.observe(lag)
+
+    def stats(self, window_s: Optional[float] = None) -> Dict[str, Any]:
+        """Percentiles over the recent probes, or only those of the last `window_s` seconds"""
+        cutoff = time.monotonic() - window_s if window_s is not None else float("-inf")
+        ordered = sorted(lag for at, lag in self._recent if at >= cutoff)
+
+        def pct(q: float) -> float:
+            if not ordered:
+                return 0.0
+            return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+
+        return {
+            "interval_ms": self.interval * 1000,
+            "samples": self.samples,
+            "recent_samples": len(ordered),
+            "recent_p50_ms": pct(0.5),
+            "recent_p99_ms": pct(0.99),
+            "recent_max_ms": round(max(ordered, default=0.0) * 1000, 2),
+            "max_ms": round(self.max_lag * 1000, 2),
+        }
+
+
+loop_lag = LoopLagMonitor()
+
+resident_memory = Gauge("heal_process_resident_memory_bytes", "Resident memory of this worker process", rss_bytes)
+max_resident_memory = Gauge("heal_process_max_resident_memory_bytes", "Peak resident memory of this worker process", max_rss_bytes)
+
+
+def runtime_stats(window_s: Optional[float] = None) -> Dict[str, Any]:
+    return {
+        "pid": os.getpid(),
+        "rss_bytes": rss_bytes(),
+        "max_rss_bytes": max_rss_bytes(),
+        "event_loop_lag": loop_lag.stats(window_s),
+    }
@@ -3,6 +3,8 @@ OpenAI JSON schema definitions for structured outputs
 """
 from typing import Dict, Any
 
+from .foods import CATEGORIES, COOKING_METHODS
+
 
 def food_estimate_schema() -> Dict[str, Any]:
     """Schema for food photo → calorie/macro estimation"""
@@ -85,6 +87,43 @@ def food_estimate_schema() -> Dict[str, Any]:
     }
 
 
+def food_items_schema() -> Dict[str, Any]:
+    """Schema for food photo → identified items and grams only (HEAL_ESTIMATE_MODE=lookup)"""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "food_items",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "additionalProperties": False,
+                "properties": {
+                    "items": {
+                        "type": "array",
+                        "maxItems": 8,
+                        "items": {
+                            "type": "object",
+                            "required": ["name", "display_name", "category", "cooking_method", "grams", "confidence"],
+                            "additionalProperties": False,
+                            "properties": {
+                                "name": {"type": "string"},
+                                "display_name": {"type": "string"},
+                                "category": {"type": "string", "enum": list(CATEGORIES)},
+                                "cooking_method": {"type": "string", "enum": list(COOKING_METHODS)},
+                                "grams": {"type": "number"},
+                                "confidence": {"type": "number", "minimum": 0, "maximum": 1}
+                            }
+                        }
+                    },
+                    "assumptions": {"type": "array", "items": {"type": "string"}},
+                    "warnings": {"type": "array", "items": {"type": "string"}}
+                },
+                "required": ["items", "assumptions", "warnings"]
+            }
+        }
+    }
+
+
 def meal_compare_schema() -> Dict[str, Any]:
     """Schema for comparing meal against targets"""
     return {
@@ -232,6 +271,26 @@ def meal_compare_schema() -> Dict[str, Any]:
     }
 
 
+def compare_notes_schema() -> Dict[str, Any]:
+    """Schema for the wording-only pass over a locally computed comparison"""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "meal_compare_notes",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "additionalProperties": False,
+                "properties": {
+                    "notes": {"type": "array", "maxItems": 4, "items": {"type": "string"}},
+                    "model_info": {"type": "string"}
+                },
+                "required": ["notes", "model_info"]
+            }
+        }
+    }
+
+
 def suggestions_schema() -> Dict[str, Any]:
     """Schema for actionable meal suggestions"""
     return {
@@ -276,6 +335,39 @@ def suggestions_schema() -> Dict[str, Any]:
     }
 
 
+def suggestion_wording_schema() -> Dict[str, Any]:
+    """Schema for the wording-only pass over locally optimized suggestions"""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "meal_suggestions_wording",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "additionalProperties": False,
+                "properties": {
+                    "actions": {
+                        "type": "array",
+                        "maxItems": 8,
+                        "items": {
+                            "type": "object",
+                            "required": ["kind", "text"],
+                            "additionalProperties": False,
+                            "properties": {
+                                "kind": {"type": "string", "enum": ["portion", "swap", "timing", "order", "add", "remove", "other"]},
+                                "text": {"type": "string"}
+                            }
+                        }
+                    },
+                    "rationale": {"type": "array", "maxItems": 4, "items": {"type": "string"}},
+                    "model_info": {"type": "string"}
+                },
+                "required": ["actions", "rationale", "model_info"]
+            }
+        }
+    }
+
+
 def reminder_copy_schema() -> Dict[str, Any]:
     """Schema for notification copy generation"""
     return {
@@ -0,0 +1,102 @@
+"""
+Incremental parsing of streamed structured-output JSON and SSE/NDJSON framing
+"""
+import json
+from typing import Any, Dict, List, Optional
+
+
+class ItemStreamParser:
+    """
+    Feed text deltas of a streamed JSON object; get back each element of the
+    top-level `items` array as soon as its closing brace arrives.
+    Scans every character once and only buffers the item or key being read
+    (deltas are joined once, in result()), so total cost is linear in the
+    response size.
+    """
+
+    def __init__(self, array_key: str = "items"):
+        self.array_key = array_key
+        self._chunks: List[str] = []
+        # Text from absolute offset _buf_start on; trimmed after every delta
+        self._buf = ""
+        self._buf_start = 0
+        self._pos = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_key: Optional[str] = None
+        self._array_depth: Optional[int] = None
+        self._item_start: Optional[int] = None
+        self.items_done = False
+
+    @property
+    def text(self) -> str:
+        return "".join(self._chunks)
+
+    def feed(self, delta: str) -> List[Dict[str, Any]]:
+        self._chunks.append(delta)
+        self._buf += delta
+        completed: List[Dict[str, Any]] = []
+        buf, base, stack = self._buf, self._buf_start, self._stack
+        end = base + len(buf)
+        for pos in range(self._pos, end):
+            ch = buf[pos - base]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if len(stack) == 1:
+                        self._last_key = buf[self._string_start + 1 - base:pos - base]
+                continue
+            if ch == '"':
+                self._in_string = True
+                self._string_start = pos
+            elif ch in "{[":
+                stack.append(ch)
+                if (
+                    ch == "["
+                    and len(stack) == 2
+                    and self._last_key == self.array_key
+                    and self._array_depth is None
+                ):
+                    self._array_depth = len(stack)
+                elif ch == "{" and self._array_depth is not None and len(stack) == self._array_depth + 1:
+                    self._item_start = pos
+            elif ch in "}]":
+                if (
+                    ch == "}"
+                    and self._item_start is not None
+                    and len(stack) == (self._array_depth or 0) + 1
+                ):
+                    completed.append(json.loads(buf[self._item_start - base:pos + 1 - base]))
+                    self._item_start = None
+                elif ch == "]" and self._array_depth is not None and len(stack) == self._array_depth:
+                    self.items_done = True
+                if stack:
+                    stack.pop()
+        self._pos = end
+        # Keep only what an open item or top-level key string still needs
+        keep = end
+        if self._item_start is not None:
+            keep = self._item_start
+        if self._in_string and len(stack) == 1:
+            keep = min(keep, self._string_start)
+        self._buf = buf[keep - base:]
+        self._buf_start = keep
+        return completed
+
+    def result(self) -> Dict[str, Any]:
+        """Parse the complete document once the stream has ended"""
+        return json.loads(self.text)
+
+
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def ndjson_event(event: str, data: Any) -> str:
+    return json.dumps({"event": event, "data": data}, ensure_ascii=False) + "\n"
@@ -0,0 +1,101 @@
+"""
+Unit tests for upstream circuit breakers (backend/breaker.py)
+"""
+import asyncio
+
+import pytest
+
+from backend import breaker as breaker_module
+from backend.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen
+from backend.latency import DeadlineExceeded
+from backend.ratelimit import RateLimitQueueTimeout
+
+
+@pytest.fixture(autouse=True)
+def _config(monkeypatch):
+    monkeypatch.setattr(breaker_module, "BREAKER_ENABLED", True)
+    monkeypatch.setattr(breaker_module, "BREAKER_MIN_CALLS", 4)
+    monkeypatch.setattr(breaker_module, "BREAKER_FAILURE_RATE", 0.5)
+    monkeypatch.setattr(breaker_module, "BREAKER_SLOW_CALL_S", 0.05)
+    monkeypatch.setattr(breaker_module, "BREAKER_OPEN_S", 30)
+    monkeypatch.setattr(breaker_module, "BREAKER_HALF_OPEN_PROBES", 1)
+
+
+def _call(breaker, error=None, seconds=0.0):
+    async def run():
+        async with breaker.guard():
+            await asyncio.sleep(seconds)
+            if error is not None:
+                raise error
+    return asyncio.run(run())
+
+
+def _fail(breaker):
+    with pytest.raises(RateLimitQueueTimeout):
+        _call(breaker, RateLimitQueueTimeout("queue full"))
+
+
+def test_full_cycle_closed_open_half_open_closed():
+    breaker = CircuitBreaker("m/e")
+    _call(breaker)
+    _call(breaker)
+    _fail(breaker)
+    assert breaker.state == CLOSED
+    _fail(breaker)  # 2 of 4 failed
+    assert breaker.state == OPEN and breaker.trips == 1
+
+    with pytest.raises(CircuitOpen) as info:
+        _call(breaker)
+    assert info.value.retry_after > 1 and breaker.rejected == 1
+
+    breaker._opened_at -= 31
+    assert breaker.allow() and breaker.state == HALF_OPEN
+    # Only one probe at a time while half-open
+    assert not breaker.allow()
+    breaker.record(True)
+    assert breaker.state == CLOSED and breaker.stats()["recent_calls"] == 0
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker("m/e")
+    for _ in range(4):
+        _fail(breaker)
+    breaker._opened_at -= 31
+    _fail(breaker)
+    assert breaker.state == OPEN and breaker.trips == 2
+
+
+def test_slow_calls_count_as_failures():
+    breaker = CircuitBreaker("m/e")
+    for _ in range(2):
+        _call(breaker)
+    for _ in range(2):
+        _call(breaker, seconds=0.06)
+    assert breaker.state == OPEN
+
+
+def test_slow_deadline_counts_but_client_errors_do_not():
+    breaker = CircuitBreaker("m/e")
+    for _ in range(4):
+        with pytest.raises(ValueError):
+            _call(breaker, ValueError("bad request"))
+        with pytest.raises(DeadlineExceeded):
+            _call(breaker, DeadlineExceeded("client gave up early"))
+    assert breaker.state == CLOSED and breaker.stats()["recent_calls"] == 0
+
+    for _ in range(4):
+        with pytest.raises(DeadlineExceeded):
+            _call(breaker, DeadlineExceeded("upstream too slow"), seconds=0.06)
+    assert breaker.state == OPEN
+
+
+def test_probe_without_verdict_is_released():
+    breaker = CircuitBreaker("m/e")
+    for _ in range(4):
+        _fail(breaker)
+    breaker._opened_at -= 31
+    with pytest.raises(ValueError):
+        _call(breaker, ValueError("bad request"))
+    assert breaker.state == HALF_OPEN
+    _call(breaker)
+    assert breaker.state == CLOSED
@@ -0,0 +1,120 @@
+"""
+Unit tests for batch budgets (nutrition.calculate_budget_batch, POST /budget/batch)
+"""
+import json
+import random
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.main import app
+from backend.nutrition import ACTIVITY_FACTORS, calculate_budget, calculate_budget_batch
+
+FIELDS = ("height_cm", "weight_kg", "age", "sex", "exercise_level", "diabetes_type", "meals_per_day")
+PROFILE = {"height_cm": 170, "weight_kg": 70, "age": 40, "sex": "female", "exercise_level": "light", "diabetes_type": "T2D"}
+
+client = TestClient(app)
+
+
+def _batch(profiles):
+    return calculate_budget_batch(**{f: [p[f] for p in profiles] for f in FIELDS})
+
+
+def _random_profile(rng):
+    return {
+        "height_cm": round(rng.uniform(120, 220), rng.choice((0, 1, 2))),
+        "weight_kg": round(rng.uniform(30, 200), rng.choice((0, 1, 2))),
+        "age": rng.randint(10, 120),
+        "sex": rng.choice(("male", "female")),
+        "exercise_level": rng.choice(list(ACTIVITY_FACTORS) + ["unknown_level"]),
+        "diabetes_type": rng.choice(("T1D", "T2D", "unknown")),
+        "meals_per_day": rng.randint(1, 8),
+    }
+
+
+# -------- calculate_budget_batch --------
+@pytest.mark.parametrize("seed", range(10))
+def test_batch_matches_scalar_on_random_profiles(seed):
+    rng = random.Random(seed)
+    profiles = [_random_profile(rng) for _ in range(500)]
+    assert _batch(profiles) == [calculate_budget(**p) for p in profiles]
+
+
+def test_batch_matches_scalar_on_rounding_ties():
+    # Weights on a 0.01 grid put many daily and per-meal values on x.x5 ties
+    profiles = [
+        {**PROFILE, "weight_kg": 40 + k / 100, "height_cm": 150 + k % 7 / 4, "meals_per_day": k % 8 + 1}
+        for k in range(5000)
+    ]
+    assert _batch(profiles) == [calculate_budget(**p) for p in profiles]
+
+
+@pytest.mark.parametrize("meals", [1, 3, 7, 8])
+def test_batch_meals_per_day(meals):
+    (result,) = _batch([{**PROFILE, "meals_per_day": meals}])
+    assert result == calculate_budget(**PROFILE, meals_per_day=meals)
+    assert result["meals_per_day"] == meals
+
+
+def test_batch_defaults_to_three_meals_and_handles_empty_input():
+    args = {f: [PROFILE[f]] for f in FIELDS if f != "meals_per_day"}
+    assert calculate_budget_batch(**args) == [calculate_budget(**PROFILE)]
+    assert calculate_budget_batch(**{f: [] for f in FIELDS}) == []
+
+
+# -------- POST /budget/batch --------
+def _expected(*profiles):
+    return [calculate_budget(**p) for p in profiles]
+
+
+def test_endpoint_json_list_and_object():
+    other = {**PROFILE, "sex": "male", "meals_per_day": 5}
+    for body in ([PROFILE, other], {"profiles": [PROFILE, other]}):
+        response = client.post("/budget/batch", json=body)
+        assert response.status_code == 200
+        assert response.json() == {"count": 2, "results": _expected(PROFILE, other), "errors": []}
+
+
+def test_endpoint_ndjson():
+    other = {**PROFILE, "age": 65}
+    body = "\n".join(json.dumps(p) for p in (PROFILE, other)) + "\n\n"
+    response = client.post("/budget/batch", content=body, headers={"content-type": "application/x-ndjson"})
+    assert response.status_code == 200
+    assert response.json()["results"] == _expected(PROFILE, other)
+
+
+def test_endpoint_csv_with_blank_optional_cells():
+    body = (
+        "height_cm,weight_kg,age,sex,exercise_level,diabetes_type,meals_per_day\n"
+        "170,70,40,female,light,T2D,4\n"
+        "180,85,30,male,active,,\n"
+    )
+    response = client.post("/budget/batch", content=body, headers={"content-type": "text/csv"})
+    assert response.status_code == 200
+    assert response.json()["results"] == _expected(
+        {**PROFILE, "meals_per_day": 4},
+        {"height_cm": 180, "weight_kg": 85, "age": 30, "sex": "male", "exercise_level": "active", "diabetes_type": "unknown"},
+    )
+
+
+def test_endpoint_reports_invalid_rows_in_place():
+    rows = [PROFILE, {**PROFILE, "age": 5}, {**PROFILE, "meals_per_day": 9}, {"height_cm": 170}, PROFILE]
+    response = client.post("/budget/batch", json=rows)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["count"] == 2
+    assert body["results"][0] == body["results"][4] == calculate_budget(**PROFILE)
+    assert body["results"][1:4] == [None, None, None]
+    assert [e["row"] for e in body["errors"]] == [1, 2, 3]
+    assert body["errors"][0]["detail"][0]["loc"] == ["age"]
+    assert {e["loc"][0] for e in body["errors"][2]["detail"]} >= {"weight_kg", "age", "sex", "exercise_level"}
+
+
+@pytest.mark.parametrize("body, content_type", [
+    ("{not json", "application/json"),
+    ('{"rows": []}', "application/json"),
+    ("{bad line}\n", "application/x-ndjson"),
+])
+def test_endpoint_rejects_unreadable_bodies(body, content_type):
+    response = client.post("/budget/batch", content=body, headers={"content-type": content_type})
+    assert response.status_code == 400
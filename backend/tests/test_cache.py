@@ -0,0 +1,133 @@
+"""
+Unit tests for the in-process caches (backend/cache.py)
+"""
+import time
+import asyncio
+
+import pytest
+
+from backend.cache import PerceptualCache, SimilarityCache, SingleFlight
+
+
+# -------- PerceptualCache --------
+def test_perceptual_near_hit():
+    cache = PerceptualCache(maxsize=10, ttl=60, max_distance=4)
+    cache.set(0b1111, "plate")
+    assert cache.get(0b1110) == "plate"
+    assert cache.stats()["near_hits"] == 1
+
+
+def test_perceptual_expired_neighbour_does_not_shadow_live_one():
+    cache = PerceptualCache(maxsize=10, ttl=60, max_distance=4)
+    cache.set(0b0001, "expired", ttl=0.01)
+    cache.set(0b0111, "live")
+    time.sleep(0.02)
+    assert cache.get(0b0000) == "live"
+    assert cache.stats()["near_hits"] == 1
+
+
+def test_perceptual_near_hit_counted_only_when_served():
+    cache = PerceptualCache(maxsize=10, ttl=60, max_distance=4)
+    cache.set(0b0001, "expired", ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get(0b0000) is None
+    stats = cache.stats()
+    assert stats["near_hits"] == 0 and stats["hits"] == 0 and stats["misses"] == 1
+
+
+# -------- SimilarityCache --------
+def test_similarity_index_follows_evictions():
+    cache = SimilarityCache(maxsize=100, ttl=60)
+    for k in range(10_000):
+        cache.store(k, (k % 7, 1), k)
+    assert len(cache) == 100
+    assert sum(len(vectors) for vectors in cache._groups.values()) == 100
+
+
+def test_similarity_index_follows_expiry():
+    cache = SimilarityCache(maxsize=10, ttl=60)
+    cache.store("g", (0,), "old", ttl=0.01)
+    time.sleep(0.02)
+    assert cache.get(("g", (0,))) is None
+    assert "g" not in cache._groups
+
+
+def test_similarity_expired_neighbour_does_not_shadow_live_one():
+    cache = SimilarityCache(maxsize=10, ttl=60, tolerance=2)
+    cache.store("g", (0, 0), "expired", ttl=0.01)
+    cache.store("g", (2, 0), "live")
+    time.sleep(0.02)
+    assert cache.lookup("g", (0, 0)) == ("live", 2)
+    assert cache.stats()["near_hits"] == 1
+
+
+def test_similarity_tolerance_and_groups():
+    cache = SimilarityCache(maxsize=10, ttl=60, tolerance=1)
+    cache.store("dinner", (10, 10), "advice")
+    assert cache.lookup("dinner", (11, 9)) == ("advice", 1)
+    assert cache.lookup("dinner", (12, 10)) == (None, -1)
+    assert cache.lookup("lunch", (10, 10)) == (None, -1)
+
+
+# -------- SingleFlight --------
+def test_singleflight_coalesces_concurrent_calls():
+    flight, calls = SingleFlight(), []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"items": [1]}
+
+    async def main():
+        return await asyncio.gather(*(flight.do("k", fetch) for _ in range(5)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1 and all(r == {"items": [1]} for r in results)
+    # Followers get copies, not the leader's object
+    assert len({id(r) for r in results}) == 5
+    assert flight.stats() == {"in_flight": 0, "upstream_calls": 1, "upstream_calls_saved": 4}
+
+
+def test_singleflight_fans_out_exceptions_and_forgets_the_key():
+    flight, calls = SingleFlight(), []
+
+    async def fail():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def main():
+        results = await asyncio.gather(*(flight.do("k", fail) for _ in range(3)), return_exceptions=True)
+        # A failed call is not cached: the next caller starts a new one
+        retry = await asyncio.gather(flight.do("k", fail), return_exceptions=True)
+        return results + retry
+
+    results = asyncio.run(main())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert len(calls) == 2 and len(flight) == 0
+
+
+def test_singleflight_caller_cancelling_does_not_cancel_the_call():
+    flight = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def main():
+        leader = asyncio.ensure_future(flight.do("k", fetch))
+        follower = asyncio.ensure_future(flight.do("k", fetch))
+        await asyncio.sleep(0.005)
+        follower.cancel()
+        leader_result = await leader
+        with pytest.raises(asyncio.CancelledError):
+            await follower
+        # Cancelling the leader's caller doesn't stop the others either
+        first = asyncio.ensure_future(flight.do("j", fetch))
+        second = asyncio.ensure_future(flight.do("j", fetch))
+        await asyncio.sleep(0.005)
+        first.cancel()
+        return leader_result, await second
+
+    assert asyncio.run(main()) == ("done", "done")
+    assert flight.stats()["upstream_calls"] == 2
@@ -0,0 +1,113 @@
+"""
+Unit tests for the /estimate model cascade (backend/cascade.py, llm.estimate_food_from_image)
+"""
+import asyncio
+
+import pytest
+
+from backend import llm
+from backend.cascade import FAST, FULL, CascadeStats, escalation_reasons
+from backend.latency import DeadlineExceeded
+
+
+def _item(name="white rice", confidence=0.9):
+    return {"name": name, "category": "grain", "grams": 150, "confidence": confidence}
+
+
+def _estimate(*items, warnings=()):
+    return {"items": list(items), "totals": {"kcal": 200}, "warnings": list(warnings)}
+
+
+# -------- escalation_reasons --------
+def test_confident_small_plate_is_accepted():
+    assert escalation_reasons(_estimate(_item(), _item("broccoli", 0.7))) == []
+
+
+@pytest.mark.parametrize("result, reasons", [
+    (None, ["no_result"]),
+    ({}, ["no_result"]),
+    (_estimate(), ["no_items"]),
+    (_estimate(_item(confidence=0.69)), ["low_confidence"]),
+    (_estimate(_item(confidence=None)), ["low_confidence"]),
+    (_estimate(*[_item()] * 4), ["too_many_items"]),
+    (_estimate(_item(), warnings=["blurry"]), ["warnings"]),
+    (_estimate(*[_item(confidence=0.1)] * 4, warnings=["blurry"]), ["low_confidence", "too_many_items", "warnings"]),
+])
+def test_escalation_reasons(result, reasons):
+    assert escalation_reasons(result) == reasons
+
+
+# -------- estimate_food_from_image --------
+@pytest.fixture
+def cascade(monkeypatch):
+    """Cascade on, model calls answered by `answers[role]` (a result or an exception)"""
+    monkeypatch.setattr(llm, "CASCADE_ENABLED", True)
+    monkeypatch.setattr(llm, "ESTIMATE_MODE", "llm")
+    stats = CascadeStats()
+    monkeypatch.setattr(llm, "cascade_stats", stats)
+    answers, calls = {}, []
+
+    async def completion(endpoint, target, **kwargs):
+        calls.append((target.role, kwargs["messages"][1]["content"][1]["image_url"]["detail"]))
+        answer = answers[target.role]
+        if isinstance(answer, BaseException):
+            raise answer
+        return answer
+
+    monkeypatch.setattr(llm, "_structured_completion", completion)
+    return answers, calls, stats
+
+
+def _run(detail="high"):
+    return asyncio.run(llm.estimate_food_from_image("data:image/jpeg;base64,AA==", detail))
+
+
+def test_fast_pass_answers_when_accepted(cascade):
+    answers, calls, stats = cascade
+    answers["vision_fast"] = _estimate(_item())
+    result = _run()
+    assert calls == [("vision_fast", llm.CASCADE_FAST_DETAIL)]
+    assert [i["name"] for i in result["items"]] == ["white rice"]
+    assert stats.answered == {FAST: 1, FULL: 0}
+
+
+def test_escalates_to_full_model(cascade):
+    answers, calls, stats = cascade
+    answers["vision_fast"] = _estimate(_item(confidence=0.3))
+    answers["vision"] = _estimate(_item("brown rice"))
+    result = _run()
+    assert calls == [("vision_fast", llm.CASCADE_FAST_DETAIL), ("vision", "high")]
+    assert [i["name"] for i in result["items"]] == ["brown rice"]
+    assert stats.answered == {FAST: 0, FULL: 1}
+    assert stats.reasons == {"low_confidence": 1}
+
+
+def test_fast_pass_error_escalates(cascade):
+    answers, calls, stats = cascade
+    answers["vision_fast"] = RuntimeError("fast model down")
+    answers["vision"] = _estimate(_item())
+    _run()
+    assert [role for role, _ in calls] == ["vision_fast", "vision"]
+    assert stats.reasons == {"fast_error": 1}
+
+
+def test_deadline_in_fast_pass_is_not_escalated(cascade):
+    answers, calls, stats = cascade
+    answers["vision_fast"] = DeadlineExceeded("request deadline passed")
+    with pytest.raises(DeadlineExceeded):
+        _run()
+    assert [role for role, _ in calls] == ["vision_fast"]
+    assert stats.answered == {FAST: 0, FULL: 0}
+
+
+def test_streamed_estimate_serves_an_accepted_fast_pass(cascade):
+    answers, calls, stats = cascade
+    answers["vision_fast"] = _estimate(_item(), _item("broccoli"))
+
+    async def collect():
+        return [event async for event in llm.stream_food_estimate("data:image/jpeg;base64,AA==")]
+
+    events = asyncio.run(collect())
+    assert [kind for kind, _ in events] == ["item", "item", "estimate"]
+    assert [role for role, _ in calls] == ["vision_fast"]
+    assert stats.answered[FAST] == 1
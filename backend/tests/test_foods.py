@@ -0,0 +1,82 @@
+"""
+Unit tests for food table lookup and trigram search (backend/foods.py)
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+from backend import routes
+from backend.foods import FoodTable
+from backend.main import app
+
+
+def _row(name, category, aliases=""):
+    return {"name": name, "category": category, "kcal": 100, "protein_g": 1, "fat_g": 1, "carb_g": 1, "method": "", "aliases": aliases}
+
+
+TABLE = FoodTable([
+    _row("chicken breast", "protein", "grilled chicken"),
+    _row("fried chicken", "protein"),
+    _row("chickpeas", "protein", "garbanzo"),
+    _row("white rice", "grain", "steamed rice"),
+    _row("fried rice", "mixed"),
+    _row("apple pie", "dessert"),
+    _row("pineapple", "fruit"),
+])
+
+
+def _names(query, limit=10, table=TABLE):
+    return [r["name"] for r in table.search(query, limit=limit)]
+
+
+# -------- search --------
+def test_name_prefix_beats_word_prefix():
+    results = TABLE.search("chick")
+    # Shorter names first among name prefixes, then "fried chicken" on its word prefix
+    assert [r["name"] for r in results] == ["chickpeas", "chicken breast", "fried chicken"]
+    scores = [r["score"] for r in results]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_word_prefix_and_typos():
+    assert set(_names("rice")) == {"white rice", "fried rice"}
+    assert _names("chiken brest")[0] == "chicken breast"
+    assert _names("pinapple")[0] == "pineapple"
+
+
+def test_one_entry_per_food_with_the_matched_alias():
+    results = TABLE.search("grilled chicken")
+    assert [r["name"] for r in results].count("chicken breast") == 1
+    assert results[0]["name"] == "chicken breast" and results[0]["matched"] == "grilled chicken"
+    assert results[0]["score"] == 1.0
+
+
+def test_noise_and_empty_queries():
+    assert _names("zzzz") == []
+    assert _names("") == [] and _names("  !! ") == []
+    assert _names("chicken", limit=0) == []
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3])
+def test_limit_caps_results(limit):
+    assert len(_names("c", limit=limit)) <= limit
+    assert len(_names("chicken", limit=limit)) == limit
+
+
+def test_endpoint_clamps_limit(monkeypatch):
+    monkeypatch.setattr(routes, "food_table", FoodTable([_row(f"chicken dish {k}", "protein") for k in range(80)]))
+    client = TestClient(app)
+    response = client.get("/foods/search", params={"q": "chicken", "limit": 500})
+    assert response.status_code == 200 and len(response.json()["results"]) == 50
+    response = client.get("/foods/search", params={"q": "chicken", "limit": 0})
+    assert len(response.json()["results"]) == 1
+
+
+# -------- find --------
+def test_find_exact_phrase_and_fuzzy():
+    assert TABLE.names[TABLE.find("Fried Chicken!")] == "fried chicken"
+    assert TABLE.names[TABLE.find("spicy fried chicken wings")] == "fried chicken"
+    assert TABLE.names[TABLE.find("chickn breast", "protein")] == "chicken breast"
+    assert TABLE.find("chickn breast", "grain") == -1
+    assert TABLE.find("chickn breast", fuzzy=False) == -1
+    # Short names need a closer match
+    assert TABLE.find("pie", "fruit") == -1
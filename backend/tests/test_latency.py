@@ -0,0 +1,53 @@
+"""
+Unit tests for hedged upstream calls (backend/latency.py)
+"""
+import asyncio
+
+from backend import latency
+from backend.latency import LatencyTracker
+
+
+def _tracker(monkeypatch, p95=0.01):
+    monkeypatch.setattr(latency, "HEDGE_ENABLED", True)
+    monkeypatch.setattr(latency, "HEDGE_MIN_DELAY_S", 0.0)
+    tracker = LatencyTracker()
+    for _ in range(latency.HEDGE_MIN_SAMPLES):
+        tracker.observe("k", p95)
+    return tracker
+
+
+def test_cancelled_caller_leaves_no_attempt_running(monkeypatch):
+    tracker = _tracker(monkeypatch, p95=10.0)
+    started = []
+
+    async def slow():
+        started.append(asyncio.current_task())
+        await asyncio.sleep(60)
+
+    async def main():
+        caller = asyncio.ensure_future(tracker.hedged("k", slow))
+        await asyncio.sleep(0.01)
+        caller.cancel()
+        await asyncio.gather(caller, return_exceptions=True)
+        await asyncio.sleep(0)
+        return [task.done() for task in started]
+
+    assert asyncio.run(main()) == [True]
+
+
+def test_backup_wins_and_primary_is_cancelled(monkeypatch):
+    tracker = _tracker(monkeypatch)
+    attempts = []
+
+    async def call():
+        attempts.append(asyncio.current_task())
+        await asyncio.sleep(60 if len(attempts) == 1 else 0)
+        return len(attempts)
+
+    async def main():
+        result = await tracker.hedged("k", call)
+        await asyncio.sleep(0)
+        return result, attempts[0].cancelled()
+
+    assert asyncio.run(main()) == (2, True)
+    assert tracker.hedges["k"] == {"calls": 1, "fired": 1, "won": 1}
@@ -0,0 +1,161 @@
+"""
+Unit tests for the portion optimizer (nutrition.optimize_portions / suggest_meal)
+"""
+import itertools
+
+import numpy as np
+import pytest
+
+from backend.nutrition import _bounded_lstsq, estimate_from_items, optimize_portions, suggest_meal
+
+TARGETS = {"kcal": 580, "protein_g": 35, "carb_g": 60, "fat_g": 20}
+
+
+def _plate(*items):
+    return estimate_from_items([
+        {"name": name, "category": category, "cooking_method": method, "grams": grams, "confidence": 0.9}
+        for name, category, method, grams in items
+    ])
+
+
+def _brute_force(m, b, lo, hi):
+    """Exact box-constrained least squares: try every variable at lo, at hi or free"""
+    best, best_cost = None, np.inf
+    n = m.shape[1]
+    for states in itertools.product(("lo", "hi", "free"), repeat=n):
+        x = np.where(np.array(states) == "lo", lo, hi).astype(float)
+        free = np.array(states) == "free"
+        if free.any():
+            x[free] = np.linalg.lstsq(m[:, free], b - m[:, ~free] @ x[~free], rcond=None)[0]
+        if np.any(x < lo - 1e-9) or np.any(x > hi + 1e-9):
+            continue
+        cost = np.sum((m @ x - b) ** 2)
+        if cost < best_cost:
+            best, best_cost = x, cost
+    return best, best_cost
+
+
+# -------- _bounded_lstsq --------
+@pytest.mark.parametrize("seed", range(40))
+def test_bounded_lstsq_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(1, 5))
+    m = rng.normal(size=(int(rng.integers(n, n + 5)), n))
+    b = rng.normal(size=m.shape[0]) * 3
+    lo = -rng.uniform(0, 1.5, size=n)
+    hi = rng.uniform(0, 1.5, size=n)
+
+    x = _bounded_lstsq(m, b, lo, hi)
+    assert np.all(x >= lo) and np.all(x <= hi)
+    _, best_cost = _brute_force(m, b, lo, hi)
+    assert np.sum((m @ x - b) ** 2) == pytest.approx(best_cost, rel=1e-6, abs=1e-9)
+
+
+def test_bounded_lstsq_interior_solution_is_unconstrained_lstsq():
+    m = np.array([[1.0, 0.0], [0.0, 2.0], [1.0, 1.0]])
+    b = np.array([0.1, 0.2, 0.15])
+    x = _bounded_lstsq(m, b, np.full(2, -10.0), np.full(2, 10.0))
+    assert x == pytest.approx(np.linalg.lstsq(m, b, rcond=None)[0])
+
+
+def test_bounded_lstsq_zero_width_box():
+    m = np.eye(3)
+    x = _bounded_lstsq(m, np.array([5.0, -5.0, 1.0]), np.zeros(3), np.zeros(3))
+    assert x == pytest.approx(np.zeros(3))
+
+
+# -------- optimize_portions --------
+def test_vegetables_are_never_cut():
+    plate = _plate(
+        ("broccoli", "vegetable", "steamed", 400),
+        ("bok choy", "vegetable", "stir_fried", 300),
+        ("white rice", "grain", "steamed", 400),
+    )
+    plan = optimize_portions(plate, {"kcal": 300, "protein_g": 10, "carb_g": 30, "fat_g": 5}, {})
+    assert plan["deltas"][0] >= 0 and plan["deltas"][1] >= 0
+    assert plan["deltas"][2] < 0
+
+
+def test_only_vegetables_and_lean_protein_grow():
+    plate = _plate(
+        ("white rice", "grain", "steamed", 100),
+        ("fried chicken", "protein", "deep_fried", 60),
+        ("chicken breast", "protein", "grilled", 60),
+        ("broccoli", "vegetable", "steamed", 60),
+    )
+    plan = optimize_portions(plate, {"kcal": 900, "protein_g": 80, "carb_g": 90, "fat_g": 30}, {})
+    deltas = plan["deltas"]
+    assert deltas[0] <= 0 and deltas[1] <= 0
+    assert deltas[2] > 0
+
+
+def test_cuts_never_take_lean_protein_under_the_floor():
+    plate = _plate(
+        ("white rice", "grain", "steamed", 300),
+        ("braised pork", "protein", "braised", 150),
+        ("broccoli", "vegetable", "steamed", 80),
+        ("chicken breast", "protein", "grilled", 60),
+    )
+    for protein_target in (45, 55, 60, 65):
+        targets = {**TARGETS, "protein_g": protein_target}
+        plan = optimize_portions(plate, targets, {})
+        if plan["after"][1] < protein_target:
+            assert plan["deltas"][3] >= 0, protein_target
+        actions = [a["text"] for a in suggest_meal(plate, targets, {})["actions"]]
+        adds_protein = any("lean protein side" in text for text in actions)
+        assert not (adds_protein and any("less chicken breast" in text for text in actions)), actions
+
+
+def test_portions_stay_within_their_boxes():
+    plate = _plate(("white rice", "grain", "steamed", 500), ("braised pork", "protein", "braised", 300))
+    plan = optimize_portions(plate, {"kcal": 200, "protein_g": 10, "carb_g": 20, "fat_g": 5}, {})
+    assert plan["deltas"][0] >= -250 - 1e-9 and plan["deltas"][1] >= -150 - 1e-9
+
+
+def test_on_target_meal_is_left_alone():
+    plate = _plate(("white rice", "grain", "steamed", 150), ("salmon", "protein", "baked", 120), ("broccoli", "vegetable", "steamed", 100))
+    totals = plate["totals"]
+    plan = optimize_portions(plate, {m: totals[m] for m in ("kcal", "protein_g", "carb_g", "fat_g")}, {})
+    assert np.all(plan["deltas"] == 0)
+
+
+# -------- suggest_meal --------
+def test_rationale_reports_off_target_macros_without_items():
+    result = suggest_meal({"items": [], "totals": {"kcal": 900, "protein_g": 30, "carb_g": 120, "fat_g": 20}}, TARGETS, {})
+    assert not any("close to your per-meal targets" in line for line in result["rationale"])
+    assert any(line.startswith("Carbs") and "over" in line for line in result["rationale"])
+    assert any(line.startswith("Energy") and "over" in line for line in result["rationale"])
+
+
+@pytest.mark.parametrize("estimate", [
+    {"items": "x"},
+    {"items": ["x", None, 3]},
+    {"items": [{"name": "rice", "grams": "lots", "nutrition_per_100g": "x"}], "totals": "x"},
+    {"items": [{"name": 5, "grams": None, "nutrition_per_100g": {"kcal": "abc", "carb_g": float("nan")}}]},
+    "not an estimate",
+])
+def test_malformed_estimates_are_tolerated(estimate):
+    result = suggest_meal(estimate, TARGETS, {})
+    assert result["actions"] and result["rationale"]
+    assert all(v >= 0 for v in result["adjusted_macros_after_actions"].values())
+
+
+def test_numeric_strings_are_coerced():
+    plate = _plate(("white rice", "grain", "steamed", 300), ("braised pork", "protein", "braised", 150))
+    loose = {
+        "items": [{**item, "grams": f"{item['grams']:g}g"} for item in plate["items"]] + ["junk"],
+        "totals": {m: str(v) for m, v in plate["totals"].items()},
+    }
+    strict = optimize_portions(plate, TARGETS, {})
+    plan = optimize_portions(loose, TARGETS, {})
+    assert plan["deltas"] == pytest.approx(strict["deltas"])
+    assert plan["after"] == pytest.approx(strict["after"])
+
+
+# -------- estimate_from_items --------
+def test_table_lookup_tolerates_malformed_items():
+    estimate = estimate_from_items(["x", None, {"name": "white rice", "category": 3, "grams": "150g", "confidence": "high"}])
+    assert len(estimate["items"]) == 1
+    item = estimate["items"][0]
+    assert item["grams"] == 150 and item["confidence"] == 0 and item["kcal"] > 0
+    assert estimate_from_items("not a list")["items"] == []
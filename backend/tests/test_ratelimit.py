@@ -0,0 +1,79 @@
+"""
+Unit tests for the client-side RPM/TPM limiter (backend/ratelimit.py)
+"""
+import asyncio
+
+import pytest
+
+from backend import ratelimit
+from backend.ratelimit import RateLimiter, RateLimitQueueTimeout, _Bucket, parse_reset
+
+
+# -------- _Bucket --------
+def test_bucket_refills_at_its_rate_up_to_capacity():
+    bucket = _Bucket(600)  # 10 per second
+    bucket.level = 0
+    bucket._updated -= 2
+    bucket.refill()
+    assert bucket.level == pytest.approx(20, abs=0.1)
+    bucket._updated -= 3600
+    bucket.refill()
+    assert bucket.level == 600
+
+
+def test_bucket_wait_time_covers_debt_and_caps_at_capacity():
+    bucket = _Bucket(600)
+    bucket.level = -10
+    assert bucket.wait_time(10) == pytest.approx(2.0, abs=0.01)
+    bucket.level = 0
+    # Asking for more than the bucket holds waits for a full bucket, not forever
+    assert bucket.wait_time(6000) == pytest.approx(60.0, abs=0.01)
+
+
+def test_parse_reset():
+    assert parse_reset("6m0s") == 360
+    assert parse_reset("250ms") == 0.25
+    assert parse_reset("1.5") == 1.5
+    assert parse_reset("soon") is None and parse_reset(None) is None
+
+
+# -------- RateLimiter --------
+def test_admission_is_fifo():
+    limiter = RateLimiter("m", rpm=60_000, tpm=6000)  # 100 tokens per second
+    limiter.tokens.level = 0
+    admitted = []
+
+    async def call(i, tokens):
+        await limiter.acquire(tokens)
+        admitted.append(i)
+
+    async def main():
+        # The large call at the head of the queue is not overtaken by the small ones behind it
+        await asyncio.gather(call(0, 5), call(1, 1), call(2, 1), call(3, 1))
+
+    asyncio.run(main())
+    assert admitted == [0, 1, 2, 3]
+    stats = limiter.stats()
+    assert stats["admitted"] == 4 and stats["throttled"] >= 1 and stats["waiting"] == 0
+
+
+def test_queue_timeout(monkeypatch):
+    monkeypatch.setattr(ratelimit, "QUEUE_TIMEOUT_S", 0.05)
+    limiter = RateLimiter("m", rpm=60, tpm=100_000)
+    limiter.on_rate_limited(retry_after=30)
+
+    with pytest.raises(RateLimitQueueTimeout):
+        asyncio.run(limiter.acquire(10))
+    stats = limiter.stats()
+    assert stats["queue_timeouts"] == 1 and stats["admitted"] == 0 and stats["waiting"] == 0
+    assert stats["rate_limited_responses"] == 1
+
+
+def test_settle_and_headers_correct_the_budget():
+    limiter = RateLimiter("m", rpm=500, tpm=10_000)
+    asyncio.run(limiter.acquire(1000))
+    limiter.settle(estimated=1000, actual=1500)
+    assert limiter.tokens.level == pytest.approx(8500, abs=5)
+    limiter.observe_headers({"x-ratelimit-limit-requests": "100", "x-ratelimit-remaining-tokens": "2000"})
+    assert limiter.requests.capacity == 100 and limiter.requests.level <= 100
+    assert limiter.tokens.level == pytest.approx(2000, abs=5)
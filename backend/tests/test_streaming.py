@@ -0,0 +1,40 @@
+"""
+Unit tests for incremental structured-output parsing (backend/streaming.py)
+"""
+import json
+import random
+
+import pytest
+
+from backend.streaming import ItemStreamParser
+
+DOC = {
+    "items": [
+        {"name": f"food {i} \"quoted\" [x] {{y}}", "grams": i, "nested": {"a": [1, {"b": "}"}]}}
+        for i in range(20)
+    ],
+    "totals": {"kcal": 1},
+    "warnings": ["items"],
+}
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_items_arrive_whole_for_any_chunking(seed):
+    rng = random.Random(seed)
+    text = json.dumps(DOC)
+    parser, items, pos = ItemStreamParser(), [], 0
+    while pos < len(text):
+        size = rng.randint(1, 40)
+        items += parser.feed(text[pos:pos + size])
+        pos += size
+    assert items == DOC["items"]
+    assert parser.items_done
+    assert parser.result() == DOC
+
+
+def test_buffer_only_holds_the_open_item():
+    text = json.dumps(DOC)
+    parser = ItemStreamParser()
+    for ch in text:
+        parser.feed(ch)
+        assert len(parser._buf) <= max(len(json.dumps(item)) for item in DOC["items"]) + 1
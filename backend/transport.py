@@ -0,0 +1,97 @@
+"""
+Shared, tunable HTTP transport for upstream LLM traffic
+"""
+import os
+import asyncio
+import importlib.util
+from typing import Any, Dict
+
+from openai import DefaultAsyncHttpxClient, DEFAULT_CONNECTION_LIMITS, Timeout
+
+from .logs import get_logger
+
+log = get_logger("transport")
+
+# Limits class of whichever httpx flavour the installed openai SDK is built on
+Limits = type(DEFAULT_CONNECTION_LIMITS)
+
+# -------- Config --------
+MAX_CONNECTIONS = int(os.getenv("HEAL_HTTP_MAX_CONNECTIONS", "200"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HEAL_HTTP_MAX_KEEPALIVE", "50"))
+KEEPALIVE_EXPIRY_S = float(os.getenv("HEAL_HTTP_KEEPALIVE_EXPIRY", "90"))
+CONNECT_TIMEOUT_S = float(os.getenv("HEAL_HTTP_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT_S = float(os.getenv("HEAL_HTTP_READ_TIMEOUT", "60"))
+WRITE_TIMEOUT_S = float(os.getenv("HEAL_HTTP_WRITE_TIMEOUT", "30"))
+POOL_TIMEOUT_S = float(os.getenv("HEAL_HTTP_POOL_TIMEOUT", "10"))
+# HTTP/2 multiplexes many in-flight calls over one TLS connection; off by
+# default since it needs `h2`, which requirements.txt does not pull in
+HTTP2_REQUESTED = os.getenv("HEAL_HTTP2", "0") != "0"
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+WARMUP_CONNECTIONS = int(os.getenv("HEAL_HTTP_WARMUP_CONNECTIONS", "2"))
+
+
+def build_http_client() -> DefaultAsyncHttpxClient:
+    """One pooled client per worker, shared by every upstream call"""
+    http2 = HTTP2_REQUESTED and HTTP2_AVAILABLE
+    if HTTP2_REQUESTED and not HTTP2_AVAILABLE:
+        log.warning("HEAL_HTTP2 requested but the `h2` package is not installed; using HTTP/1.1")
+    return DefaultAsyncHttpxClient(
+        http2=http2,
+        limits=Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY_S,
+        ),
+        timeout=Timeout(
+            connect=CONNECT_TIMEOUT_S,
+            read=READ_TIMEOUT_S,
+            write=WRITE_TIMEOUT_S,
+            pool=POOL_TIMEOUT_S,
+        ),
+    )
+
+
+async def warm_up(http_client: DefaultAsyncHttpxClient, base_url: str, headers: Dict[str, str]) -> int:
+    """
+    Open pooled connections before traffic arrives so the first requests
+    don't pay DNS + TCP + TLS setup. Returns how many probes got a response.
+    """
+    if WARMUP_CONNECTIONS <= 0:
+        return 0
+    url = str(base_url).rstrip("/") + "/models"
+
+    async def probe() -> bool:
+        try:
+            # Any HTTP response means the connection is up and back in the pool
+            await http_client.get(url, headers=headers, timeout=CONNECT_TIMEOUT_S + 5)
+            return True
+        except Exception as e:
+            log.warning("upstream warm-up failed", extra={"error": f"{type(e).__name__}: {e}"})
+            return False
+
+    results = await asyncio.gather(*[probe() for _ in range(WARMUP_CONNECTIONS)])
+    return sum(results)
+
+
+def pool_stats(http_client: DefaultAsyncHttpxClient) -> Dict[str, Any]:
+    """Connection-pool utilization (reads httpcore pool state; best effort)"""
+    stats: Dict[str, Any] = {
+        "http2_enabled": HTTP2_REQUESTED and HTTP2_AVAILABLE,
+        "max_connections": MAX_CONNECTIONS,
+        "max_keepalive_connections": MAX_KEEPALIVE_CONNECTIONS,
+        "keepalive_expiry_s": KEEPALIVE_EXPIRY_S,
+    }
+    pool = getattr(getattr(http_client, "_transport", None), "_pool", None)
+    if pool is None:
+        return stats
+    connections = list(pool.connections)
+    idle = sum(1 for c in connections if c.is_idle())
+    stats.update({
+        "connections": len(connections),
+        "idle": idle,
+        "active": len(connections) - idle,
+        "http2_connections": sum(1 for c in connections if "HTTP/2" in c.info()),
+        "requests_in_pool": len(getattr(pool, "_requests", [])),
+        "utilization": round((len(connections) - idle) / MAX_CONNECTIONS, 4) if MAX_CONNECTIONS else 0.0,
+    })
+    return stats
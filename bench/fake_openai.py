@@ -0,0 +1,190 @@
+"""
+Local stand-in for the OpenAI chat.completions API, for load tests.
+
+Answers POST /v1/chat/completions with schema-valid JSON for the requested
+response_format (plain or streamed), after a latency drawn from a
+configurable distribution, failing a configurable share of calls with 429
+or 500. Vision calls (any image_url part) and text calls get separate
+latency distributions.
+
+    uvicorn bench.fake_openai:app --port 9100
+
+Latency specs: `fixed:0.5` (or just `0.5`), `uniform:0.2,1.0`,
+`lognormal:<median>,<sigma>` (seconds).
+"""
+import os
+import json
+import math
+import time
+import random
+import asyncio
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from backend.providers import fake_instance
+
+# -------- Config --------
+VISION_LATENCY = os.getenv("HEAL_BENCH_VISION_LATENCY", "lognormal:2.0,0.35")
+TEXT_LATENCY = os.getenv("HEAL_BENCH_TEXT_LATENCY", "lognormal:0.8,0.35")
+# Share of calls answered 500 / 429 (with Retry-After)
+ERROR_RATE = float(os.getenv("HEAL_BENCH_ERROR_RATE", "0"))
+RATE_LIMITED_RATE = float(os.getenv("HEAL_BENCH_429_RATE", "0"))
+RETRY_AFTER_S = float(os.getenv("HEAL_BENCH_RETRY_AFTER", "1"))
+# Limits advertised in x-ratelimit-* headers (a high usage tier by default)
+RPM_LIMIT = int(os.getenv("HEAL_BENCH_RPM", "10000"))
+TPM_LIMIT = int(os.getenv("HEAL_BENCH_TPM", "2000000"))
+SEED = os.getenv("HEAL_BENCH_SEED")
+# Tokens billed per image part (a 768px image at high detail)
+IMAGE_TOKENS = 765
+STREAM_CHUNK_CHARS = 24
+
+rng = random.Random(int(SEED) if SEED else None)
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """`fixed:s`, `uniform:lo,hi` or `lognormal:median,sigma` → sampler (seconds)"""
+    kind, _, args = spec.partition(":")
+    if not args:
+        kind, args = "fixed", kind
+    values = [float(v) for v in args.split(",")]
+    if kind == "fixed":
+        return lambda: values[0]
+    if kind == "uniform":
+        return lambda: rng.uniform(values[0], values[1])
+    if kind == "lognormal":
+        mu = math.log(values[0])
+        return lambda: rng.lognormvariate(mu, values[1])
+    raise ValueError(f"Unknown latency distribution {spec!r}")
+
+
+vision_latency = parse_latency(VISION_LATENCY)
+text_latency = parse_latency(TEXT_LATENCY)
+
+
+class _Usage:
+    """Requests and tokens over the last minute, for x-ratelimit-remaining-*"""
+
+    def __init__(self):
+        self._events: Deque[Tuple[float, int]] = deque()
+        self.tokens = 0
+
+    def add(self, tokens: int) -> None:
+        self._events.append((time.monotonic(), tokens))
+        self.tokens += tokens
+
+    def window(self) -> Tuple[int, int]:
+        cutoff = time.monotonic() - 60
+        while self._events and self._events[0][0] < cutoff:
+            self.tokens -= self._events.popleft()[1]
+        return len(self._events), self.tokens
+
+
+usage_window = _Usage()
+counters = {"calls": 0, "vision": 0, "text": 0, "streamed": 0, "errors": 0, "rate_limited": 0}
+
+app = FastAPI(title="Fake OpenAI")
+
+
+def _is_vision(messages: List[Dict[str, Any]]) -> bool:
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list) and any(part.get("type") == "image_url" for part in content):
+            return True
+    return False
+
+
+def _prompt_tokens(messages: List[Dict[str, Any]]) -> int:
+    tokens = 0
+    for message in messages:
+        content = message.get("content")
+        parts = content if isinstance(content, list) else [{"type": "text", "text": content or ""}]
+        for part in parts:
+            tokens += IMAGE_TOKENS if part.get("type") == "image_url" else len(part.get("text", "")) // 4
+    return tokens
+
+
+def _ratelimit_headers() -> Dict[str, str]:
+    requests, tokens = usage_window.window()
+    return {
+        "x-ratelimit-limit-requests": str(RPM_LIMIT),
+        "x-ratelimit-remaining-requests": str(max(0, RPM_LIMIT - requests)),
+        "x-ratelimit-limit-tokens": str(TPM_LIMIT),
+        "x-ratelimit-remaining-tokens": str(max(0, TPM_LIMIT - tokens)),
+    }
+
+
+@app.get("/v1/models")
+async def models():
+    return {"object": "list", "data": [{"id": "gpt-4o", "object": "model"}, {"id": "gpt-4o-mini", "object": "model"}]}
+
+
+@app.get("/stats")
+async def stats():
+    return counters
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    messages = body.get("messages", [])
+    vision = _is_vision(messages)
+    counters["calls"] += 1
+    counters["vision" if vision else "text"] += 1
+    latency = vision_latency() if vision else text_latency()
+
+    roll = rng.random()
+    if roll < RATE_LIMITED_RATE:
+        counters["rate_limited"] += 1
+        await asyncio.sleep(min(latency, 0.05))
+        return JSONResponse(
+            {"error": {"message": "Rate limit reached (fake)", "type": "requests", "code": "rate_limit_exceeded"}},
+            status_code=429,
+            headers={**_ratelimit_headers(), "retry-after": str(RETRY_AFTER_S)},
+        )
+    if roll < RATE_LIMITED_RATE + ERROR_RATE:
+        counters["errors"] += 1
+        await asyncio.sleep(latency)
+        return JSONResponse({"error": {"message": "The server had an error (fake)", "type": "server_error"}}, status_code=500)
+
+    schema = (body.get("response_format") or {}).get("json_schema", {}).get("schema", {"type": "object"})
+    model = body.get("model", "gpt-4o")
+    content = json.dumps(fake_instance(schema, model=model))
+    prompt_tokens = _prompt_tokens(messages)
+    completion_tokens = len(content) // 4
+    usage_window.add(prompt_tokens + completion_tokens)
+    usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+    base = {"id": f"chatcmpl-fake-{counters['calls']}", "created": int(time.time()), "model": model}
+    headers = _ratelimit_headers()
+
+    if body.get("stream"):
+        counters["streamed"] += 1
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+        pieces = [content[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(content), STREAM_CHUNK_CHARS)]
+        # Time to first token, then the rest spread across the chunks
+        await asyncio.sleep(latency * 0.3)
+        per_chunk = latency * 0.7 / max(1, len(pieces))
+
+        async def events():
+            for piece in pieces:
+                chunk = {**base, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(per_chunk)
+            if include_usage:
+                yield f"data: {json.dumps({**base, 'object': 'chat.completion.chunk', 'choices': [], 'usage': usage})}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+    await asyncio.sleep(latency)
+    return JSONResponse(
+        {
+            **base,
+            "object": "chat.completion",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage,
+        },
+        headers=headers,
+    )
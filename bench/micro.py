@@ -0,0 +1,285 @@
+"""
+Micro-benchmarks of the server-side hot path, reproducible without network:
+image preprocessing, food-table macros and name search, completion parsing,
+incremental stream parsing, response serialization, and whole endpoints served in-process with the
+LLM replayed from a cassette at zero latency.
+
+    python -m bench.micro                         # run, compare with bench/micro_baseline.json
+    python -m bench.micro --save-baseline
+    HEAL_LLM_PROVIDER=fake python -m bench.micro --record   # (re)record bench/cassettes/llm.jsonl.gz
+
+Record against OpenAI (OPENAI_API_KEY set, default provider) for realistic
+payloads; the bundled cassette was recorded from the fake provider.
+"""
+import os
+import sys
+import json
+import gzip
+import time
+import asyncio
+import argparse
+import statistics
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_CASSETTE = ROOT / "bench" / "cassettes" / "llm.jsonl.gz"
+DEFAULT_BASELINE = ROOT / "bench" / "micro_baseline.json"
+DEFAULT_OUT = ROOT / "bench" / "results" / "micro.json"
+# Slack below which a slower median is noise, not a regression
+ABSOLUTE_SLACK_US = 20.0
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--record", action="store_true", help="record the cassette from the configured provider instead of benchmarking")
+    parser.add_argument("--cassette", type=Path, default=DEFAULT_CASSETTE)
+    parser.add_argument("--only", default="", help="comma-separated name prefixes to run")
+    parser.add_argument("--repeat", type=int, default=7, help="timed rounds per benchmark (median is reported)")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds each round runs for, at least")
+    parser.add_argument("--out", type=Path, default=DEFAULT_OUT)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="relative slack before a slower median counts as a regression")
+    return parser.parse_args(argv)
+
+
+def configure_env(args: argparse.Namespace) -> None:
+    """Must run before anything from backend is imported (config is read at import)"""
+    os.environ["HEAL_CASSETTE_MODE"] = "record" if args.record else "replay"
+    os.environ["HEAL_CASSETTE_PATH"] = str(args.cassette)
+    os.environ.setdefault("HEAL_CASSETTE_LATENCY", "0")
+    if not args.record:
+        # Replay needs no key; the provider behind the cassette is never called
+        os.environ.setdefault("OPENAI_API_KEY", "sk-replay")
+    os.environ.setdefault("HEAL_LOG_LEVEL", "WARNING")
+    # Every endpoint request must reach the (replayed) model
+    for name in ("HEAL_ESTIMATE_CACHE", "HEAL_SINGLEFLIGHT", "HEAL_CACHE_TTL_COMPARE", "HEAL_CACHE_TTL_SUGGESTIONS",
+                 "HEAL_CACHE_TTL_COPY", "HEAL_CACHE_TTL_DAILY_SUMMARY", "HEAL_HEDGE", "HEAL_LOOP_LAG_INTERVAL"):
+        os.environ[name] = "0"
+
+
+# -------- Timing --------
+def _calibrate(run_once: Callable[[], float], min_time: float) -> int:
+    number = 1
+    while True:
+        elapsed = sum(run_once() for _ in range(number))
+        if elapsed >= min_time or number >= 1 << 20:
+            return number
+        number *= 2 if elapsed == 0 else max(2, min(10, int(min_time / elapsed) + 1))
+
+
+def measure(fn: Callable[[], Any], repeat: int, min_time: float) -> Dict[str, Any]:
+    """Per-call seconds: calibrate the inner loop to ~min_time, then `repeat` rounds"""
+    def once() -> float:
+        started = time.perf_counter()
+        fn()
+        return time.perf_counter() - started
+
+    number = _calibrate(once, min_time)
+    rounds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        rounds.append((time.perf_counter() - started) / number)
+    return _summary(rounds, number)
+
+
+async def measure_async(fn: Callable[[], Awaitable[Any]], repeat: int, min_time: float) -> Dict[str, Any]:
+    async def rounds_of(number: int) -> float:
+        started = time.perf_counter()
+        for _ in range(number):
+            await fn()
+        return time.perf_counter() - started
+
+    number = 1
+    while (elapsed := await rounds_of(number)) < min_time and number < 1 << 16:
+        number *= max(2, min(10, int(min_time / max(elapsed, 1e-9)) + 1))
+    rounds = [await rounds_of(number) / number for _ in range(repeat)]
+    return _summary(rounds, number)
+
+
+def _summary(rounds: List[float], number: int) -> Dict[str, Any]:
+    return {
+        "median_us": round(statistics.median(rounds) * 1e6, 2),
+        "min_us": round(min(rounds) * 1e6, 2),
+        "stdev_us": round(statistics.stdev(rounds) * 1e6, 2) if len(rounds) > 1 else 0.0,
+        "loops": number,
+        "rounds": len(rounds),
+    }
+
+
+# -------- Benchmarks --------
+def load_cassette(path: Path) -> List[Dict[str, Any]]:
+    if not path.exists():
+        sys.exit(f"No cassette at {path}; record one with: python -m bench.micro --record")
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def local_benchmarks(entries: List[Dict[str, Any]]) -> Dict[str, Callable[[], Any]]:
+    from openai.types.chat import ChatCompletion
+    from fastapi.responses import JSONResponse
+    from backend.images import preprocess_image
+    from backend.streaming import ItemStreamParser, sse_event, ndjson_event
+    from backend.nutrition import estimate_from_items, suggest_meal
+    from backend.foods import food_table
+    from backend.cache import SimilarityCache
+    from bench.run import IMAGES
+
+    benches: Dict[str, Callable[[], Any]] = {}
+    for name, raw in IMAGES.items():
+        benches[f"preprocess/{name}"] = lambda raw=raw: preprocess_image(raw)
+
+    plate = [
+        {"name": "white rice", "category": "grain", "cooking_method": "steamed", "grams": 180, "confidence": 0.9},
+        {"name": "chicken thigh", "category": "protein", "cooking_method": "deep_fried", "grams": 120, "confidence": 0.7},
+        {"name": "bok choy", "category": "vegetable", "cooking_method": "stir_fried", "grams": 80, "confidence": 0.8},
+        {"name": "sweetened iced tea", "category": "beverage", "cooking_method": "none", "grams": 500, "confidence": 0.9},
+        {"name": "quinoa", "category": "grain", "cooking_method": "boiled", "grams": 100, "confidence": 0.5},
+    ]
+    benches["nutrition/estimate_from_items"] = lambda: estimate_from_items(plate)
+    targets = {"kcal": 600, "protein_g": 30, "carb_g": 60, "fat_g": 20}
+    benches["nutrition/suggest_meal"] = lambda: suggest_meal(estimate_from_items(plate), targets, targets)
+    similar = SimilarityCache(maxsize=1024, tolerance=1)
+    for k in range(200):
+        similar.store(k % 20, SimilarityCache.quantize([600, 30, 20, 60, 630 + k, 22, 35, 56, 900, 50, 30, 100], [50, 5, 5, 5] * 3), k)
+    benches["cache/similarity_lookup"] = lambda: similar.lookup(7, SimilarityCache.quantize([610, 31, 20, 61, 700, 23, 34, 57, 880, 50, 30, 98], [50, 5, 5, 5] * 3))
+    benches["foods/search"] = lambda: food_table.search("chiken brest", limit=10)
+
+    completions = {e["schema"]: e["response"] for e in entries if not e["stream"]}
+    for schema, response in sorted(completions.items()):
+        def parse(response=response):
+            completion = ChatCompletion.model_validate(response)
+            return json.loads(completion.choices[0].message.content)
+        benches[f"parse_completion/{schema}"] = parse
+
+    streamed = next((e for e in entries if e["stream"]), None)
+    if streamed is not None:
+        deltas = [
+            c["choices"][0]["delta"].get("content") or ""
+            for c in streamed["chunks"] if c.get("choices")
+        ]
+
+        def parse_stream():
+            parser = ItemStreamParser()
+            for delta in deltas:
+                parser.feed(delta)
+            return parser.result()
+        benches["parse_stream/food_estimate"] = parse_stream
+
+        estimate = parse_stream()
+        benches["serialize/json_response"] = lambda: JSONResponse(estimate).body
+        benches["serialize/sse"] = lambda: [sse_event("item", item) for item in estimate["items"]] + [sse_event("estimate", estimate)]
+        benches["serialize/ndjson"] = lambda: [ndjson_event("item", item) for item in estimate["items"]] + [ndjson_event("estimate", estimate)]
+    return benches
+
+
+def endpoint_requests() -> Dict[str, Callable[[Any], Awaitable[Any]]]:
+    """One fixed request per bench.run scenario, so every replay hits the same cassette entry"""
+    from bench.run import SCENARIOS
+
+    def call(scenario):
+        async def send(client):
+            resp = await client.request(scenario.method, scenario.path, headers={"Cache-Control": "no-cache"}, **scenario.build(0))
+            if resp.status_code >= 400:
+                raise RuntimeError(f"{scenario.name}: {resp.status_code} {resp.text[:300]}")
+            return resp
+        return send
+
+    return {f"endpoint/{s.name}": call(s) for s in SCENARIOS}
+
+
+async def run_endpoints(wanted: Callable[[str], bool], args: argparse.Namespace) -> Dict[str, Dict[str, Any]]:
+    import httpx
+    from backend.main import app
+
+    results: Dict[str, Dict[str, Any]] = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60.0) as client:
+        for name, send in endpoint_requests().items():
+            if not wanted(name):
+                continue
+            if args.record:
+                await send(client)
+                print(f"recorded {name}", flush=True)
+                continue
+            await send(client)
+            results[name] = await measure_async(lambda: send(client), args.repeat, args.min_time)
+            print_row(name, results[name])
+    return results
+
+
+def print_row(name: str, entry: Dict[str, Any]) -> None:
+    print(f"{name:<44} {entry['median_us']:>12.1f} us  (min {entry['min_us']:.1f}, ±{entry['stdev_us']:.1f}, {entry['loops']} loops)", flush=True)
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    regressions = []
+    for name, entry in current["benchmarks"].items():
+        base = baseline.get("benchmarks", {}).get(name)
+        if base and entry["median_us"] > base["median_us"] * (1 + tolerance) + ABSOLUTE_SLACK_US:
+            regressions.append(f"{name}: {base['median_us']:g} -> {entry['median_us']:g} us")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    configure_env(args)
+    prefixes = [p for p in args.only.split(",") if p]
+
+    def wanted(name: str) -> bool:
+        return not prefixes or any(name.startswith(p) for p in prefixes)
+
+    if args.record:
+        if args.cassette.exists():
+            args.cassette.unlink()
+        asyncio.run(run_endpoints(lambda name: True, args))
+        print(f"cassette written to {args.cassette}")
+        return 0
+
+    import platform
+    from backend.cassette import CASSETTE_LATENCY
+
+    results: Dict[str, Dict[str, Any]] = {}
+    for name, fn in local_benchmarks(load_cassette(args.cassette)).items():
+        if wanted(name):
+            results[name] = measure(fn, args.repeat, args.min_time)
+            print_row(name, results[name])
+    results.update(asyncio.run(run_endpoints(wanted, args)))
+
+    from backend.llm import upstream_pool_stats
+    cassette = next((p["cassette"] for p in upstream_pool_stats().values() if "cassette" in p), {})
+    if cassette.get("loose_hits"):
+        print(f"note: {cassette['loose_hits']} replays matched without image bytes (different JPEG encoder than the recording)")
+
+    report = {
+        "version": 1,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpu_count": os.cpu_count()},
+        "config": {"cassette": args.cassette.name, "replay_latency": CASSETTE_LATENCY, "repeat": args.repeat},
+        "benchmarks": results,
+    }
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+    args.out.write_text(json.dumps(report, indent=2) + "\n")
+    print(f"results written to {args.out}")
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2) + "\n")
+        print(f"baseline saved to {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        print("no baseline to compare against (run with --save-baseline)")
+        return 0
+    regressions = compare(report, json.loads(args.baseline.read_text()), args.tolerance)
+    if regressions:
+        print(f"{len(regressions)} regression(s) against {args.baseline}:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print(f"no regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,518 @@
+"""
+Load test: start the app (N uvicorn workers) against a local fake OpenAI
+server (bench/fake_openai.py) and drive every endpoint at a fixed
+concurrency. Reports throughput, p50/p95/p99 latency, error rate, and
+event-loop lag and memory per worker; results are written as JSON and
+compared against a saved baseline so regressions show up.
+
+    python -m bench.run                           # run, compare with bench/baseline.json
+    python -m bench.run --save-baseline           # run and replace the baseline
+    python -m bench.run --scenarios estimate_food_jpg,llm_compare --concurrency 32
+    python -m bench.run --vision-latency fixed:0 --text-latency fixed:0   # app overhead only
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import platform
+import subprocess
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_BASELINE = ROOT / "bench" / "baseline.json"
+DEFAULT_OUT = ROOT / "bench" / "results" / "latest.json"
+IMAGES = {name: (ROOT / name).read_bytes() for name in ("food.jpg", "a_whole_pig.png", "Binghongcha.png")}
+RESULTS_VERSION = 1
+
+# (metric, direction that counts as worse, absolute slack on top of --tolerance)
+REGRESSION_CHECKS = (
+    ("latency_ms.p95", "higher", 5.0),
+    ("latency_ms.p99", "higher", 5.0),
+    ("worst_loop_lag_p99_ms", "higher", 5.0),
+    ("worst_max_rss_mb", "higher", 10.0),
+    ("throughput_rps", "lower", 0.5),
+)
+ERROR_RATE_SLACK = 0.01
+
+
+# -------- Request payloads --------
+PROFILE = {
+    "height_cm": 170,
+    "weight_kg": 70,
+    "age": 45,
+    "sex": "male",
+    "exercise_level": "moderate",
+    "diabetes_type": "T2D",
+    "meals_per_day": 3,
+}
+PER_MEAL = {"protein_g": 35, "fat_g": 22, "carb_g": 60, "kcal": 580}
+DAILY = {"protein_g": 105, "fat_g": 66, "carb_g": 180, "kcal": 1740}
+ESTIMATE = {
+    "items": [
+        {
+            "name": "white rice",
+            "display_name": "White rice",
+            "category": "grain",
+            "cooking_method": "boiled",
+            "grams": 180,
+            "kcal": 234,
+            "nutrition_per_100g": {"kcal": 130, "protein_g": 2.7, "fat_g": 0.3, "carb_g": 28.2},
+            "confidence": 0.8,
+            "notes": [],
+        },
+        {
+            "name": "braised pork",
+            "display_name": "Braised pork",
+            "category": "meat",
+            "cooking_method": "braised",
+            "grams": 120,
+            "kcal": 396,
+            "nutrition_per_100g": {"kcal": 330, "protein_g": 14.0, "fat_g": 29.0, "carb_g": 4.0},
+            "confidence": 0.7,
+            "notes": [],
+        },
+    ],
+    "totals": {"kcal": 630, "protein_g": 21.7, "fat_g": 35.3, "carb_g": 55.6},
+    "calories_range": {"low": 540, "high": 720},
+    "assumptions": [],
+    "warnings": [],
+    "model_info": "bench",
+}
+
+
+def _jitter(macros: Dict[str, float], i: int) -> Dict[str, float]:
+    # Distinct payloads per request, so nothing downstream can coalesce them
+    return {k: round(v + (i % 97) * 0.1, 1) for k, v in macros.items()}
+
+
+def _image(name: str) -> Callable[[int], Dict[str, Any]]:
+    content_type = "image/jpeg" if name.endswith(".jpg") else "image/png"
+    return lambda i: {"files": {"image": (name, IMAGES[name], content_type)}}
+
+
+def _analyze(i: int) -> Dict[str, Any]:
+    context = {
+        "per_meal_targets": PER_MEAL,
+        "daily_targets": DAILY,
+        "daily_consumed_so_far": _jitter({"protein_g": 30, "fat_g": 20, "carb_g": 50, "kcal": 500}, i),
+        "meal_index": 2,
+        "meals_per_day": 3,
+        "meal_name": "Lunch",
+        "diabetes_type": "T2D",
+    }
+    return {"files": {"image": ("food.jpg", IMAGES["food.jpg"], "image/jpeg")}, "data": {"context": json.dumps(context)}}
+
+
+def _compare(i: int) -> Dict[str, Any]:
+    return {"json": {
+        "per_meal_targets": PER_MEAL,
+        "daily_targets": DAILY,
+        "daily_consumed_so_far": {"protein_g": 30, "fat_g": 20, "carb_g": 50, "kcal": 500},
+        "current_meal": _jitter(ESTIMATE["totals"], i),
+        "meal_index": 2,
+        "meals_per_day": 3,
+        "meal_name": "Lunch",
+        "diabetes_type": "T2D",
+    }}
+
+
+def _suggestions(i: int) -> Dict[str, Any]:
+    return {"json": {
+        "estimate": {**ESTIMATE, "totals": _jitter(ESTIMATE["totals"], i)},
+        "per_meal_targets": PER_MEAL,
+        "daily_remaining": DAILY,
+        "meal_name": "Lunch",
+        "diabetes_type": "T2D",
+    }}
+
+
+def _copy(i: int) -> Dict[str, Any]:
+    return {"json": {"type": "photo_reminder", "user_name": f"user{i}", "meal_name": "Lunch", "tone": "friendly"}}
+
+
+def _daily_summary(i: int) -> Dict[str, Any]:
+    totals = _jitter(ESTIMATE["totals"], i)
+    return {"json": {
+        "date": "2025-10-26",
+        "diabetes_type": "T2D",
+        "meals": [{"timestamp": "2025-10-26T12:00:00", "meal_name": "Lunch", "macros": totals, "estimate": ESTIMATE}],
+        "daily_targets": DAILY,
+        "total_consumed": totals,
+    }}
+
+
+def _budget_batch(i: int) -> Dict[str, Any]:
+    return {"json": [{**PROFILE, "weight_kg": 50 + (i + n) % 60} for n in range(100)]}
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    path: str
+    build: Callable[[int], Dict[str, Any]] = lambda i: {}
+
+
+SCENARIOS = [
+    Scenario("health", "GET", "/health"),
+    Scenario("budget", "POST", "/budget", lambda i: {"json": {**PROFILE, "age": 20 + i % 60}}),
+    Scenario("budget_batch", "POST", "/budget/batch", _budget_batch),
+    Scenario("estimate_food_jpg", "POST", "/estimate", _image("food.jpg")),
+    Scenario("estimate_a_whole_pig_png", "POST", "/estimate", _image("a_whole_pig.png")),
+    Scenario("estimate_binghongcha_png", "POST", "/estimate", _image("Binghongcha.png")),
+    Scenario("estimate_stream", "POST", "/estimate/stream", _image("food.jpg")),
+    Scenario("meal_analyze", "POST", "/meal/analyze", _analyze),
+    Scenario("llm_compare", "POST", "/llm/compare", _compare),
+    Scenario("llm_suggestions", "POST", "/llm/suggestions", _suggestions),
+    Scenario("llm_copy", "POST", "/llm/copy", _copy),
+    Scenario("llm_daily_summary", "POST", "/llm/daily_summary", _daily_summary),
+]
+
+
+# -------- Processes --------
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(app: str, port: int, env: Dict[str, str], workers: int = 1) -> subprocess.Popen:
+    cmd = [
+        sys.executable, "-m", "uvicorn", app,
+        "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(workers), "--log-level", "warning", "--no-access-log",
+    ]
+    return subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL)
+
+
+def wait_ready(url: str, proc: subprocess.Popen, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{url} exited with status {proc.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} not ready after {timeout:.0f}s")
+
+
+def stop(proc: subprocess.Popen) -> None:
+    proc.terminate()
+    try:
+        proc.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+# -------- Measurement --------
+def percentile(ordered: List[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+@dataclass
+class WorkerSamples:
+    """Worst values seen from one worker process during a scenario"""
+
+    rss_mb: float = 0.0
+    max_rss_mb: float = 0.0
+    loop_lag_p99_ms: float = 0.0
+    loop_lag_max_ms: float = 0.0
+    polls: int = 0
+
+    def add(self, stats: Dict[str, Any]) -> None:
+        lag = stats["event_loop_lag"]
+        self.rss_mb = max(self.rss_mb, stats["rss_bytes"] / 2**20)
+        self.max_rss_mb = max(self.max_rss_mb, stats["max_rss_bytes"] / 2**20)
+        self.loop_lag_p99_ms = max(self.loop_lag_p99_ms, lag["recent_p99_ms"])
+        self.loop_lag_max_ms = max(self.loop_lag_max_ms, lag["recent_max_ms"])
+        self.polls += 1
+
+
+async def poll_workers(base_url: str, workers: Dict[int, WorkerSamples], stop_event: asyncio.Event, fanout: int) -> None:
+    """
+    Poll /runtime/stats on fresh connections so the kernel spreads the polls
+    across worker processes; keep the worst value per pid.
+    """
+    limits = httpx.Limits(max_keepalive_connections=0)
+    started = time.monotonic()
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=5.0) as client:
+        while True:
+            # Loop-lag percentiles over this scenario only
+            params = {"window": round(time.monotonic() - started, 3)}
+            responses = await asyncio.gather(
+                *[client.get("/runtime/stats", params=params) for _ in range(fanout)], return_exceptions=True
+            )
+            for resp in responses:
+                if isinstance(resp, httpx.Response) and resp.status_code == 200:
+                    stats = resp.json()
+                    workers.setdefault(stats["pid"], WorkerSamples()).add(stats)
+            if stop_event.is_set():
+                return
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=0.25)
+            except asyncio.TimeoutError:
+                pass
+
+
+@dataclass
+class ScenarioRun:
+    latencies: List[float] = field(default_factory=list)
+    statuses: Dict[str, int] = field(default_factory=dict)
+    elapsed: float = 0.0
+
+
+async def drive(client: httpx.AsyncClient, scenario: Scenario, requests: int, concurrency: int, headers: Dict[str, str]) -> ScenarioRun:
+    """Closed loop: `concurrency` workers issue `requests` calls back to back"""
+    run = ScenarioRun()
+    next_index = iter(range(requests))
+
+    async def worker() -> None:
+        for i in next_index:
+            started = time.perf_counter()
+            try:
+                async with client.stream(scenario.method, scenario.path, headers=headers, **scenario.build(i)) as resp:
+                    # Read the whole body (streamed endpoints included)
+                    async for _ in resp.aiter_raw():
+                        pass
+                status = str(resp.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            run.latencies.append(time.perf_counter() - started)
+            run.statuses[status] = run.statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    run.elapsed = time.perf_counter() - started
+    return run
+
+
+def summarize(scenario: Scenario, run: ScenarioRun, concurrency: int, workers: Dict[int, WorkerSamples]) -> Dict[str, Any]:
+    ordered = sorted(run.latencies)
+    total = len(ordered)
+    ok = sum(count for status, count in run.statuses.items() if status.isdigit() and int(status) < 400)
+    per_worker = [
+        {
+            "pid": pid,
+            "rss_mb": round(w.rss_mb, 1),
+            "max_rss_mb": round(w.max_rss_mb, 1),
+            "loop_lag_p99_ms": round(w.loop_lag_p99_ms, 2),
+            "loop_lag_max_ms": round(w.loop_lag_max_ms, 2),
+            "polls": w.polls,
+        }
+        for pid, w in sorted(workers.items())
+    ]
+    return {
+        "method": scenario.method,
+        "path": scenario.path,
+        "requests": total,
+        "concurrency": concurrency,
+        "duration_s": round(run.elapsed, 3),
+        "throughput_rps": round(total / run.elapsed, 2) if run.elapsed else 0.0,
+        "error_rate": round(1 - ok / total, 4) if total else 0.0,
+        "status": dict(sorted(run.statuses.items())),
+        "latency_ms": {
+            "mean": round(sum(ordered) / total * 1000, 2) if total else 0.0,
+            "p50": round(percentile(ordered, 0.50) * 1000, 2),
+            "p95": round(percentile(ordered, 0.95) * 1000, 2),
+            "p99": round(percentile(ordered, 0.99) * 1000, 2),
+            "max": round(ordered[-1] * 1000, 2) if ordered else 0.0,
+        },
+        "workers": per_worker,
+        "worst_loop_lag_p99_ms": max((w["loop_lag_p99_ms"] for w in per_worker), default=0.0),
+        "worst_max_rss_mb": max((w["max_rss_mb"] for w in per_worker), default=0.0),
+    }
+
+
+async def run_all(base_url: str, scenarios: List[Scenario], args: argparse.Namespace) -> Dict[str, Any]:
+    headers = {} if args.cache else {"Cache-Control": "no-cache"}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    timeout = httpx.Timeout(120.0)
+    results: Dict[str, Any] = {}
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        for scenario in scenarios:
+            if args.warmup:
+                await drive(client, scenario, args.warmup, min(args.warmup, args.concurrency), headers)
+            workers: Dict[int, WorkerSamples] = {}
+            stop_event = asyncio.Event()
+            poller = asyncio.create_task(poll_workers(base_url, workers, stop_event, fanout=args.workers * 2))
+            run = await drive(client, scenario, args.requests, args.concurrency, headers)
+            stop_event.set()
+            await poller
+            results[scenario.name] = summarize(scenario, run, args.concurrency, workers)
+            print_row(scenario.name, results[scenario.name])
+    return results
+
+
+# -------- Baseline --------
+def _lookup(entry: Dict[str, Any], path: str) -> Optional[float]:
+    value: Any = entry
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return float(value)
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Human-readable regressions of `current` against `baseline` (scenarios in both)"""
+    regressions = []
+    for name, entry in current["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            continue
+        for path, worse, floor in REGRESSION_CHECKS:
+            now, before = _lookup(entry, path), _lookup(base, path)
+            if now is None or before is None:
+                continue
+            if worse == "higher" and now > before * (1 + tolerance) + floor:
+                regressions.append(f"{name}: {path} {before:g} -> {now:g}")
+            if worse == "lower" and now < before * (1 - tolerance) - floor:
+                regressions.append(f"{name}: {path} {before:g} -> {now:g}")
+        if entry["error_rate"] > base["error_rate"] + ERROR_RATE_SLACK:
+            regressions.append(f"{name}: error_rate {base['error_rate']:g} -> {entry['error_rate']:g}")
+    return regressions
+
+
+def print_row(name: str, entry: Dict[str, Any]) -> None:
+    lat = entry["latency_ms"]
+    print(
+        f"{name:<26} {entry['throughput_rps']:>8.1f} rps  "
+        f"p50 {lat['p50']:>8.1f}  p95 {lat['p95']:>8.1f}  p99 {lat['p99']:>8.1f} ms  "
+        f"err {entry['error_rate']:>6.1%}  lag p99 {entry['worst_loop_lag_p99_ms']:>6.1f} ms  "
+        f"rss {entry['worst_max_rss_mb']:>6.1f} MB  ({len(entry['workers'])} workers seen)",
+        flush=True,
+    )
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=2, help="uvicorn worker processes")
+    parser.add_argument("--concurrency", type=int, default=16, help="in-flight requests per scenario")
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=5, help="unmeasured requests per scenario")
+    parser.add_argument("--scenarios", default="", help="comma-separated subset (default: all)")
+    parser.add_argument("--vision-latency", default="lognormal:2.0,0.35", help="fake upstream latency for photo calls")
+    parser.add_argument("--text-latency", default="lognormal:0.8,0.35", help="fake upstream latency for text calls")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of upstream calls failing with 500")
+    parser.add_argument("--rate-limited-rate", type=float, default=0.0, help="share of upstream calls answered 429")
+    parser.add_argument("--seed", type=int, default=1, help="fake upstream RNG seed")
+    parser.add_argument("--cache", action="store_true", help="keep response caches and request coalescing on")
+    parser.add_argument("--out", type=Path, default=DEFAULT_OUT, help="where to write this run's results")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="write this run to --baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="relative slack before a change counts as a regression")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    wanted = {s for s in args.scenarios.split(",") if s}
+    unknown = wanted - {s.name for s in SCENARIOS}
+    if unknown:
+        print(f"Unknown scenarios: {', '.join(sorted(unknown))}", file=sys.stderr)
+        return 2
+    scenarios = [s for s in SCENARIOS if not wanted or s.name in wanted]
+
+    fake_port, app_port = free_port(), free_port()
+    fake_url, app_url = f"http://127.0.0.1:{fake_port}", f"http://127.0.0.1:{app_port}"
+    base_env = {**os.environ, "PYTHONPATH": str(ROOT), "HEAL_LOG_LEVEL": os.getenv("HEAL_LOG_LEVEL", "WARNING")}
+    fake_env = {
+        **base_env,
+        "HEAL_BENCH_VISION_LATENCY": args.vision_latency,
+        "HEAL_BENCH_TEXT_LATENCY": args.text_latency,
+        "HEAL_BENCH_ERROR_RATE": str(args.error_rate),
+        "HEAL_BENCH_429_RATE": str(args.rate_limited_rate),
+        "HEAL_BENCH_SEED": str(args.seed),
+    }
+    app_env = {
+        **base_env,
+        "OPENAI_API_KEY": "sk-bench",
+        "OPENAI_BASE_URL": f"{fake_url}/v1",
+        "HEAL_LLM_PROVIDER": "openai",
+        "HEAL_VISION_PROVIDER": "openai",
+        "HEAL_TEXT_PROVIDER": "openai",
+    }
+    if not args.cache:
+        app_env.update({
+            "HEAL_ESTIMATE_CACHE": "0",
+            "HEAL_SINGLEFLIGHT": "0",
+            "HEAL_CACHE_TTL_COMPARE": "0",
+            "HEAL_CACHE_TTL_SUGGESTIONS": "0",
+            "HEAL_CACHE_TTL_COPY": "0",
+            "HEAL_CACHE_TTL_DAILY_SUMMARY": "0",
+        })
+
+    fake = start_server("bench.fake_openai:app", fake_port, fake_env)
+    app = None
+    try:
+        wait_ready(f"{fake_url}/stats", fake)
+        app = start_server("backend.main:app", app_port, app_env, workers=args.workers)
+        wait_ready(f"{app_url}/health", app)
+        print(f"app {app_url} ({args.workers} workers) -> fake upstream {fake_url}", flush=True)
+        scenario_results = asyncio.run(run_all(app_url, scenarios, args))
+        upstream_calls = httpx.get(f"{fake_url}/stats").json()
+    finally:
+        if app is not None:
+            stop(app)
+        stop(fake)
+
+    results = {
+        "version": RESULTS_VERSION,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "config": {
+            "workers": args.workers,
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "vision_latency": args.vision_latency,
+            "text_latency": args.text_latency,
+            "error_rate": args.error_rate,
+            "rate_limited_rate": args.rate_limited_rate,
+            "seed": args.seed,
+            "cache": args.cache,
+        },
+        "upstream": upstream_calls,
+        "scenarios": scenario_results,
+    }
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+    args.out.write_text(json.dumps(results, indent=2) + "\n")
+    print(f"results written to {args.out}")
+
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"baseline saved to {args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        print("no baseline to compare against (run with --save-baseline)")
+        return 0
+    baseline = json.loads(args.baseline.read_text())
+    if baseline.get("config") != results["config"]:
+        print("note: baseline was recorded with a different configuration; comparing anyway")
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"{len(regressions)} regression(s) against {args.baseline}:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print(f"no regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
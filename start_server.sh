@@ -6,8 +6,8 @@ echo "🏥 Heal - Diabetes Nutrition Assistant"
 echo "======================================"
 echo ""
 
-# Check if OPENAI_API_KEY is set
-if [ -z "$OPENAI_API_KEY" ]; then
+# Check if OPENAI_API_KEY is set (not needed for the compatible/fake providers)
+if [ -z "$OPENAI_API_KEY" ] && [ "${HEAL_LLM_PROVIDER:-openai}" = "openai" ]; then
     echo "❌ ERROR: OPENAI_API_KEY environment variable not set"
     echo "   Please run: export OPENAI_API_KEY='your-api-key'"
     exit 1